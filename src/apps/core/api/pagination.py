@@ -0,0 +1,159 @@
+import base64
+import json
+
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    LimitOffsetPagination,
+    _positive_int
+)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over `ordering`, the last ordering field must
+    be unique (ie `id`). Page fetched with an indexed range condition
+    instead of OFFSET and no COUNT(*) executed.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = api_settings.PAGE_SIZE
+    max_limit = 100
+    ordering = ('-create_at', '-id')
+
+    def __init__(self, ordering=None) -> None:
+        if ordering:
+            self.ordering = ordering
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.limit_query_param],
+                strict=True,
+                cutoff=self.max_limit
+            )
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    def encode_cursor(self, values):
+        data = json.dumps(values, default=str).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii')
+
+    def get_ordering_field(self, queryset, name):
+        """Model field or annotation output field of an ordering name"""
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def decode_cursor(self, request, queryset):
+        """
+        Cursor values coerced to their ordering field, tampered
+        cursor is not found instead of failing at query time.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (TypeError, ValueError):
+            raise NotFound(_("Invalid cursor"))
+
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(_("Invalid cursor"))
+
+        try:
+            values = [
+                self.get_ordering_field(queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (FieldDoesNotExist, ValidationError, TypeError, ValueError):
+            raise NotFound(_("Invalid cursor"))
+
+        if None in values:
+            raise NotFound(_("Invalid cursor"))
+        return values
+
+    def get_keyset_q(self, values):
+        """
+        Row comparison of `ordering` against cursor values, ie
+        (a, b) < (x, y) become a < x OR (a = x AND b < y)
+        """
+        q = Q()
+        equals = dict()
+
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            q |= Q(**equals, **{'%s__%s' % (name, lookup): value})
+            equals[name] = value
+        return q
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request, queryset)
+        if cursor:
+            queryset = queryset.filter(self.get_keyset_q(cursor))
+
+        # fetch one more row to know next page exist
+        results = list(queryset[:self.limit + 1])
+        self.has_next = len(results) > self.limit
+        self.page = results[:self.limit]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        last = self.page[-1]
+        values = [getattr(last, field.lstrip('-')) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'offset')
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(values)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+
+def get_paginator(request, ordering=None):
+    """
+    Keyset pagination by default, `limit` or `offset` without
+    `cursor` keep old limit/offset clients working.
+    """
+    params = request.query_params
+    if KeysetPagination.cursor_query_param not in params and (
+            LimitOffsetPagination.limit_query_param in params
+            or LimitOffsetPagination.offset_query_param in params):
+        return LimitOffsetPagination()
+    return KeysetPagination(ordering=ordering)
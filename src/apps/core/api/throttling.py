@@ -0,0 +1,237 @@
+"""
+Redis throttling
+
+Rate limits shared by every worker, the default cache is per process.
+GCRA (generic cell rate algorithm): one key per client holding the
+theoretical arrival time, checked and moved by a Lua script. Every
+throttle of a view checked by one script call (`RedisThrottleGroup`,
+see `RedisThrottleMixin`) so a request cost a single EVALSHA round-trip
+and O(1) memory whatever the rate, no key advanced unless every limit
+allow the request. `N/period` allow bursts of N then one request
+every period/N. Fallback to DRF cache throttling when Redis down.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from redis.exceptions import RedisError
+from rest_framework import throttling
+
+from apps.core.utils import get_async_redis_connection, get_redis_connection
+
+# KEYS every limit, ARGV period (ms) and limit of each key,
+# return {allowed, wait (ms)}. All keys checked before any moved.
+# Redis clock used, same for every worker.
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local tats = {}
+local wait = 0
+
+for index, key in ipairs(KEYS) do
+    local period = tonumber(ARGV[index * 2 - 1])
+    local limit = tonumber(ARGV[index * 2])
+
+    local tat = tonumber(redis.call('GET', key)) or now
+    if tat < now then
+        tat = now
+    end
+
+    tats[index] = tat + period / limit
+    wait = math.max(wait, tats[index] - now - period)
+end
+
+if wait > 0 then
+    return {0, math.ceil(wait)}
+end
+
+for index, key in ipairs(KEYS) do
+    redis.call('SET', key, tostring(tats[index]), 'PX', math.ceil(tats[index] - now))
+end
+return {1, 0}
+"""
+
+_script = None
+
+
+def get_script():
+    """Registered once, called with EVALSHA (EVAL on NOSCRIPT)"""
+    global _script
+    if _script is None:
+        _script = get_redis_connection().register_script(GCRA_SCRIPT)
+    return _script
+
+
+def get_script_args(limits):
+    """:limits is [(key, period ms, limit)], return keys, args"""
+    keys = list()
+    args = list()
+    for key, period, limit in limits:
+        keys.append(key)
+        args.extend([period, limit])
+    return keys, args
+
+
+class RedisRateThrottle(throttling.SimpleRateThrottle):
+    wait_ms = None
+
+    def get_limit(self, request, view):
+        """Return (key, period ms, limit), None when not throttled"""
+        if self.rate is None:
+            return None
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return None
+        return self.key, self.duration * 1000, self.num_requests
+
+    def allow_request(self, request, view):
+        return RedisThrottleGroup([self]).allow_request(request, view)
+
+    async def aallow_request(self, request, view):
+        """`allow_request` of async views, event loop never blocked"""
+        return await RedisThrottleGroup([self]).aallow_request(request, view)
+
+    def allow_request_cache(self, request, view):
+        """DRF cache throttling, rate and scope already resolved"""
+        self.wait_ms = None
+        return throttling.SimpleRateThrottle.allow_request(self, request, view)
+
+    def wait(self):
+        if self.wait_ms is None:
+            return super().wait()
+        return self.wait_ms / 1000
+
+
+class RedisThrottleGroup(throttling.BaseThrottle):
+    """
+    Throttles checked together by one script call. Throttles not
+    built on `RedisRateThrottle` checked one by one first.
+    """
+
+    def __init__(self, throttles):
+        self.throttles = list()
+        self.others = list()
+        for throttle in throttles:
+            if isinstance(throttle, RedisRateThrottle):
+                self.throttles.append(throttle)
+            else:
+                self.others.append(throttle)
+
+        self.denied = list()
+        self.wait_ms = None
+
+    def get_limits(self, request, view):
+        """Return {throttle: limit} of throttles applied to the request"""
+        limits = dict()
+        for throttle in self.throttles:
+            limit = throttle.get_limit(request, view)
+            if limit is not None:
+                limits[throttle] = limit
+        return limits
+
+    def allow_request_cache(self, limits, request, view):
+        self.denied.extend(
+            throttle for throttle in limits
+            if not throttle.allow_request_cache(request, view)
+        )
+        return not self.denied
+
+    def set_result(self, limits, result):
+        allowed, self.wait_ms = result
+        for throttle in limits:
+            throttle.wait_ms = self.wait_ms
+        if not allowed:
+            self.denied.extend(limits)
+        return bool(allowed)
+
+    def allow_request(self, request, view):
+        self.denied = [
+            throttle for throttle in self.others
+            if not throttle.allow_request(request, view)
+        ]
+        if self.denied:
+            return False
+
+        limits = self.get_limits(request, view)
+        if not limits:
+            return True
+
+        keys, args = get_script_args(limits.values())
+        try:
+            result = get_script()(keys=keys, args=args)
+        except RedisError as e:
+            logging.warning('Redis throttle failed, cache used: %s', e)
+            return self.allow_request_cache(limits, request, view)
+        return self.set_result(limits, result)
+
+    async def aallow_request(self, request, view):
+        """`allow_request` of async views, event loop never blocked"""
+        self.denied = list()
+        for throttle in self.others:
+            if not await sync_to_async(throttle.allow_request)(request, view):
+                self.denied.append(throttle)
+        if self.denied:
+            return False
+
+        limits = self.get_limits(request, view)
+        if not limits:
+            return True
+
+        keys, args = get_script_args(limits.values())
+        try:
+            script = get_async_redis_connection().register_script(GCRA_SCRIPT)
+            result = await script(keys=keys, args=args)
+        except RedisError as e:
+            logging.warning('Redis throttle failed, cache used: %s', e)
+            return await sync_to_async(self.allow_request_cache)(
+                limits,
+                request,
+                view
+            )
+        return self.set_result(limits, result)
+
+    def wait(self):
+        durations = [
+            duration for duration in
+            (throttle.wait() for throttle in self.denied)
+            if duration is not None
+        ]
+        return max(durations, default=None)
+
+
+class RedisThrottleMixin(object):
+    """Every throttle of the view checked by one `RedisThrottleGroup`"""
+
+    def check_throttles(self, request):
+        throttle = RedisThrottleGroup(self.get_throttles())
+        if not throttle.allow_request(request, self):
+            self.throttled(request, throttle.wait())
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, RedisRateThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, RedisRateThrottle):
+    """Authenticated users only, anonym limited by `AnonRateThrottle`"""
+
+    def get_cache_key(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return super().get_cache_key(request, view)
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, RedisRateThrottle):
+    """Rate of the view `throttle_scope`, no limit if not set"""
+
+    def get_limit(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return None
+
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().get_limit(request, view)
+
+    def allow_request(self, request, view):
+        return RedisRateThrottle.allow_request(self, request, view)
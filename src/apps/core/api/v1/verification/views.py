@@ -7,10 +7,14 @@ from django.apps import apps
 
 from rest_framework import viewsets, status as response_status
 from rest_framework.permissions import AllowAny
-from rest_framework.throttling import AnonRateThrottle
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from apps.core.api.throttling import (
+    AnonRateThrottle,
+    RedisThrottleMixin,
+    ScopedRateThrottle
+)
 from .serializers import (
     CreateVerificationSerializer,
     ValidateVerificationSerializer
@@ -20,15 +24,23 @@ Verification = apps.get_registered_model('core', 'Verification')
 User = apps.get_registered_model('user', 'User')
 
 
-class BaseViewSet(viewsets.ViewSet):
+class BaseViewSet(RedisThrottleMixin, viewsets.ViewSet):
     lookup_field = 'passcode'
     permission_classes = [AllowAny, ]
     throttle_classes = (AnonRateThrottle,)
+    throttle_scope = 'verification'
 
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
         self.context = dict()
 
+    def get_throttles(self):
+        throttles = super().get_throttles()
+        # sending or validating passcode limited per endpoint
+        if self.action in ['create', 'partial_update']:
+            throttles.append(ScopedRateThrottle())
+        return throttles
+
     def initialize_request(self, request, *args, **kwargs):
         self.context.update({'request': request})
         return super().initialize_request(request, *args, **kwargs)
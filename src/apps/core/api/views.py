@@ -0,0 +1,107 @@
+"""
+Async API views
+
+Read only views served natively under ASGI. Redis (`redis.asyncio`)
+awaited on the event loop so one process serve many concurrent
+requests. Django 4.0 cache methods (`aget`, `aset`) are only
+`sync_to_async` wrappers, every cache call still hop to a thread like
+the database work (Django ORM is sync). Same DRF authentication,
+throttling, exceptions and JSON rendering as the sync views.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from apps.core.api.throttling import RedisThrottleGroup
+
+
+class AsyncAPIView(object):
+    """
+    Handlers are `async def get(self, request, *args, **kwargs)`,
+    `request` is DRF request and the user already authenticated.
+    """
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    renderer_class = JSONRenderer
+
+    def __init__(self, **kwargs) -> None:
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        async def view(request, *args, **kwargs):
+            self = cls(**initkwargs)
+            return await self.dispatch(request, *args, **kwargs)
+
+        # token authenticated, no session so no csrf like DRF views
+        view.csrf_exempt = True
+        view.view_class = cls
+        return view
+
+    def respond(self, data, status=200, headers=None):
+        return HttpResponse(
+            self.renderer_class().render(data),
+            status=status,
+            content_type=self.renderer_class.media_type,
+            headers=headers
+        )
+
+    def render_response(self, response, headers=None):
+        """Render DRF `Response` built by the sync views"""
+        response_headers = {
+            key: value for key, value in response.items()
+            if key.lower() != 'content-type'
+        }
+        response_headers.update(headers or dict())
+        return self.respond(
+            response.data,
+            status=response.status_code,
+            headers=response_headers
+        )
+
+    def handle_exception(self, exc):
+        headers = dict()
+        if getattr(exc, 'wait', None):
+            headers['Retry-After'] = '%d' % exc.wait
+
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {'detail': exc.detail}
+        return self.respond(data, status=exc.status_code, headers=headers)
+
+    async def check_throttles(self, request):
+        # every limit checked by one script call, like `RedisThrottleMixin`
+        throttle = RedisThrottleGroup(
+            [throttle_class() for throttle_class in self.throttle_classes]
+        )
+        if not await throttle.aallow_request(request, self):
+            raise exceptions.Throttled(throttle.wait())
+
+    async def initial(self, request):
+        # authenticators may query the user (JWT, basic)
+        await sync_to_async(lambda: request.user)()
+        await self.check_throttles(request)
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.request = Request(
+            request,
+            authenticators=[auth() for auth in self.authentication_classes]
+        )
+
+        try:
+            handler = getattr(self, request.method.lower(), None)
+            if handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+
+            await self.initial(self.request)
+            return await handler(self.request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
@@ -0,0 +1,175 @@
+import math
+
+from django.db.models import F, Q, Value, FloatField
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+USE_KILOMETER = 6371
+USE_MILE = 3959
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+
+
+def bounding_box(latitude, longitude, radius, unit=USE_KILOMETER):
+    """
+    Return (min_latitude, max_latitude, longitude_ranges) covering
+    every point within `radius` from the given coordinate.
+
+    :longitude_ranges is a list because the box is split in two
+    when it crosses the antimeridian.
+    """
+    angular = math.degrees(radius / unit)
+    min_latitude = max(latitude - angular, -90.0)
+    max_latitude = min(latitude + angular, 90.0)
+
+    # near the poles every longitude is inside the radius
+    if min_latitude <= -90.0 or max_latitude >= 90.0:
+        return min_latitude, max_latitude, [(-180.0, 180.0)]
+
+    delta = math.degrees(
+        math.asin(min(1.0, math.sin(radius / unit)
+                      / math.cos(math.radians(latitude))))
+    )
+    min_longitude = longitude - delta
+    max_longitude = longitude + delta
+
+    if min_longitude < -180.0:
+        ranges = [(min_longitude + 360.0, 180.0), (-180.0, max_longitude)]
+    elif max_longitude > 180.0:
+        ranges = [(min_longitude, 180.0), (-180.0, max_longitude - 360.0)]
+    else:
+        ranges = [(min_longitude, max_longitude)]
+
+    return min_latitude, max_latitude, ranges
+
+
+def bounding_box_q(latitude, longitude, radius,
+                   latitude_field='latitude', longitude_field='longitude'):
+    """Q object of the bounding box, see `bounding_box`"""
+    min_latitude, max_latitude, longitude_ranges = bounding_box(
+        latitude,
+        longitude,
+        radius
+    )
+
+    longitude_q = Q()
+    for min_longitude, max_longitude in longitude_ranges:
+        longitude_q |= Q(**{
+            '%s__range' % longitude_field: (min_longitude, max_longitude)
+        })
+
+    return longitude_q & Q(**{
+        '%s__range' % latitude_field: (min_latitude, max_latitude)
+    })
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    latitude_interval = [-90.0, 90.0]
+    longitude_interval = [-180.0, 180.0]
+    geohash = list()
+    bit = 0
+    ch = 0
+    even = True
+
+    while len(geohash) < precision:
+        if even:
+            interval, value = longitude_interval, longitude
+        else:
+            interval, value = latitude_interval, latitude
+
+        mid = (interval[0] + interval[1]) / 2
+        if value >= mid:
+            ch |= 1 << (4 - bit)
+            interval[0] = mid
+        else:
+            interval[1] = mid
+
+        even = not even
+        if bit < 4:
+            bit += 1
+        else:
+            geohash.append(GEOHASH_BASE32[ch])
+            bit = 0
+            ch = 0
+
+    return ''.join(geohash)
+
+
+def geohash_cell_size(precision):
+    """Return (latitude, longitude) span in degrees of a cell"""
+    bits = precision * 5
+    latitude_bits = bits // 2
+    longitude_bits = bits - latitude_bits
+    return 180.0 / 2 ** latitude_bits, 360.0 / 2 ** longitude_bits
+
+
+def geohash_neighbours(latitude, longitude, precision):
+    """Return the cell of the coordinate and their neighbours"""
+    height, width = geohash_cell_size(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        lat = latitude + dlat
+        if lat < -90.0 or lat > 90.0:
+            continue
+
+        for dlon in (-width, 0, width):
+            lon = (longitude + dlon + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(lat, lon, precision))
+    return cells
+
+
+def geohash_cover(latitude, longitude, radius, unit=USE_KILOMETER):
+    """
+    Return geohash cells (the cell of the coordinate and their
+    neighbours) covering every point within `radius`.
+    Empty when the radius too large to be covered by cells.
+    """
+    delta_latitude = math.degrees(radius / unit)
+    cos_latitude = math.cos(math.radians(latitude))
+    if cos_latitude <= 0.0:
+        return set()
+
+    delta_longitude = delta_latitude / cos_latitude
+
+    precision = 0
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        height, width = geohash_cell_size(candidate)
+        if height < delta_latitude or width < delta_longitude:
+            break
+        precision = candidate
+
+    if not precision:
+        return set()
+
+    return geohash_neighbours(latitude, longitude, precision)
+
+
+def geohash_q(latitude, longitude, radius, field='geohash'):
+    """Q object of prefix scans over `geohash_cover` cells"""
+    q = Q()
+    for cell in sorted(geohash_cover(latitude, longitude, radius)):
+        q |= Q(**{'%s__startswith' % field: cell})
+    return q
+
+
+def haversine(latitude, longitude, latitude_field='latitude',
+              longitude_field='longitude', unit=USE_KILOMETER):
+    """
+    Database expression of the great-circle distance between
+    the given coordinate and the row coordinate fields.
+    """
+    def radians(value):
+        return Radians(value, output_field=FloatField())
+
+    half_dlat = (radians(F(latitude_field)) - radians(float(latitude))) / 2
+    half_dlon = (radians(F(longitude_field)) - radians(float(longitude))) / 2
+
+    a = Power(Sin(half_dlat, output_field=FloatField()), 2) \
+        + Cos(radians(float(latitude)), output_field=FloatField()) \
+        * Cos(radians(F(latitude_field)), output_field=FloatField()) \
+        * Power(Sin(half_dlon, output_field=FloatField()), 2)
+
+    return Value(2 * unit, output_field=FloatField()) * ASin(
+        Sqrt(a, output_field=FloatField()),
+        output_field=FloatField()
+    )
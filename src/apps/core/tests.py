@@ -1,3 +1,117 @@
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
 from django.test import TestCase
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework.views import APIView
+
+from apps.core.api import throttling
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+RATES = {
+    'anon': '3/minute',
+    'user': '100/minute',
+    'moment': '2/minute',
+    'comment': '10/minute',
+}
+
+
+class MomentView(throttling.RedisThrottleMixin, APIView):
+    permission_classes = (AllowAny,)
+    throttle_classes = (
+        throttling.AnonRateThrottle,
+        throttling.UserRateThrottle,
+        throttling.ScopedRateThrottle,
+    )
+    throttle_scope = 'moment'
+
+    def post(self, request):
+        return Response(status=201)
+
+
+class CommentView(MomentView):
+    throttle_scope = 'comment'
+
+
+@skipUnless(fakeredis, "fakeredis not installed")
+@mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', RATES)
+class RedisThrottleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patchers = [
+            mock.patch.object(throttling, '_script', None),
+            mock.patch.object(
+                throttling,
+                'get_redis_connection',
+                return_value=self.redis
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, view, address='10.0.0.1'):
+        request = APIRequestFactory().post('/', REMOTE_ADDR=address)
+        return view.as_view()(request)
+
+    def test_burst_then_denied(self):
+        statuses = [self.post(MomentView).status_code for _i in range(3)]
+        self.assertEqual(statuses, [201, 201, 429])
+
+        # other client has their own bucket
+        self.assertEqual(self.post(MomentView, '10.0.0.2').status_code, 201)
+
+    def test_retry_after_from_script(self):
+        self.post(MomentView)
+        self.post(MomentView)
+        response = self.post(MomentView)
+
+        # 2/minute, next request allowed 30s later
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response['Retry-After']), (29, 30))
+
+    def test_scoped_rate_per_endpoint(self):
+        self.post(MomentView)
+        self.post(MomentView)
+        self.assertEqual(self.post(MomentView).status_code, 429)
+
+        # request denied by `moment` not charged to `anon`,
+        # one anon request left
+        self.assertEqual(self.post(CommentView).status_code, 201)
+        self.assertEqual(self.post(CommentView).status_code, 429)
+
+    def test_single_script_call(self):
+        with mock.patch.object(
+            throttling.RedisThrottleGroup,
+            'set_result',
+            autospec=True,
+            side_effect=throttling.RedisThrottleGroup.set_result
+        ) as set_result:
+            self.post(MomentView)
+
+        self.assertEqual(set_result.call_count, 1)
+        # anon and scope checked, user bucket only for authenticated
+        limits = set_result.call_args[0][1]
+        self.assertEqual(
+            sorted(type(throttle).__name__ for throttle in limits),
+            ['AnonRateThrottle', 'ScopedRateThrottle']
+        )
+
+    def test_fallback_to_cache(self):
+        script = mock.Mock(side_effect=RedisConnectionError('down'))
+        with mock.patch.object(throttling, 'get_script', return_value=script):
+            statuses = [self.post(MomentView).status_code for _i in range(3)]
+            response = self.post(MomentView)
 
-# Create your tests here.
+        self.assertEqual(statuses, [201, 201, 429])
+        self.assertTrue(response.has_header('Retry-After'))
+        self.assertFalse(self.redis.keys())
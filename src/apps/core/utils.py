@@ -1,6 +1,16 @@
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio
+
 from django.apps import apps
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
+_redis_connection = None
+_async_redis_connections = weakref.WeakKeyDictionary()
+
 
 def is_model_registered(app_label, model_name):
     """
@@ -24,3 +34,21 @@ def get_ip_address(request):
         # Real IP address of client Machine
         ip = request.META.get('REMOTE_ADDR')
     return ip
+
+
+def get_redis_connection():
+    """Shared client, connection pool reused across requests"""
+    global _redis_connection
+    if _redis_connection is None:
+        _redis_connection = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis_connection
+
+
+def get_async_redis_connection():
+    """Shared asyncio client, one per event loop (pool bound to the loop)"""
+    loop = asyncio.get_running_loop()
+    connection = _async_redis_connections.get(loop)
+    if connection is None:
+        connection = redis.asyncio.Redis.from_url(settings.REDIS_URL)
+        _async_redis_connections[loop] = connection
+    return connection
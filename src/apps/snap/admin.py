@@ -21,6 +21,10 @@ class LocationInline(ct_admin.GenericStackedInline):
 class WithInline(admin.StackedInline):
     model = With
 
+    def get_queryset(self, request):
+        # `With.__str__` use user name
+        return super().get_queryset(request).select_related('user')
+
 
 class MomentAdmin(admin.ModelAdmin):
     model = Moment
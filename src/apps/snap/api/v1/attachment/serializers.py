@@ -1,4 +1,8 @@
+import os
+
 from django.apps import apps
+from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
 from taggit.serializers import (
@@ -6,11 +10,14 @@ from taggit.serializers import (
     TaggitSerializer
 )
 
+from apps.snap import direct_uploads
+from apps.snap.conf import settings
 from ..fields import DynamicFieldsModelSerializer
 from ..location.serializers import ListLocationSerializer
 
 Attachment = apps.get_registered_model('snap', 'Attachment')
 Location = apps.get_registered_model('snap', 'Location')
+AttachmentUpload = apps.get_registered_model('snap', 'AttachmentUpload')
 
 
 class BaseAttachmentSerializer(TaggitSerializer, DynamicFieldsModelSerializer):
@@ -22,16 +29,32 @@ class BaseAttachmentSerializer(TaggitSerializer, DynamicFieldsModelSerializer):
 class ListAttachmentSerializer(BaseAttachmentSerializer):
     locations = ListLocationSerializer(many=True)
     tags = TagListSerializerField()
+    renditions = serializers.SerializerMethodField()
 
     class Meta(BaseAttachmentSerializer.Meta):
         fields = [
             'guid',
             'file',
+            'filemime',
+            'renditions',
             'caption',
             'locations',
             'tags',
         ]
 
+    def get_renditions(self, instance):
+        """{name: url} of resized copies, empty until processed"""
+        request = self.context.get('request')
+        storage = instance.file.storage
+        renditions = dict()
+
+        for name, rendition in (instance.renditions or {}).items():
+            url = storage.url(rendition['path'])
+            if request:
+                url = request.build_absolute_uri(url)
+            renditions[name] = url
+        return renditions
+
 
 class RetrieveAttachmentSerializer(ListAttachmentSerializer):
     class Meta(ListAttachmentSerializer.Meta):
@@ -79,3 +102,106 @@ class CreateAttachmentSerializer(BaseAttachmentSerializer):
             self.instance.locations.set(locations)
 
         return self.instance
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    _links = serializers.SerializerMethodField()
+    presigned = serializers.SerializerMethodField()
+    attachment = serializers.SlugRelatedField(
+        read_only=True,
+        slug_field='guid'
+    )
+
+    class Meta:
+        model = AttachmentUpload
+        fields = [
+            '_links',
+            'guid',
+            'filename',
+            'filesize',
+            'offset',
+            'checksum',
+            'attachment',
+            'presigned',
+            'error',
+        ]
+
+    def get__links(self, instance):
+        request = self.context.get('request')
+        reverse_uri = reverse(
+            'snap_api:attachment-upload',
+            kwargs={'upload_guid': instance.guid}
+        )
+        return request.build_absolute_uri(reverse_uri)
+
+    def get_presigned(self, instance):
+        # signed locally, no request to storage
+        if instance.is_direct and not instance.attachment_id:
+            return direct_uploads.get_presigned_put(instance)
+        return None
+
+
+class CreateUploadSerializer(UploadSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    direct = serializers.BooleanField(
+        write_only=True,
+        default=False,
+        help_text=_("Upload to a presigned url instead of chunks")
+    )
+
+    class Meta(UploadSerializer.Meta):
+        fields = UploadSerializer.Meta.fields + ['user', 'direct']
+        read_only_fields = ['offset']
+
+    def validate_user(self, value):
+        if value.is_anonymous:
+            return None
+        return value
+
+    def validate_filename(self, value):
+        # never trust client path
+        value = os.path.basename(value)
+        if not value:
+            raise serializers.ValidationError(_("Invalid filename"))
+        return value
+
+    def validate_filesize(self, value):
+        if value <= 0 or value > settings.SNAP_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                _("Filesize must be between 1 and {} bytes").format(
+                    settings.SNAP_UPLOAD_MAX_SIZE)
+            )
+        return value
+
+    def validate_direct(self, value):
+        if value and not direct_uploads.is_enabled():
+            raise serializers.ValidationError(_("Direct upload not available"))
+        return value
+
+    def create(self, validated_data):
+        direct = validated_data.pop('direct', False)
+        instance = super().create(validated_data)
+
+        if direct:
+            instance.key = direct_uploads.get_key(instance)
+            instance.save(update_fields=['key'])
+        return instance
+
+
+class CompleteUploadSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255, required=False)
+    caption = serializers.CharField(required=False, allow_blank=True)
+    checksum = serializers.RegexField(
+        r'^[0-9a-fA-F]{64}$',
+        required=False,
+        help_text=_("sha256 hex digest of the whole file")
+    )
+    locations = serializers.SlugRelatedField(
+        many=True,
+        required=False,
+        slug_field='guid',
+        queryset=Location.objects.filter(
+            content_type__isnull=False,
+            object_id__isnull=False
+        )
+    )
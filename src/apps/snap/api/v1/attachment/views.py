@@ -1,17 +1,35 @@
+from django.apps import apps
 from django.db import transaction
-from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.exceptions import (
+    ValidationError as DjangoValidationError,
+    ObjectDoesNotExist
+)
+from django.utils.encoding import smart_str
+from django.utils.translation import gettext_lazy as _
 
 from rest_framework import viewsets, status as response_status
-from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny
 
-from .serializers import CreateAttachmentSerializer
+from apps.snap import uploads
+from apps.snap.downloads import serve_attachment
+from .serializers import (
+    CompleteUploadSerializer,
+    CreateAttachmentSerializer,
+    CreateUploadSerializer,
+    RetrieveAttachmentSerializer,
+    UploadSerializer
+)
 from ..utils import ThrottleViewSet
 
+Attachment = apps.get_registered_model('snap', 'Attachment')
+AttachmentUpload = apps.get_registered_model('snap', 'AttachmentUpload')
 
-class AttachmentViewSet(viewsets.ViewSet, ThrottleViewSet):
+
+class AttachmentViewSet(ThrottleViewSet, viewsets.ViewSet):
     """
     POST
     ------
@@ -21,8 +39,46 @@ class AttachmentViewSet(viewsets.ViewSet, ThrottleViewSet):
             "locations": ["<guid>"]
         }
 
+
+    RESUMABLE UPLOAD
+    ------
+
+        POST uploads/ {"filename": "<string>", "filesize": "<integer>"}
+
+        PATCH uploads/<guid>/ raw chunk as body with headers
+            Upload-Offset: <offset returned by previous call>
+            Upload-Checksum: <sha256 hex of the chunk> (optional)
+
+        GET uploads/<guid>/ current offset to resume from
+
+        POST uploads/<guid>/complete/
+            {
+                "name": "<string>",
+                "caption": "<string>",
+                "checksum": "<sha256 hex of the file>",
+                "locations": ["<guid>"]
+            }
+
+
+    DOWNLOAD
+    ------
+
+        GET <guid>/download/ support Range, If-Range,
+            If-None-Match and If-Modified-Since
+
+
+    DIRECT UPLOAD
+    ------
+
+        POST uploads/ {"filename": "<string>", "filesize": "<integer>", "direct": true}
+            response "presigned" has the url to PUT the whole file to
+
+        POST uploads/<guid>/complete/ same as resumable upload,
+            attachment file filled once copied from object storage
+
     """
     lookup_field = 'guid'
+    throttle_scope = 'attachment'
     parser_classes = (MultiPartParser,)
     permission_classes = (AllowAny,)
 
@@ -34,6 +90,11 @@ class AttachmentViewSet(viewsets.ViewSet, ThrottleViewSet):
         self.context.update({'request': request})
         return super().initialize_request(request, *args, **kwargs)
 
+    def perform_content_negotiation(self, request, force=False):
+        # file sent whatever Accept say, errors fallback to json
+        force = force or self.action == 'download'
+        return super().perform_content_negotiation(request, force=force)
+
     def list(self, request):
         return Response(status=response_status.HTTP_200_OK)
 
@@ -57,3 +118,140 @@ class AttachmentViewSet(viewsets.ViewSet, ThrottleViewSet):
             serializer.errors,
             status=response_status.HTTP_406_NOT_ACCEPTABLE
         )
+
+    @action(
+        detail=True,
+        methods=['GET'],
+        url_name='download',
+        url_path='download'
+    )
+    def download(self, request, guid=None):
+        try:
+            attachment = Attachment.objects \
+                .only('guid', 'file', 'filename', 'filesize', 'filemime', 'digest', 'update_at') \
+                .get(guid=guid)
+        except (ObjectDoesNotExist, DjangoValidationError):
+            raise NotFound(detail=_("Attachment not found"))
+
+        if not attachment.file:
+            raise NotFound(detail=_("Attachment has no file"))
+        return serve_attachment(request, attachment)
+
+    def get_upload(self, request, upload_guid, is_update=False):
+        queryset = AttachmentUpload.objects.all()
+        if is_update:
+            queryset = queryset.select_for_update()
+
+        try:
+            upload = queryset.get(guid=upload_guid)
+        except (ObjectDoesNotExist, DjangoValidationError):
+            raise NotFound(detail=_("Upload not found"))
+
+        # anonym upload known by their guid only
+        if upload.user_id and upload.user_id != request.user.id:
+            raise NotFound(detail=_("Upload not found"))
+        return upload
+
+    @transaction.atomic
+    @action(
+        detail=False,
+        methods=['POST'],
+        url_name='upload-init',
+        url_path='uploads',
+        parser_classes=(JSONParser,)
+    )
+    def upload_init(self, request):
+        serializer = CreateUploadSerializer(
+            data=request.data,
+            context=self.context
+        )
+        if serializer.is_valid(raise_exception=True):
+            serializer.save()
+            return Response(
+                serializer.data,
+                status=response_status.HTTP_201_CREATED
+            )
+        return Response(
+            serializer.errors,
+            status=response_status.HTTP_406_NOT_ACCEPTABLE
+        )
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_name='upload',
+        url_path=r'uploads/(?P<upload_guid>[^/.]+)'
+    )
+    def upload(self, request, upload_guid=None):
+        upload = self.get_upload(request, upload_guid)
+        serializer = UploadSerializer(upload, context=self.context)
+        return Response(serializer.data, status=response_status.HTTP_200_OK)
+
+    @upload.mapping.patch
+    @transaction.atomic
+    def upload_append(self, request, upload_guid=None):
+        upload = self.get_upload(request, upload_guid, is_update=True)
+
+        try:
+            offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise ValidationError(
+                detail=_("Upload-Offset and Content-Length headers required")
+            )
+
+        if offset != upload.offset:
+            serializer = UploadSerializer(upload, context=self.context)
+            return Response(
+                serializer.data,
+                status=response_status.HTTP_409_CONFLICT
+            )
+
+        try:
+            # body never parsed, streamed straight to the partial file
+            uploads.append_chunk(
+                upload,
+                request.stream,
+                length,
+                checksum=request.META.get('HTTP_UPLOAD_CHECKSUM')
+            )
+        except DjangoValidationError as e:
+            raise ValidationError(detail=smart_str(e.message))
+
+        serializer = UploadSerializer(upload, context=self.context)
+        return Response(serializer.data, status=response_status.HTTP_200_OK)
+
+    @transaction.atomic
+    @action(
+        detail=False,
+        methods=['POST'],
+        url_name='upload-complete',
+        url_path=r'uploads/(?P<upload_guid>[^/.]+)/complete',
+        parser_classes=(JSONParser,)
+    )
+    def upload_complete(self, request, upload_guid=None):
+        upload = self.get_upload(request, upload_guid, is_update=True)
+        serializer = CompleteUploadSerializer(
+            data=request.data,
+            context=self.context
+        )
+        serializer.is_valid(raise_exception=True)
+
+        data = dict(serializer.validated_data)
+        locations = data.pop('locations', None)
+        try:
+            attachment = uploads.complete_upload(upload, **data)
+        except DjangoValidationError as e:
+            raise ValidationError(detail=smart_str(e.message))
+
+        if locations:
+            attachment.locations.set(locations)
+
+        serializer = RetrieveAttachmentSerializer(
+            attachment,
+            context=self.context
+        )
+        return Response(
+            serializer.data,
+            status=response_status.HTTP_201_CREATED
+        )
@@ -1,6 +1,12 @@
+from django.apps import apps
+
 from rest_framework import serializers
 from eav.models import Attribute
 
+from apps.snap.models.device import DEVICE_ATTRIBUTES
+
+Device = apps.get_registered_model('snap', 'Device')
+
 
 class AttributeSerializer(serializers.Serializer):
     slug = serializers.SlugRelatedField(
@@ -10,3 +16,36 @@ class AttributeSerializer(serializers.Serializer):
     value_text = serializers.CharField(required=False)
     value_int = serializers.IntegerField(required=False)
     value_float = serializers.FloatField(required=False)
+
+
+def prepare_attributes(attributes):
+    """
+    Device attributes kept in `device_attributes`, resolved into
+    `device` on save (see `resolve_device`), the rest saved as eav values.
+    """
+    data = dict()
+    device_attributes = dict()
+
+    for attr in attributes or []:
+        obj = attr.get('slug')
+        value = attr.get('value_{}'.format(obj.datatype))
+
+        if obj.slug in DEVICE_ATTRIBUTES:
+            device_attributes[obj.slug] = value
+        else:
+            data.update({'eav__{}'.format(obj.slug): value})
+
+    data.update({'device_attributes': device_attributes})
+    return data
+
+
+def resolve_device(validated_data):
+    """
+    Replace `device_attributes` with their `device`, created if new.
+    Called on create so invalid requests not write devices.
+    """
+    device_attributes = validated_data.pop('device_attributes', None)
+    device = Device.objects.get_for_attributes(device_attributes or dict())
+    if device:
+        validated_data.update({'device': device})
+    return validated_data
@@ -3,10 +3,16 @@ from django.urls import reverse_lazy
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils.encoding import smart_str
+from django.utils.translation import gettext_lazy as _
 
 from rest_framework import serializers
 
-from ..attribute.serializers import AttributeSerializer
+from apps.snap import threads
+from ..attribute.serializers import (
+    AttributeSerializer,
+    prepare_attributes,
+    resolve_device
+)
 
 Comment = apps.get_registered_model('snap', 'Comment')
 CommentTree = apps.get_registered_model('snap', 'CommentTree')
@@ -45,6 +51,47 @@ class ListCommentSerializer(BaseCommentSerializer):
         return absolute_uri
 
 
+class ThreadReplySerializer(ListCommentSerializer):
+    parent = serializers.UUIDField(read_only=True, source='parent_guid')
+    replies = serializers.SerializerMethodField()
+
+    class Meta(ListCommentSerializer.Meta):
+        fields = [
+            '_links',
+            'guid',
+            'parent',
+            'depth',
+            'user',
+            'comment_content',
+            'create_at',
+            'replies',
+        ]
+
+    def get_replies(self, instance):
+        serializer = ThreadReplySerializer(
+            instance.replies,
+            context=self.context,
+            many=True
+        )
+        return serializer.data
+
+
+class ThreadCommentSerializer(ThreadReplySerializer):
+    parent = None
+    reply_count = serializers.IntegerField(read_only=True)
+
+    class Meta(ThreadReplySerializer.Meta):
+        fields = [
+            '_links',
+            'guid',
+            'user',
+            'comment_content',
+            'create_at',
+            'reply_count',
+            'replies',
+        ]
+
+
 class RetrieveCommentSerializer(ListCommentSerializer):
     _links = serializers.ReadOnlyField()
 
@@ -106,8 +153,11 @@ class CreateCommentSerializer(BaseCommentSerializer):
             )
 
         try:
-            content_object = content_type \
-                .get_object_for_this_type(guid=object_id)
+            # hidden moment not commented
+            content_object = threads.get_visible_targets(
+                content_type.model_class(),
+                request.user
+            ).get(guid=object_id)
         except ObjectDoesNotExist as e:
             raise serializers.ValidationError(
                 detail={'object_id': smart_str(e)}
@@ -119,18 +169,25 @@ class CreateCommentSerializer(BaseCommentSerializer):
             'object_id': content_object.id
         })
 
+        # reply kept in the thread of their parent
+        parent = data.get('parent')
+        if parent and (
+            parent.content_type_id != content_type.id
+            or parent.object_id != str(content_object.id)
+        ):
+            raise serializers.ValidationError(
+                detail={'parent': _("Parent comment of another object")}
+            )
+
         # prepare attributes
         attributes = data.pop('attributes', None)
-        if attributes:
-            for attr in attributes:
-                obj = attr.get('slug')
-                value = attr.get('value_{}'.format(obj.datatype))
-                data.update({'eav__{}'.format(obj.slug): value})
+        data.update(prepare_attributes(attributes))
 
         return data
 
     def create(self, validated_data):
         parent = validated_data.pop('parent', None)
+        resolve_device(validated_data)
         instance = super().create(validated_data)
 
         if parent:
@@ -144,3 +201,8 @@ class UpdateCommentSerializer(CreateCommentSerializer):
             'comment_content',
             'attributes',
         ]
+
+    def update(self, instance, validated_data):
+        # device attributes only prove ownership, device kept
+        validated_data.pop('device_attributes', None)
+        return super().update(instance, validated_data)
@@ -5,6 +5,7 @@ from django.utils.encoding import smart_str
 from django.apps import apps
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Q, OuterRef, Subquery, Exists
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import (
     ValidationError as DjangoValidationError,
     ObjectDoesNotExist
@@ -14,25 +15,27 @@ from rest_framework import viewsets, status as response_status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError, NotFound
-from rest_framework.pagination import LimitOffsetPagination
 
 from eav.queryset import EavQuerySet
 from eav.models import Value, Attribute, Entity
 
+from apps.core.api.pagination import get_paginator
+from apps.snap import threads
+from apps.snap.conf import settings
 from ..permissions import IsMomentOwnerOrReject
 from ..utils import ThrottleViewSet
 from .serializers import (
     CreateCommentSerializer,
     ListCommentSerializer,
     RetrieveCommentSerializer,
+    ThreadCommentSerializer,
     UpdateCommentSerializer
 )
 
-PAGINATOR = LimitOffsetPagination()
 Comment = apps.get_registered_model('snap', 'Comment')
 
 
-class CommentViewSet(viewsets.ViewSet, ThrottleViewSet):
+class CommentViewSet(ThrottleViewSet, viewsets.ViewSet):
     """
     POST
     -------
@@ -49,11 +52,19 @@ class CommentViewSet(viewsets.ViewSet, ThrottleViewSet):
     -------
 
         {
-            "content_type": "<string>"
+            "content_type": "<string>",
+            "object_id": "<guid>",
+            "replies": "<integer>"
         }
 
+        Note:
+        With `object_id` return top level comments of that object
+        (cursor paginated), each with their first `replies` replies
+        nested and total `reply_count`
+
     """
     lookup_field = 'guid'
+    throttle_scope = 'comment'
     permission_classes = (AllowAny, )
     permission_action = {
         'partial_update': (IsMomentOwnerOrReject,),
@@ -93,20 +104,72 @@ class CommentViewSet(viewsets.ViewSet, ThrottleViewSet):
         except ObjectDoesNotExist:
             raise NotFound(detail=_("Moment not found"))
 
+    def _list_thread(self, request, ct, object_id):
+        try:
+            content_type = ContentType.objects \
+                .get_by_natural_key(Comment._meta.app_label, ct)
+            # hidden moment thread not found
+            content_object = threads.get_visible_targets(
+                content_type.model_class(),
+                request.user
+            ).get(guid=object_id)
+        except (ObjectDoesNotExist, DjangoValidationError):
+            raise NotFound(detail=_("Object not found"))
+
+        try:
+            replies = int(
+                request.query_params.get('replies')
+                or settings.SNAP_COMMENT_REPLIES
+            )
+        except ValueError as e:
+            raise ValidationError(detail=smart_str(e))
+        replies = max(1, min(replies, settings.SNAP_COMMENT_MAX_REPLIES))
+
+        queryset = threads.get_roots(
+            content_type.id,
+            content_object.id,
+            replies
+        ).select_related('user')
+
+        paginator = get_paginator(request)
+        roots = paginator.paginate_queryset(queryset, request)
+        threads.build_tree(roots, threads.get_first_replies(roots))
+
+        serializer = ThreadCommentSerializer(
+            roots,
+            context=self.context,
+            many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
     def list(self, request):
         ct = request.query_params.get('content_type')
+        object_id = request.query_params.get('object_id')
+        if ct and object_id:
+            return self._list_thread(request, ct, object_id)
+
         queryset = self.queryset().filter(
             content_type__model=ct,
             content_type__app_label=Comment._meta.app_label
         )
+        try:
+            content_type = ContentType.objects \
+                .get_by_natural_key(Comment._meta.app_label, ct)
+        except ObjectDoesNotExist:
+            pass
+        else:
+            queryset = queryset.filter(
+                threads.get_visible_q(content_type.model_class(), request.user)
+            )
 
-        paginate_queryset = PAGINATOR.paginate_queryset(queryset, request)
+        paginator = get_paginator(request)
+        paginate_queryset = paginator.paginate_queryset(queryset, request)
         serializer = ListCommentSerializer(
             paginate_queryset,
             context=self.context,
             many=True
         )
-        return PAGINATOR.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
     def retrieve(self, request, guid=None):
         try:
@@ -116,6 +179,13 @@ class CommentViewSet(viewsets.ViewSet, ThrottleViewSet):
         except Exception as e:
             raise ValidationError(detail=smart_str(e))
 
+        # comment of hidden moment not found
+        if not threads.get_visible_targets(
+            queryset.content_type.model_class(),
+            request.user
+        ).filter(id=queryset.object_id).exists():
+            raise NotFound(detail=_("Comment not found"))
+
         """
         d = queryset._meta.model.objects \
             .prefetch_related('user', 'content_type', 'child') \
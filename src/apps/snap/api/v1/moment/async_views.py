@@ -0,0 +1,86 @@
+from asgiref.sync import sync_to_async
+from redis.exceptions import RedisError
+
+from apps.core.api.views import AsyncAPIView
+from apps.snap import caches, feeds
+from .views import MomentViewSet
+
+
+class AsyncMomentView(AsyncAPIView):
+    """
+    GET (ASGI)
+    -------
+
+        Same params and responses as moments list and detail.
+        Response cache and nearby feed awaited on the event loop,
+        only database work run in a thread.
+
+    """
+    def get_viewset(self, request, action):
+        viewset = MomentViewSet(
+            action=action,
+            request=request,
+            args=self.args,
+            kwargs=self.kwargs,
+            format_kwarg=None
+        )
+        viewset.context.update({'request': request})
+        return viewset
+
+    async def get(self, request, guid=None):
+        if guid is not None:
+            return await self.retrieve(request, guid)
+        return await self.list(request)
+
+    async def list(self, request):
+        cache_key = await caches.aget_list_key(request)
+        cached = await caches.aget_response(cache_key)
+        if cached is not None:
+            data, headers = cached
+            return self.respond(data, headers={**headers, 'X-Cache': 'HIT'})
+
+        viewset = self.get_viewset(request, 'list')
+        if not viewset._get_planner().is_filtered \
+                and viewset._is_nearby_feed(request):
+            params = viewset._get_feed_params(request)
+            try:
+                entries = await feeds.aread_feed(
+                    params['latitude'],
+                    params['longitude'],
+                    params['limit'] + 1,
+                    before=params['before'],
+                    anonymous=not request.user.is_authenticated
+                )
+            except RedisError:
+                # fallback to database
+                entries = None
+
+            if entries is None:
+                # Redis down, feed not built yet or cells missing
+                response = await sync_to_async(viewset._list_database)(request)
+            else:
+                response = await sync_to_async(viewset._list_nearby_feed)(
+                    request,
+                    entries=entries
+                )
+        else:
+            response = await sync_to_async(viewset._list)(request)
+
+        await caches.aset_response(
+            cache_key,
+            response.data,
+            headers=caches.get_cached_headers(response)
+        )
+        return self.render_response(response, headers={'X-Cache': 'MISS'})
+
+    async def retrieve(self, request, guid):
+        cache_key = await caches.aget_detail_key(request, guid)
+        cached = await caches.aget_response(cache_key)
+        if cached is not None:
+            data, _headers = cached
+            return self.respond(data, headers={'X-Cache': 'HIT'})
+
+        viewset = self.get_viewset(request, 'retrieve')
+        data = await sync_to_async(viewset._retrieve)(request, guid)
+        await caches.aset_response(cache_key, data)
+        return self.respond(data, headers={'X-Cache': 'MISS'})
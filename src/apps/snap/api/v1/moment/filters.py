@@ -0,0 +1,245 @@
+import re
+import time
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+
+from apps.core.geo import bounding_box_q, geohash_q, haversine
+from apps.snap.conf import settings
+
+Location = apps.get_registered_model('snap', 'Location')
+Moment = apps.get_registered_model('snap', 'Moment')
+
+
+def querying_distance(queryset, latitude, longitude, radius=None):
+    """
+    Annotate `distance` (km) to the nearest moment location.
+
+    When `radius` given only moments with a location inside the
+    covering geohash cells (indexed prefix scans) and bounding box
+    are considered, exact haversine only computed for that candidates.
+    """
+    ct = ContentType.objects.get_for_model(Moment)
+    location = Location.objects.filter(content_type=ct)
+
+    if radius is not None:
+        location = location.filter(
+            geohash_q(latitude, longitude, radius),
+            bounding_box_q(latitude, longitude, radius)
+        )
+
+        # semi-join driven by the location index
+        queryset = queryset.filter(id__in=location.values('object_id'))
+
+    distance = location \
+        .filter(object_id=OuterRef('id')) \
+        .annotate(distance=haversine(latitude, longitude)) \
+        .order_by('distance')
+
+    queryset = queryset.annotate(
+        distance=Subquery(distance.values('distance')[:1])
+    )
+
+    if radius is not None:
+        queryset = queryset.filter(distance__lte=radius)
+    return queryset
+
+
+DURATION_RE = re.compile(r'^(\d+)([mhd])$')
+DURATION_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+def parse_time(value):
+    """
+    ISO 8601 datetime or duration ago (`30m`, `6h`, `7d`). Duration
+    counted from now rounded down to `SNAP_MOMENT_CACHE_TIMEOUT`, every
+    request of that period get the same window and cached page.
+    """
+    match = DURATION_RE.match(value)
+    if match:
+        amount, unit = match.groups()
+        step = max(settings.SNAP_MOMENT_CACHE_TIMEOUT, 1)
+        now = datetime.fromtimestamp(time.time() // step * step, tz=dt_timezone.utc)
+        return now - timedelta(**{DURATION_UNITS[unit]: int(amount)})
+
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(_("Invalid time {}, use ISO 8601 or 30m, 6h, 7d").format(value))
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class MomentQueryPlanner(object):
+    """
+    Combine `tags`, `since`/`until`, `user` and location radius filters.
+
+    Every filter has its own index (tagged items, create_at, user,
+    location geohash). Matching count of each one estimated first,
+    bounded to `SNAP_MOMENT_PLAN_MAX_CANDIDATES` so never a full scan,
+    then ids of the most selective filters fetched and intersected in
+    memory. Broader filters only probed for that candidates, distance
+    computed last for the moments left.
+
+    `plan` describe the steps, ie `tag:12 > time:340 > user:probe`.
+    Moment ids only read of moments `viewer` can see, anonymous viewer
+    on the (visibility, create_at, id) index.
+    """
+
+    def __init__(self, tags=None, since=None, until=None, user=None,
+                 latitude=None, longitude=None, radius=None,
+                 viewer=None) -> None:
+        self.tags = tags
+        self.since = since
+        self.until = until
+        self.user = user
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius = radius
+        self.viewer = viewer
+        self.limit = settings.SNAP_MOMENT_PLAN_MAX_CANDIDATES
+        self.steps = list()
+
+    @property
+    def has_location(self):
+        return self.latitude is not None and self.longitude is not None
+
+    @property
+    def is_filtered(self):
+        return bool(self.tags or self.since or self.until or self.user)
+
+    def get_tag_ids(self):
+        Tag = apps.get_registered_model('taggit', 'Tag')
+        q = Q()
+        for name in self.tags:
+            if getattr(settings, 'TAGGIT_CASE_INSENSITIVE', False):
+                q |= Q(name__iexact=name)
+            else:
+                q |= Q(name=name)
+        return list(Tag.objects.filter(q).values_list('id', flat=True))
+
+    def get_filters(self):
+        """
+        [(name, estimate, queryset, field)], `queryset` values
+        are moment ids of the filter `field`
+        """
+        moment_ct = ContentType.objects.get_for_model(Moment)
+        filters = list()
+
+        if self.tags:
+            TaggedItem = apps.get_registered_model('taggit', 'TaggedItem')
+            TagUsage = apps.get_registered_model('snap', 'TagUsage')
+            tag_ids = self.get_tag_ids()
+
+            # counter cache, estimate without touching tagged items.
+            # May drift, `get_candidates` never trust it for the fetch
+            estimate = TagUsage.objects \
+                .filter(tag_id__in=tag_ids, content_type=moment_ct) \
+                .aggregate(count=Sum('count'))['count'] or 0
+            queryset = TaggedItem.objects \
+                .filter(content_type=moment_ct, tag_id__in=tag_ids) \
+                .values_list('object_id', flat=True)
+            filters.append(('tag', estimate, queryset, 'object_id'))
+
+        visible_q = Moment.get_visible_q(self.viewer)
+        if self.since or self.until:
+            queryset = Moment.objects.filter(visible_q)
+            if self.since:
+                queryset = queryset.filter(create_at__gte=self.since)
+            if self.until:
+                queryset = queryset.filter(create_at__lt=self.until)
+            queryset = queryset.values_list('id', flat=True)
+            filters.append(('time', None, queryset, 'id'))
+
+        if self.user:
+            queryset = Moment.objects \
+                .filter(visible_q, user__guid=self.user) \
+                .values_list('id', flat=True)
+            filters.append(('user', None, queryset, 'id'))
+
+        if self.has_location and self.radius is not None:
+            queryset = Location.objects \
+                .filter(content_type=moment_ct) \
+                .filter(
+                    geohash_q(self.latitude, self.longitude, self.radius),
+                    bounding_box_q(self.latitude, self.longitude, self.radius)
+                ) \
+                .values_list('object_id', flat=True)
+            filters.append(('cell', None, queryset, 'object_id'))
+
+        # bounded count, index range stop after limit rows
+        return [
+            (
+                name,
+                estimate if estimate is not None
+                else queryset.order_by()[:self.limit + 1].count(),
+                queryset,
+                field
+            )
+            for name, estimate, queryset, field in filters
+        ]
+
+    def get_candidates(self, filters):
+        """
+        Moment ids matching every filter, most selective first.
+        None when a filter match more ids than its estimate told
+        (drifted tag usage), the database join them instead.
+        """
+        candidates = None
+        for name, estimate, queryset, field in filters:
+            if candidates is not None and estimate > self.limit:
+                # broad filter, only check the candidates
+                probe = list(candidates)
+                if field == 'object_id':
+                    # generic relation object id is a string
+                    probe = [str(value) for value in probe]
+                values = list(
+                    queryset.filter(**{'%s__in' % field: probe}).order_by()
+                )
+                self.steps.append('{}:probe'.format(name))
+            else:
+                values = list(queryset.order_by()[:self.limit + 1])
+                self.steps.append('{}:{}'.format(name, estimate))
+                if len(values) > self.limit:
+                    self.steps.append('{}:overflow'.format(name))
+                    return None
+
+            ids = {int(value) for value in values}
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                break
+        return candidates
+
+    def filter(self, queryset):
+        """Apply filters to the moments `queryset`, distance annotated"""
+        filters = sorted(self.get_filters(), key=lambda item: item[1])
+
+        candidates = None
+        if filters and filters[0][1] <= self.limit:
+            candidates = self.get_candidates(filters)
+
+        if candidates is not None:
+            queryset = queryset.filter(id__in=candidates)
+        else:
+            # nothing selective, database join them all
+            for name, _estimate, subquery, _field in filters:
+                queryset = queryset.filter(id__in=subquery)
+                self.steps.append('{}:scan'.format(name))
+
+        if self.has_location:
+            # exact distance only for the moments left
+            queryset = querying_distance(queryset, self.latitude, self.longitude)
+            if self.radius is not None:
+                queryset = queryset.filter(distance__lte=self.radius)
+            self.steps.append('distance')
+        return queryset
+
+    @property
+    def plan(self):
+        return ' > '.join(self.steps)
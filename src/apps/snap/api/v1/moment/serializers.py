@@ -1,22 +1,40 @@
+from collections import OrderedDict
+
 from django.apps import apps
+from django.db import models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 
 from rest_framework import serializers
+from rest_framework.fields import SkipField
 from taggit.serializers import (
     TagListSerializerField,
     TaggitSerializer
 )
+from eav.models import Attribute, Value
+from simple_history.utils import get_history_manager_for_model
 
+from apps.snap import caches, counters, feeds, search
+from apps.snap.conf import settings
+from apps.snap.models.device import DEVICE_ATTRIBUTES
+from apps.snap.models.utils import bulk_add_tags
 from ..attachment.serializers import ListAttachmentSerializer
 from ..location.serializers import ListLocationSerializer
-from ..attribute.serializers import AttributeSerializer
+from ..attribute.serializers import (
+    AttributeSerializer,
+    prepare_attributes,
+    resolve_device
+)
 
 UserModel = get_user_model()
 Moment = apps.get_registered_model('snap', 'Moment')
 Attachment = apps.get_registered_model('snap', 'Attachment')
 Location = apps.get_registered_model('snap', 'Location')
 With = apps.get_registered_model('snap', 'With')
+Device = apps.get_registered_model('snap', 'Device')
 
 
 class BaseMomentSerializer(TaggitSerializer, serializers.ModelSerializer):
@@ -25,7 +43,51 @@ class BaseMomentSerializer(TaggitSerializer, serializers.ModelSerializer):
         fields = '__all__'
 
 
+class MomentListSerializer(serializers.ListSerializer):
+    """Fetch cached fragments in one round-trip, build only the missing"""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        instances = list(iterable)
+        host = self.child.get_host()
+        fragments = caches.get_fragments(instances, host)
+
+        missing = [
+            instance for instance in instances
+            if instance.guid not in fragments
+        ]
+        if missing:
+            prefetch_related_objects(
+                missing,
+                *self.child.get_prefetch_lookups()
+            )
+            built = {
+                instance: self.child.to_fragment(instance)
+                for instance in missing
+            }
+            caches.set_fragments(built, host)
+            fragments.update({
+                instance.guid: fragment
+                for instance, fragment in built.items()
+            })
+
+        return [
+            self.child.merge_fragment(instance, fragments[instance.guid])
+            for instance in instances
+        ]
+
+
 class ListMomentSerializer(BaseMomentSerializer):
+    # computed every request, never cached in fragment
+    # (counters updated without touching `update_at`)
+    request_fields = (
+        '_links',
+        'distance',
+        'comment_count',
+        'attachment_count',
+        'with_count',
+    )
+
     _links = serializers.SerializerMethodField()
     user = serializers.StringRelatedField()
     tags = TagListSerializerField()
@@ -33,7 +95,7 @@ class ListMomentSerializer(BaseMomentSerializer):
     locations = ListLocationSerializer(many=True)
     attachments = ListAttachmentSerializer(
         many=True,
-        fields=['name', 'file', ]
+        fields=['name', 'file', 'renditions', ]
     )
     distance = serializers.FloatField(default=0)
 
@@ -49,7 +111,11 @@ class ListMomentSerializer(BaseMomentSerializer):
             'tags',
             'distance',
             'withs',
+            'comment_count',
+            'attachment_count',
+            'with_count',
         ]
+        list_serializer_class = MomentListSerializer
 
     def get__links(self, instance):
         request = self.context.get('request')
@@ -60,6 +126,53 @@ class ListMomentSerializer(BaseMomentSerializer):
         absolute_uri = request.build_absolute_uri(reverse_uri)
         return absolute_uri
 
+    def get_prefetch_lookups(self):
+        attachments = Attachment.objects.prefetch_related('locations', 'tags')
+        return [
+            'locations',
+            'tags',
+            'withs',
+            Prefetch('attachments', queryset=attachments),
+        ]
+
+    def get_host(self):
+        request = self.context.get('request')
+        return request.get_host() if request else None
+
+    def to_fragment(self, instance):
+        fragment = super().to_representation(instance)
+        for field_name in self.request_fields:
+            fragment.pop(field_name, None)
+        return fragment
+
+    def merge_fragment(self, instance, fragment):
+        ret = OrderedDict()
+        for field in self._readable_fields:
+            if field.field_name in fragment:
+                ret[field.field_name] = fragment[field.field_name]
+                continue
+
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+
+            ret[field.field_name] = None if attribute is None \
+                else field.to_representation(attribute)
+        return ret
+
+    def to_representation(self, instance):
+        host = self.get_host()
+        fragment = caches.get_fragments([instance], host).get(instance.guid)
+        if fragment is None:
+            prefetch_related_objects(
+                [instance],
+                *self.get_prefetch_lookups()
+            )
+            fragment = self.to_fragment(instance)
+            caches.set_fragments({instance: fragment}, host)
+        return self.merge_fragment(instance, fragment)
+
 
 class RetrieveMomentSerializer(ListMomentSerializer):
     _links = serializers.ReadOnlyField()
@@ -124,11 +237,7 @@ class CreateMomentSerializer(BaseMomentSerializer):
 
         # prepare attributes
         attributes = data.pop('attributes', None)
-        if attributes:
-            for attr in attributes:
-                obj = attr.get('slug')
-                value = attr.get('value_{}'.format(obj.datatype))
-                data.update({'eav__{}'.format(obj.slug): value})
+        data.update(prepare_attributes(attributes))
 
         return data
 
@@ -143,6 +252,7 @@ class CreateMomentSerializer(BaseMomentSerializer):
         locations = validated_data.pop('locations', None)
         attachments = validated_data.pop('attachments', None)
         withs = validated_data.pop('withs', None)
+        resolve_device(validated_data)
 
         instance = self.Meta.model.objects.create(**validated_data)
         if instance:
@@ -150,9 +260,22 @@ class CreateMomentSerializer(BaseMomentSerializer):
                 instance.locations.set(locations)
             if attachments:
                 instance.attachments.set(attachments)
+                if instance.device_id:
+                    # anonym attachments owned by the same device
+                    instance.attachments \
+                        .filter(device__isnull=True) \
+                        .update(device_id=instance.device_id)
+
+                # generic relation set() send no signal
+                counters.update_moment_counters(
+                    [instance.id],
+                    ['attachment_count']
+                )
             if withs:
                 instance.withs.set(withs)
 
+            transaction.on_commit(lambda: feeds.push_moment(instance))
+
         return instance
 
 
@@ -171,12 +294,335 @@ class UpdateMomentSerializer(CreateMomentSerializer):
         locations = validated_data.pop('locations', None)
         attachments = validated_data.pop('attachments', None)
         withs = validated_data.pop('withs', None)
+        # device attributes only prove ownership, device kept
+        validated_data.pop('device_attributes', None)
 
         if locations:
+            # move moment to their new feed cells
+            old_cells = feeds.moment_cells(instance)
             instance.locations.set(locations)
+            new_cells = feeds.moment_cells(instance)
+
+            def move_feed():
+                feeds.remove_moment(instance.id, old_cells - new_cells)
+                feeds.push_moment(instance, cells=new_cells)
+
+            transaction.on_commit(move_feed)
         if attachments:
             instance.attachments.set(attachments)
+
+            # generic relation set() send no signal
+            counters.update_moment_counters(
+                [instance.id],
+                ['attachment_count']
+            )
         if withs:
             instance.withs.set(withs)
 
         return super().update(instance, validated_data)
+
+
+class BulkAttributeSerializer(serializers.Serializer):
+    slug = serializers.SlugField()
+    value_text = serializers.CharField(required=False)
+    value_int = serializers.IntegerField(required=False)
+    value_float = serializers.FloatField(required=False)
+
+
+class BulkMomentItemSerializer(serializers.Serializer):
+    """One moment of bulk create, references resolved later in batch"""
+    title = serializers.CharField(max_length=255)
+    summary = serializers.CharField(
+        required=False,
+        allow_blank=True,
+        allow_null=True
+    )
+    locations = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False
+    )
+    attachments = serializers.ListField(
+        child=serializers.UUIDField(),
+        required=False
+    )
+    withs = serializers.ListField(
+        child=serializers.CharField(),
+        required=False
+    )
+    attributes = BulkAttributeSerializer(many=True, required=False)
+
+
+class BulkCreateMomentSerializer(serializers.Serializer):
+    """
+    Create many moments in one transaction. Every item validated on
+    its own and invalid items reported by their index, the valid
+    ones inserted with a fixed number of queries.
+    """
+    moments = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.SNAP_BULK_MAX_SIZE
+    )
+
+    def validate_items(self, moments):
+        items = dict()
+        errors = dict()
+
+        for index, data in enumerate(moments):
+            serializer = BulkMomentItemSerializer(data=data)
+            if serializer.is_valid():
+                items[index] = serializer.validated_data
+            else:
+                errors[index] = serializer.errors
+        return items, errors
+
+    def resolve_references(self, items, errors):
+        """
+        One query per reference type, free locations and attachments
+        only belong to the first moment referencing them.
+        """
+        def collect(name):
+            return {
+                value for item in items.values()
+                for value in item.get(name) or []
+            }
+
+        references = {
+            'locations': Location.objects
+            .filter(
+                guid__in=collect('locations'),
+                content_type__isnull=True,
+                object_id__isnull=True
+            )
+            .in_bulk(field_name='guid'),
+            'attachments': Attachment.objects
+            .filter(
+                guid__in=collect('attachments'),
+                content_type__isnull=True,
+                object_id__isnull=True
+            )
+            .in_bulk(field_name='guid'),
+            'withs': UserModel.objects
+            .filter(username__in=collect('withs'))
+            .in_bulk(field_name='username'),
+        }
+        attributes = {
+            attribute.slug: attribute for attribute in
+            Attribute.objects.filter(slug__in={
+                attr['slug'] for item in items.values()
+                for attr in item.get('attributes') or []
+            })
+        }
+
+        claimed = {'locations': set(), 'attachments': set()}
+        resolved = dict()
+
+        for index, item in items.items():
+            item_errors = dict()
+
+            for name, objs in references.items():
+                invalid = [
+                    str(value) for value in item.get(name) or []
+                    if value not in objs or value in claimed.get(name, ())
+                ]
+                if invalid:
+                    item_errors[name] = [
+                        _("Not found or already used: {}").format(
+                            ', '.join(invalid))
+                    ]
+
+            invalid = [
+                attr['slug'] for attr in item.get('attributes') or []
+                if attr['slug'] not in attributes
+            ]
+            if invalid:
+                item_errors['attributes'] = [
+                    _("Not found: {}").format(', '.join(invalid))
+                ]
+
+            if item_errors:
+                errors[index] = item_errors
+                continue
+
+            for name in claimed:
+                claimed[name].update(item.get(name) or [])
+
+            resolved[index] = {
+                'item': item,
+                'locations': [references['locations'][v] for v in item['locations']],
+                'attachments': [
+                    references['attachments'][v]
+                    for v in item.get('attachments') or []
+                ],
+                'withs': [
+                    references['withs'][v]
+                    for v in dict.fromkeys(item.get('withs') or [])
+                ],
+                'attributes': {
+                    attr['slug']: attr.get(
+                        'value_{}'.format(attributes[attr['slug']].datatype))
+                    for attr in item.get('attributes') or []
+                },
+            }
+        return resolved, attributes
+
+    def resolve_devices(self, resolved):
+        """Return {index: device_id}, devices bulk created"""
+        devices = dict()
+        for index, data in resolved.items():
+            device = Device.objects.make_device(data['attributes'])
+            if device:
+                devices[index] = device
+
+        if not devices:
+            return dict()
+
+        fingerprints = {device.fingerprint: device for device in devices.values()}
+        Device.objects.bulk_create(fingerprints.values(), ignore_conflicts=True)
+        ids = dict(
+            Device.objects
+            .filter(fingerprint__in=fingerprints)
+            .values_list('fingerprint', 'id')
+        )
+        return {
+            index: ids[device.fingerprint]
+            for index, device in devices.items()
+        }
+
+    def bulk_create_with_history(self, model, objs, user=None):
+        objs = model.objects.bulk_create(objs)
+
+        # some backends (ie MySQL) not return primary keys
+        if objs and objs[0].pk is None:
+            ids = dict(
+                model.objects
+                .filter(guid__in=[obj.guid for obj in objs])
+                .values_list('guid', 'id')
+            )
+            for obj in objs:
+                obj.pk = ids[obj.guid]
+
+        get_history_manager_for_model(model).bulk_history_create(
+            objs,
+            default_user=user
+        )
+        return objs
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        user = request.user if request and request.user.is_authenticated \
+            else None
+
+        items, errors = self.validate_items(validated_data['moments'])
+        resolved, attributes = self.resolve_references(items, errors)
+        devices = self.resolve_devices(resolved)
+
+        moments = {
+            index: Moment(
+                title=data['item']['title'],
+                summary=data['item'].get('summary'),
+                user=user,
+                device_id=devices.get(index),
+                visibility=Moment.get_visibility(user)
+            )
+            for index, data in resolved.items()
+        }
+        self.bulk_create_with_history(Moment, list(moments.values()), user)
+
+        content_type = ContentType.objects.get_for_model(Moment)
+        locations = list()
+        attachments = list()
+        withs = list()
+        values = list()
+
+        for index, moment in moments.items():
+            data = resolved[index]
+
+            for location in data['locations']:
+                location.content_type = content_type
+                location.object_id = moment.id
+                locations.append(location)
+
+            for attachment in data['attachments']:
+                attachment.content_type = content_type
+                attachment.object_id = moment.id
+                if attachment.device_id is None:
+                    attachment.device_id = moment.device_id
+                attachments.append(attachment)
+
+            for with_user in data['withs']:
+                withs.append(With(user=with_user, moment=moment))
+
+            for slug, value in data['attributes'].items():
+                if slug in DEVICE_ATTRIBUTES:
+                    continue
+
+                attribute = attributes[slug]
+                values.append(Value(**{
+                    'entity_ct': content_type,
+                    'entity_id': moment.id,
+                    'attribute': attribute,
+                    'value_{}'.format(attribute.datatype): value,
+                }))
+
+        Location.objects.bulk_update(locations, ['content_type', 'object_id'])
+        Attachment.objects.bulk_update(
+            attachments,
+            ['content_type', 'object_id', 'device']
+        )
+        self.bulk_create_with_history(With, withs, user)
+        Value.objects.bulk_create(values)
+        bulk_add_tags({moment: moment.get_tags() for moment in moments.values()})
+        counters.update_moment_counters(
+            [moment.id for moment in moments.values()]
+        )
+
+        # signals not sent by bulk queries
+        precision = settings.SNAP_FEED_PRECISION
+        cells = {
+            moment: {
+                location.geohash[:precision]
+                for location in resolved[index]['locations']
+                if location.geohash
+            }
+            for index, moment in moments.items()
+        }
+
+        def on_commit():
+            for moment, moment_cells in cells.items():
+                feeds.push_moment(moment, cells=moment_cells)
+            caches.invalidate_moments()
+
+        transaction.on_commit(on_commit)
+        # attachments claimed above reindexed with their moment
+        search.schedule_index(Moment, [moment.id for moment in moments.values()])
+
+        self.errors_by_index = errors
+        return moments
+
+    def to_representation(self, instance):
+        """`instance` is {index: moment} of created moments"""
+        queryset = Moment.objects \
+            .select_related('user') \
+            .filter(id__in=[moment.id for moment in instance.values()])
+        moments = {moment.id: moment for moment in queryset}
+        indexes = {moment.id: index for index, moment in instance.items()}
+        ordered = sorted(moments.values(), key=lambda m: indexes[m.id])
+
+        serializer = ListMomentSerializer(
+            ordered,
+            context=self.context,
+            many=True
+        )
+        results = list()
+        for moment, data in zip(ordered, serializer.data):
+            results.append({'index': indexes[moment.id], **data})
+
+        return {
+            'results': results,
+            'errors': [
+                {'index': index, 'errors': item_errors}
+                for index, item_errors in
+                sorted(getattr(self, 'errors_by_index', {}).items())
+            ],
+        }
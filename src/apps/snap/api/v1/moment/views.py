@@ -1,4 +1,5 @@
 from copy import copy
+from uuid import UUID
 
 from django.db import transaction
 from django.core.exceptions import (
@@ -8,17 +9,21 @@ from django.core.exceptions import (
 from django.utils.encoding import smart_str
 from django.utils.translation import gettext_lazy as _
 from django.apps import apps
-from django.db.models.functions import ACos, Cos, Sin, Radians
-from django.db.models.expressions import OuterRef, Subquery
-from django.db.models import F, Value, FloatField
 
 from rest_framework import viewsets, status as response_status
+from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
 from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.response import Response
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.utils.urls import replace_query_param
+from redis.exceptions import RedisError
 
+from apps.core.api.pagination import KeysetPagination, get_paginator
+from apps.snap import caches, feeds
+from apps.snap.conf import settings
+from .filters import MomentQueryPlanner, parse_time, querying_distance
 from .serializers import (
+    BulkCreateMomentSerializer,
     CreateMomentSerializer,
     UpdateMomentSerializer,
     ListMomentSerializer,
@@ -27,15 +32,10 @@ from .serializers import (
 from ..utils import ThrottleViewSet
 from ..permissions import IsMomentOwnerOrReject
 
-USE_KILOMETER = 6371
-USE_MILE = 3959
-PAGINATOR = LimitOffsetPagination()
-
-Location = apps.get_registered_model('snap', 'Location')
 Moment = apps.get_registered_model('snap', 'Moment')
 
 
-class MomentViewSet(viewsets.ViewSet, ThrottleViewSet):
+class MomentViewSet(ThrottleViewSet, viewsets.ViewSet):
     """
     POST
     -------
@@ -58,15 +58,46 @@ class MomentViewSet(viewsets.ViewSet, ThrottleViewSet):
         owned their moment. Especially start with `device_<param>`
 
 
+    POST bulk/
+    -------
+
+        {
+            "moments": [<moment as POST above>]
+        }
+
+        Note:
+        Valid moments created, invalid ones reported in `errors`
+        by their index
+
+
     GET
     -------
 
         {
-            "radius": "in km <integer>"
+            "latitude": "<float>",
+            "longitude": "<float>",
+            "radius": "in km <integer>",
+            "limit": "<integer>",
+            "cursor": "<string>",
+            "feed": "nearby",
+            "tags": "<string>,<string>",
+            "since": "<ISO 8601 datetime> or 30m|6h|7d ago",
+            "until": "<ISO 8601 datetime> or 30m|6h|7d ago",
+            "user": "<guid>"
         }
 
+        Note:
+        `limit` or `offset` without `cursor` use limit/offset pagination,
+        send `cursor` (empty for the first page) to use `limit` with cursor
+        `feed=nearby` return newest moments around latitude and longitude
+        (paginate with `before`)
+        `tags` match moments with any of that tags, combined with `since`,
+        `until`, `user` and radius filters the most selective one applied
+        first, steps returned in `X-Query-Plan` header
+
     """
     lookup_field = 'guid'
+    throttle_scope = 'moment'
     permission_classes = (AllowAny,)
     permission_action = {
         'partial_update': (IsMomentOwnerOrReject,),
@@ -89,46 +120,82 @@ class MomentViewSet(viewsets.ViewSet, ThrottleViewSet):
             # action is not set return default permission_classes
             return [permission() for permission in self.permission_classes]
 
-    def _querying_distance(self, queryset):
-        max_radius = 5000000
+    def _querying_distance(self, queryset, with_radius=True):
         request = self.request
         latitude = request.query_params.get('latitude')
         longitude = request.query_params.get('longitude')
+        radius = request.query_params.get('radius')
 
         if latitude and longitude:
+            try:
+                latitude = float(latitude)
+                longitude = float(longitude)
+                radius = float(radius or settings.SNAP_MOMENT_RADIUS)
+            except ValueError as e:
+                raise ValidationError(detail=smart_str(e))
+
             # calculate distance based on current user location
             # by their latitude and longitude
-            calculate_distance = Value(USE_KILOMETER) * ACos(
-                Cos(Radians(float(latitude), output_field=FloatField()))
-                * Cos(Radians(F('latitude'), output_field=FloatField()))
-                * Cos(
-                    Radians(F('longitude'), output_field=FloatField())
-                    - Radians(float(longitude), output_field=FloatField())
-                )
-                + Sin(Radians(float(latitude), output_field=FloatField()))
-                * Sin(Radians(F('latitude'), output_field=FloatField())),
-                output_field=FloatField()
+            queryset = querying_distance(
+                queryset,
+                latitude,
+                longitude,
+                radius=min(radius, settings.SNAP_MOMENT_MAX_RADIUS)
+                if with_radius else None
             )
-            location = Location.objects.filter(
-                object_id=OuterRef('id'),
-                content_type__model=Moment._meta.model_name
-            ).annotate(distance=calculate_distance)
-
-            queryset = queryset.annotate(
-                distance=Subquery(location.values('distance')[:1])
-            ).filter(distance__lte=max_radius)
 
         return queryset
 
+    def _get_planner(self):
+        params = self.request.query_params
+        tags = [
+            name.strip().lstrip('#')
+            for name in params.get('tags', '').split(',')
+            if name.strip().lstrip('#')
+        ]
+
+        try:
+            since = parse_time(params['since']) if params.get('since') else None
+            until = parse_time(params['until']) if params.get('until') else None
+            user = UUID(params['user']) if params.get('user') else None
+        except ValueError as e:
+            raise ValidationError(detail=smart_str(e))
+
+        location = dict()
+        if params.get('latitude') and params.get('longitude'):
+            try:
+                location = {
+                    'latitude': float(params['latitude']),
+                    'longitude': float(params['longitude']),
+                    'radius': min(
+                        float(params.get('radius') or settings.SNAP_MOMENT_RADIUS),
+                        settings.SNAP_MOMENT_MAX_RADIUS
+                    ),
+                }
+            except ValueError as e:
+                raise ValidationError(detail=smart_str(e))
+
+        return MomentQueryPlanner(
+            tags=tags,
+            since=since,
+            until=until,
+            user=user,
+            viewer=self.request.user,
+            **location
+        )
+
     def initialize_request(self, request, *args, **kwargs):
         self.context.update({'request': request})
         return super().initialize_request(request, *args, **kwargs)
 
     def queryset(self):
+        # relations prefetched by serializer only for moments
+        # not in fragment cache, fixed number of queries whatever
+        # the page size (see `check_moment_queries` command).
+        # Anonymous viewer filtered on visibility index
         return Moment.objects \
-            .prefetch_related('user', 'attachments', 'attachments__locations',
-                              'locations', 'tags', 'withs') \
-            .select_related('user')
+            .select_related('user') \
+            .filter(Moment.get_visible_q(self.request.user))
 
     def get_instance(self, guid, is_update=False):
         try:
@@ -138,21 +205,161 @@ class MomentViewSet(viewsets.ViewSet, ThrottleViewSet):
         except ObjectDoesNotExist:
             raise NotFound(detail=_("Moment not found"))
 
+    def _is_nearby_feed(self, request):
+        params = request.query_params
+        return params.get('feed') == 'nearby' \
+            and params.get('latitude') and params.get('longitude')
+
+    def _get_feed_params(self, request):
+        before = request.query_params.get('before')
+        try:
+            return {
+                'latitude': float(request.query_params.get('latitude')),
+                'longitude': float(request.query_params.get('longitude')),
+                'limit': KeysetPagination().get_limit(request),
+                'before': float(before) if before else None,
+            }
+        except ValueError as e:
+            raise ValidationError(detail=smart_str(e))
+
+    def _list_nearby_feed(self, request, entries=None):
+        """
+        `entries` read by the async view, else read here.
+        Database read when the feed has no entries for the cells.
+        """
+        params = self._get_feed_params(request)
+        latitude = params['latitude']
+        longitude = params['longitude']
+        limit = params['limit']
+
+        if entries is None:
+            entries = feeds.read_feed(
+                latitude,
+                longitude,
+                limit + 1,
+                before=params['before'],
+                anonymous=not request.user.is_authenticated
+            )
+        if entries is None:
+            # feed not built yet or cells missing
+            return self._list_database(request)
+        ids = [moment_id for moment_id, _score in entries[:limit]]
+
+        # only compute distance for moments in this page
+        moments = {
+            moment.id: moment for moment in
+            querying_distance(
+                self.queryset().filter(id__in=ids),
+                latitude,
+                longitude
+            )
+        }
+        page = [moments[moment_id] for moment_id in ids if moment_id in moments]
+
+        next_link = None
+        if len(entries) > limit:
+            next_link = replace_query_param(
+                request.build_absolute_uri(),
+                'before',
+                repr(entries[limit - 1][1])
+            )
+
+        serializer = ListMomentSerializer(
+            page,
+            context=self.context,
+            many=True
+        )
+        return Response({'next': next_link, 'results': serializer.data})
+
     def list(self, request):
+        cache_key = caches.get_list_key(request)
+        cached = caches.get_response(cache_key)
+        if cached is not None:
+            data, headers = cached
+            return Response(data, headers={**headers, 'X-Cache': 'HIT'})
+
+        response = self._list(request)
+        caches.set_response(
+            cache_key,
+            response.data,
+            headers=caches.get_cached_headers(response)
+        )
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def _list(self, request):
+        planner = self._get_planner()
+        if planner.is_filtered:
+            return self._list_planned(request, planner)
+
+        if self._is_nearby_feed(request):
+            try:
+                return self._list_nearby_feed(request)
+            except RedisError:
+                # fallback to database
+                pass
+        return self._list_database(request)
+
+    def _list_database(self, request):
         queryset = self._querying_distance(self.queryset())
-        paginate_queryset = PAGINATOR.paginate_queryset(queryset, request)
+
+        # nearest first when sorted by distance
+        ordering = None
+        if 'distance' in queryset.query.annotations:
+            ordering = ('distance', 'id')
+
+        paginator = get_paginator(request, ordering=ordering)
+        paginate_queryset = paginator.paginate_queryset(queryset, request)
+        serializer = ListMomentSerializer(
+            paginate_queryset,
+            context=self.context,
+            many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    def _list_planned(self, request, planner):
+        queryset = planner.filter(self.queryset())
+
+        # nearest first when sorted by distance
+        ordering = ('distance', 'id') if planner.has_location else None
+        paginator = get_paginator(request, ordering=ordering)
+        paginate_queryset = paginator.paginate_queryset(queryset, request)
         serializer = ListMomentSerializer(
             paginate_queryset,
             context=self.context,
             many=True
         )
-        return PAGINATOR.get_paginated_response(serializer.data)
+        response = paginator.get_paginated_response(serializer.data)
+        response['X-Query-Plan'] = planner.plan
+        return response
 
     def retrieve(self, request, guid=None):
+        cache_key = caches.get_detail_key(request, guid)
+        cached = caches.get_response(cache_key)
+        if cached is not None:
+            data, _headers = cached
+            return Response(
+                data,
+                status=response_status.HTTP_200_OK,
+                headers={'X-Cache': 'HIT'}
+            )
+
+        data = self._retrieve(request, guid)
+        caches.set_response(cache_key, data)
+        return Response(
+            data,
+            status=response_status.HTTP_200_OK,
+            headers={'X-Cache': 'MISS'}
+        )
+
+    def _retrieve(self, request, guid):
         try:
-            queryset = self._querying_distance(self.queryset()).get(guid=guid)
+            queryset = self._querying_distance(
+                self.queryset(),
+                with_radius=False
+            ).get(guid=guid)
         except ObjectDoesNotExist:
-            return NotFound(detail=_("Moment not found"))
+            raise NotFound(detail=_("Moment not found"))
         except Exception as e:
             raise ValidationError(detail=smart_str(e))
 
@@ -160,7 +367,7 @@ class MomentViewSet(viewsets.ViewSet, ThrottleViewSet):
             instance=queryset,
             context=self.context
         )
-        return Response(serializer.data, status=response_status.HTTP_200_OK)
+        return serializer.data
 
     @transaction.atomic
     def create(self, request):
@@ -182,6 +389,33 @@ class MomentViewSet(viewsets.ViewSet, ThrottleViewSet):
             status=response_status.HTTP_403_FORBIDDEN
         )
 
+    @transaction.atomic
+    @action(
+        detail=False,
+        methods=['POST'],
+        url_name='bulk',
+        url_path='bulk'
+    )
+    def bulk_create(self, request):
+        serializer = BulkCreateMomentSerializer(
+            data=request.data,
+            context=self.context
+        )
+        if serializer.is_valid(raise_exception=True):
+            try:
+                serializer.save()
+            except DjangoValidationError as e:
+                raise ValidationError(smart_str(e))
+
+            status = response_status.HTTP_201_CREATED
+            if not serializer.data['results']:
+                status = response_status.HTTP_400_BAD_REQUEST
+            return Response(serializer.data, status=status)
+        return Response(
+            serializer.errors,
+            status=response_status.HTTP_403_FORBIDDEN
+        )
+
     @transaction.atomic
     def partial_update(self, request, guid=None):
         instance = self.get_instance(guid, is_update=True)
@@ -1,40 +1,44 @@
 import json
 
-from django.db.models import Q
+from django.apps import apps
 from rest_framework import permissions
 
+Device = apps.get_registered_model('snap', 'Device')
+
+
+def get_request_attributes(request):
+    """Return {slug: value} of attributes sent by anonym user"""
+    attributes = request.data.get('attributes')
+    if not attributes and request.method == 'DELETE':
+        body_unicode = request.body.decode('utf-8')
+        if body_unicode:
+            body = json.loads(body_unicode)
+            attributes = body.get('attributes')
+
+    data = dict()
+    for attr in attributes or []:
+        if not isinstance(attr, dict):
+            continue
+
+        for key, value in attr.items():
+            if key.startswith('value_'):
+                data[attr.get('slug')] = value
+                break
+    return data
+
 
 class IsMomentOwnerOrReject(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # todo permission by attribute
         if request.user.is_authenticated and hasattr(obj.user, 'id'):
             return obj.user.id == request.user.id
         else:
-            attributes = request.data.get('attributes')
-            if not attributes and request.method == 'DELETE':
-                body_unicode = request.body.decode('utf-8')
-                if body_unicode:
-                    body = json.loads(body_unicode)
-                    attributes = body.get('attributes')
-
-            if not attributes:
-                return False
-
-            attr_q = Q()
-            for attr in attributes:
-                slug = attr.get('slug')
-                key = 'eav__{}'.format(slug)
-                attr_q &= Q(**{
-                    key: v for k, v in attr.items()
-                })
-
-            if not attr_q:
+            if not obj.device_id:
                 return False
 
-            return obj.eav_values \
-                .prefetch_related('attribute') \
-                .select_related('attribute') \
-                .exists()
+            return Device.objects.is_match(
+                obj.device_id,
+                get_request_attributes(request)
+            )
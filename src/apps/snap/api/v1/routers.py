@@ -2,18 +2,31 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .moment.views import MomentViewSet
+from .moment.async_views import AsyncMomentView
 from .attachment.views import AttachmentViewSet
 from .comment.views import CommentViewSet
 from .location.views import LocationViewSet
+from .search.views import SearchViewSet
 from .tag.views import MomentTagListView
+from .tag.async_views import AsyncMomentTagListView
 
 router = DefaultRouter(trailing_slash=True)
 router.register('moments', MomentViewSet, basename='moment')
 router.register('attachments', AttachmentViewSet, basename='attachment')
 router.register('comments', CommentViewSet, basename='comment')
 router.register('locations', LocationViewSet, basename='location')
+router.register('search', SearchViewSet, basename='search')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('tags/', MomentTagListView.as_view(), name='tag-list'),
+
+    # async read path, served natively when run under ASGI
+    path('async/moments/', AsyncMomentView.as_view(), name='moment-list-async'),
+    path(
+        'async/moments/<str:guid>/',
+        AsyncMomentView.as_view(),
+        name='moment-detail-async'
+    ),
+    path('async/tags/', AsyncMomentTagListView.as_view(), name='tag-list-async'),
 ]
@@ -0,0 +1,40 @@
+from django.apps import apps
+from django.urls import reverse_lazy
+
+from rest_framework import serializers
+
+SearchDocument = apps.get_registered_model('snap', 'SearchDocument')
+
+# detail route of every searchable type
+DETAIL_ROUTES = {
+    'moment': 'snap_api:moment-detail',
+    'attachment': 'snap_api:attachment-download',
+    'comment': 'snap_api:comment-detail',
+}
+
+
+class SearchResultSerializer(serializers.ModelSerializer):
+    _links = serializers.SerializerMethodField()
+    type = serializers.CharField(source='content_type.model')
+    guid = serializers.UUIDField(source='object_guid')
+    moment = serializers.UUIDField(source='moment.guid', default=None)
+    score = serializers.FloatField()
+
+    class Meta:
+        model = SearchDocument
+        fields = [
+            '_links',
+            'type',
+            'guid',
+            'moment',
+            'text',
+            'score',
+        ]
+
+    def get__links(self, instance):
+        request = self.context.get('request')
+        reverse_uri = reverse_lazy(
+            DETAIL_ROUTES[instance.content_type.model],
+            kwargs={'guid': instance.object_guid}
+        )
+        return request.build_absolute_uri(reverse_uri)
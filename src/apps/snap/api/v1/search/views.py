@@ -0,0 +1,95 @@
+from django.utils.encoding import smart_str
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny
+
+from apps.core.api.pagination import KeysetPagination
+from apps.snap import search
+from apps.snap.conf import settings
+from ..utils import ThrottleViewSet
+from .serializers import SearchResultSerializer
+
+
+class SearchViewSet(ThrottleViewSet, viewsets.ViewSet):
+    """
+    GET
+    -------
+
+        {
+            "q": "<string>",
+            "type": "moment,attachment,comment",
+            "tag": "<string>",
+            "latitude": "<float>",
+            "longitude": "<float>",
+            "radius": "in km <integer>",
+            "limit": "<integer>"
+        }
+
+        Note:
+        Terms of `q` matched against moment title and summary,
+        attachment caption and comment content, results ranked by
+        relevance and cursor paginated. `#tag` in `q` match the
+        hashtag only, `tag` keep results having that hashtag.
+        Anonymous get only what anonymous users posted.
+
+    """
+    permission_classes = (AllowAny,)
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.context = dict()
+
+    def initialize_request(self, request, *args, **kwargs):
+        self.context.update({'request': request})
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_location(self, request):
+        latitude = request.query_params.get('latitude')
+        longitude = request.query_params.get('longitude')
+        radius = request.query_params.get('radius')
+
+        if not (latitude and longitude):
+            return dict()
+
+        try:
+            return {
+                'latitude': float(latitude),
+                'longitude': float(longitude),
+                'radius': min(
+                    float(radius or settings.SNAP_MOMENT_RADIUS),
+                    settings.SNAP_MOMENT_MAX_RADIUS
+                ),
+            }
+        except ValueError as e:
+            raise ValidationError(detail=smart_str(e))
+
+    def list(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError(detail=_("Param q required"))
+
+        types = request.query_params.get('type')
+        if types:
+            types = types.split(',')
+            if set(types) - set(search.SEARCH_FIELDS):
+                raise ValidationError(detail=_("Type must be one of {}").format(
+                    ', '.join(search.SEARCH_FIELDS)))
+
+        queryset = search.search(
+            query,
+            viewer=request.user,
+            types=types,
+            tag=request.query_params.get('tag'),
+            **self.get_location(request)
+        ).select_related('moment')
+
+        paginator = KeysetPagination(ordering=('-score', '-id'))
+        page = paginator.paginate_queryset(queryset, request)
+        serializer = SearchResultSerializer(
+            page,
+            context=self.context,
+            many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
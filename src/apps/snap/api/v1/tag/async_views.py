@@ -0,0 +1,46 @@
+from asgiref.sync import sync_to_async
+from redis.exceptions import RedisError
+
+from apps.core.api.views import AsyncAPIView
+from apps.snap import trending
+from .views import MomentTagListView
+
+
+class AsyncMomentTagListView(AsyncAPIView):
+    """
+    GET (ASGI)
+    -------
+
+        Same params and responses as tags list, trending
+        window read from Redis on the event loop.
+
+    """
+
+    def get_view(self, request):
+        return MomentTagListView(
+            request=request,
+            args=self.args,
+            kwargs=self.kwargs,
+            format_kwarg=None
+        )
+
+    async def get(self, request):
+        view = self.get_view(request)
+        window = request.query_params.get('window')
+        if not window:
+            # counter table, database only
+            response = await sync_to_async(view.list)(request)
+            return self.render_response(response)
+
+        limit, latitude, longitude = view._get_trending_params(request, window)
+        try:
+            tags = await trending.aread_trending(window, limit, latitude, longitude)
+        except RedisError:
+            # fallback to database
+            tags = await sync_to_async(view._read_trending_database)(
+                window,
+                limit,
+                latitude,
+                longitude
+            )
+        return self.respond(view._get_trending_data(window, tags))
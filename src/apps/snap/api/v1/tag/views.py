@@ -1,13 +1,22 @@
 from django.apps import apps
-from django.db.models import Count
-from django.core.exceptions import FieldError
+from django.db.models import Count, F, Q, Sum
+from django.core.exceptions import FieldError, ObjectDoesNotExist
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
 from django.utils.encoding import smart_str
+from django.utils.translation import gettext_lazy as _
 
 from rest_framework import status as response_status
 from rest_framework.viewsets import generics
 from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from redis.exceptions import RedisError
 
+from apps.core.geo import geohash_neighbours
+from apps.core.api.pagination import KeysetPagination
+from apps.snap import trending
+from apps.snap.conf import settings
 from .serializers import ListTagSerializer
 
 Tag = apps.get_registered_model('taggit', 'Tag')
@@ -16,11 +25,95 @@ Attachment = apps.get_registered_model('snap', 'Attachment')
 
 
 class MomentTagListView(generics.ListAPIView):
+    """
+    GET
+    -------
+
+        {
+            "source": "moment|attachment",
+            "window": "24h|7d",
+            "latitude": "<float>",
+            "longitude": "<float>",
+            "limit": "<integer>"
+        }
+
+        Note:
+        Without `window` counts read from `TagUsage` counter table,
+        with `window` return trending moment tags in that window
+        (near latitude and longitude if sent)
+
+    """
     queryset = Tag.objects.all()
     serializer_class = ListTagSerializer
     permission_classes = (AllowAny, )
 
+    def _read_trending_database(self, window, limit, latitude, longitude):
+        period, count = trending.WINDOWS[window]
+        _format, length, _expire = trending.PERIODS[period]
+        since = timezone.now() - length * count
+
+        queryset = Moment.objects.filter(create_at__gte=since)
+        if latitude is not None:
+            precision = settings.SNAP_TRENDING_PRECISION
+            cells = Q()
+            for cell in geohash_neighbours(latitude, longitude, precision):
+                cells |= Q(locations__geohash__startswith=cell)
+            queryset = queryset.filter(cells)
+
+        return list(
+            Tag.objects
+            .filter(moment__in=queryset.values('id'))
+            .annotate(count=Count('moment', distinct=True))
+            .order_by('-count', 'id')
+            .values_list('name', 'count')[:limit]
+        )
+
+    def _get_trending_params(self, request, window):
+        """(limit, latitude, longitude) of a trending read"""
+        if window not in trending.WINDOWS:
+            raise ValidationError(
+                detail=_("window must be one of {}").format(
+                    ', '.join(trending.WINDOWS))
+            )
+
+        latitude = request.query_params.get('latitude')
+        longitude = request.query_params.get('longitude')
+        try:
+            latitude = float(latitude) if latitude else None
+            longitude = float(longitude) if longitude else None
+        except ValueError as e:
+            raise ValidationError(detail=smart_str(e))
+        if latitude is None or longitude is None:
+            latitude = longitude = None
+
+        return KeysetPagination().get_limit(request), latitude, longitude
+
+    def list_trending(self, request, window):
+        limit, latitude, longitude = self._get_trending_params(request, window)
+        try:
+            tags = trending.read_trending(window, limit, latitude, longitude)
+        except RedisError:
+            # fallback to database
+            tags = self._read_trending_database(
+                window,
+                limit,
+                latitude,
+                longitude
+            )
+
+        return Response(self._get_trending_data(window, tags))
+
+    def _get_trending_data(self, window, tags):
+        return {
+            'window': window,
+            'results': [{'name': name, 'count': count} for name, count in tags],
+        }
+
     def list(self, request, *args, **kwargs):
+        window = request.query_params.get('window')
+        if window:
+            return self.list_trending(request, window)
+
         try:
             return super().list(request, *args, **kwargs)
         except FieldError as e:
@@ -34,12 +127,22 @@ class MomentTagListView(generics.ListAPIView):
         qs = self.queryset
 
         if source:
-            qs_filter = {'{}__isnull'.format(source): False}
-            qs = qs.filter(**qs_filter) \
-                .annotate(count=Count(source)) \
-                .order_by('-count') \
-                .distinct()
+            try:
+                content_type = ContentType.objects.get_by_natural_key(
+                    Moment._meta.app_label,
+                    source
+                )
+            except ObjectDoesNotExist:
+                raise FieldError(
+                    "Cannot resolve keyword '{}' into field.".format(source)
+                )
+
+            qs = qs.filter(
+                usages__content_type=content_type,
+                usages__count__gt=0
+            ).annotate(count=F('usages__count'))
         else:
-            qs = qs.annotate(count=Count('taggit_taggeditem_items'))
+            qs = qs.filter(usages__count__gt=0) \
+                .annotate(count=Sum('usages__count'))
 
-        return qs
+        return qs.order_by('-count', 'id')
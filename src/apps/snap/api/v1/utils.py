@@ -1,12 +1,24 @@
-from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+from apps.core.api.throttling import (
+    AnonRateThrottle,
+    RedisThrottleMixin,
+    ScopedRateThrottle,
+    UserRateThrottle
+)
 
 
-class ThrottleViewSet(object):
+class ThrottleViewSet(RedisThrottleMixin):
     def get_throttles(self):
-        super().get_throttles()
+        if self.action in [
+            'create',
+            'bulk_create',
+            'partial_update',
+            'destroy',
+            'upload_init',
+            'upload_complete',
+        ]:
+            # `throttle_scope` of the viewset limit writes per endpoint
+            throttle_classes = (AnonRateThrottle, UserRateThrottle, ScopedRateThrottle, )
+            return [throttle() for throttle in throttle_classes]
 
-        if self.action in ['create', 'partial_update', 'destroy']:
-            throttle_classes = (AnonRateThrottle, UserRateThrottle, )
-        else:
-            throttle_classes = []
-        return [throttle() for throttle in throttle_classes]
+        # reads limited by the default throttles
+        return super().get_throttles()
@@ -1,7 +1,123 @@
 from django.apps import AppConfig
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete
+)
 
 
 class SnapConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.snap'
     label = 'snap'
+
+    def ready(self) -> None:
+        from . import signals
+        from . import models
+
+        pre_delete.connect(
+            signals.moment_delete_handler,
+            dispatch_uid='moment_delete_handler',
+            sender=models.Moment
+        )
+
+        # response cache invalidation
+        for signal in (post_save, post_delete):
+            signal.connect(
+                signals.moment_cache_handler,
+                dispatch_uid='moment_cache_handler',
+                sender=models.Moment
+            )
+            signal.connect(
+                signals.moment_related_cache_handler,
+                dispatch_uid='location_cache_handler',
+                sender=models.Location
+            )
+            signal.connect(
+                signals.moment_related_cache_handler,
+                dispatch_uid='attachment_cache_handler',
+                sender=models.Attachment
+            )
+            signal.connect(
+                signals.with_cache_handler,
+                dispatch_uid='with_cache_handler',
+                sender=models.With
+            )
+
+        # denormalized counters
+        post_save.connect(
+            signals.comment_counter_handler,
+            dispatch_uid='comment_counter_handler',
+            sender=models.Comment
+        )
+        post_save.connect(
+            signals.with_counter_handler,
+            dispatch_uid='with_counter_handler',
+            sender=models.With
+        )
+        for signal in (post_save, post_delete):
+            signal.connect(
+                signals.attachment_counter_handler,
+                dispatch_uid='attachment_counter_handler',
+                sender=models.Attachment
+            )
+        post_delete.connect(
+            signals.comment_counter_handler,
+            dispatch_uid='comment_delete_counter_handler',
+            sender=models.Comment
+        )
+        post_delete.connect(
+            signals.with_counter_handler,
+            dispatch_uid='with_delete_counter_handler',
+            sender=models.With
+        )
+        m2m_changed.connect(
+            signals.withs_m2m_counter_handler,
+            dispatch_uid='withs_counter_handler',
+            sender=models.Moment.withs.through
+        )
+        m2m_changed.connect(
+            signals.tags_m2m_counter_handler,
+            dispatch_uid='tags_counter_handler',
+            sender=models.Moment.tags.through
+        )
+        for model in (models.Moment, models.Attachment):
+            pre_delete.connect(
+                signals.tagged_pre_delete_handler,
+                dispatch_uid='{}_tagged_pre_delete_handler'.format(
+                    model._meta.model_name),
+                sender=model
+            )
+            post_delete.connect(
+                signals.tagged_post_delete_handler,
+                dispatch_uid='{}_tagged_post_delete_handler'.format(
+                    model._meta.model_name),
+                sender=model
+            )
+
+        m2m_changed.connect(
+            signals.m2m_cache_handler,
+            dispatch_uid='tags_cache_handler',
+            sender=models.Moment.tags.through
+        )
+        m2m_changed.connect(
+            signals.m2m_cache_handler,
+            dispatch_uid='withs_cache_handler',
+            sender=models.Moment.withs.through
+        )
+
+        # full-text search index
+        for model in (models.Moment, models.Attachment, models.Comment):
+            post_save.connect(
+                signals.search_index_handler,
+                dispatch_uid='{}_search_index_handler'.format(
+                    model._meta.model_name),
+                sender=model
+            )
+            post_delete.connect(
+                signals.search_delete_handler,
+                dispatch_uid='{}_search_delete_handler'.format(
+                    model._meta.model_name),
+                sender=model
+            )
@@ -0,0 +1,349 @@
+"""
+Moment response and fragment cache
+
+Cache key contain a generation number, invalidation only bump the
+generation so every stale key simply never read again (expired by timeout).
+List pages share one generation, detail pages have generation per moment.
+
+Fragment is the serialized moment without per-request fields, keyed
+by the moment `version` and valid as long as `update_at` (and request
+host, file urls are absolute) not changed. Relation changes bump the
+version in their own transaction (`touch_moments`), both read with the
+moment row so a fragment built from older data never match again.
+
+Everything live in the `SNAP_CACHE` alias (Redis) so generations,
+counters and invalidation reach every web and celery worker. Cache
+errors only log, requests fallback to the database.
+"""
+import hashlib
+import logging
+import time
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db.models import F
+from django.utils.http import urlencode
+from redis.exceptions import RedisError
+
+from .conf import settings
+
+LIST_GENERATION_KEY = 'snap:moment:list:generation'
+DETAIL_GENERATION_KEY = 'snap:moment:detail:generation:{guid}'
+LIST_KEY = 'snap:moment:list:{generation}:{viewer}:{params}'
+DETAIL_KEY = 'snap:moment:detail:{guid}:{generation}:{viewer}:{params}'
+FRAGMENT_KEY = 'snap:moment:fragment:{guid}:{version}'
+HITS_KEY = 'snap:moment:cache:hits'
+MISSES_KEY = 'snap:moment:cache:misses'
+
+CACHED_PARAMS = (
+    'latitude',
+    'longitude',
+    'radius',
+    'limit',
+    'cursor',
+    'offset',
+    'feed',
+    'before',
+    'tags',
+    'since',
+    'until',
+    'user',
+)
+
+# describe the cached data, served on hit too
+CACHED_HEADERS = ('X-Query-Plan',)
+
+
+def get_cache():
+    return caches[settings.SNAP_CACHE]
+
+
+def _incr(key, initial=0):
+    cache = get_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # not exist yet (or evicted)
+        cache.add(key, initial, None)
+        return cache.incr(key)
+
+
+def _initial_generation():
+    # never reuse generation of an evicted key
+    return int(time.time() * 1000)
+
+
+def get_generation(key):
+    cache = get_cache()
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _initial_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(key):
+    return _incr(key, initial=_initial_generation())
+
+
+def get_viewer(request):
+    """Anonymous and registered user see different moments"""
+    if request.user and request.user.is_authenticated:
+        return 'registered'
+    return 'anonymous'
+
+
+def normalize_params(request):
+    """
+    Only params affect the response, coordinates rounded
+    so nearby viewers share the same page.
+    """
+    precision = settings.SNAP_MOMENT_CACHE_COORDINATE_PRECISION
+    params = list()
+
+    for name in CACHED_PARAMS:
+        value = request.query_params.get(name)
+        if value is None:
+            continue
+
+        if name in ('latitude', 'longitude'):
+            try:
+                value = round(float(value), precision)
+            except ValueError:
+                pass
+        elif name in ('since', 'until'):
+            # relative `6h` is another window as time goes
+            from apps.snap.api.v1.moment.filters import parse_time
+            try:
+                value = parse_time(value).isoformat()
+            except ValueError:
+                pass
+        params.append((name, value))
+
+    return hashlib.md5(urlencode(params).encode('utf-8')).hexdigest()
+
+
+def get_list_key(request):
+    """None when the cache unavailable, response not cached"""
+    try:
+        generation = get_generation(LIST_GENERATION_KEY)
+    except RedisError as e:
+        logging.warning('Moment cache unavailable: %s', e)
+        return None
+
+    return LIST_KEY.format(
+        generation=generation,
+        viewer=get_viewer(request),
+        params=normalize_params(request)
+    )
+
+
+def get_detail_key(request, guid):
+    try:
+        generation = get_generation(DETAIL_GENERATION_KEY.format(guid=guid))
+    except RedisError as e:
+        logging.warning('Moment cache unavailable: %s', e)
+        return None
+
+    return DETAIL_KEY.format(
+        guid=guid,
+        generation=generation,
+        viewer=get_viewer(request),
+        params=normalize_params(request)
+    )
+
+
+def get_cached_headers(response):
+    return {
+        header: response[header]
+        for header in CACHED_HEADERS
+        if response.has_header(header)
+    }
+
+
+def get_response(key):
+    """`(data, headers)` of the cached response, None when missed"""
+    if key is None:
+        return None
+
+    try:
+        cached = get_cache().get(key)
+        _incr(HITS_KEY if cached is not None else MISSES_KEY)
+    except RedisError as e:
+        logging.warning('Moment cache read failed: %s', e)
+        return None
+    return cached
+
+
+def set_response(key, data, headers=None):
+    """`headers` describing the data (ie `X-Query-Plan`) served on hit"""
+    if key is None:
+        return
+
+    try:
+        get_cache().set(
+            key,
+            (data, headers or dict()),
+            settings.SNAP_MOMENT_CACHE_TIMEOUT
+        )
+    except RedisError as e:
+        logging.warning('Moment cache write failed: %s', e)
+
+
+# async views, same keys as above
+
+async def _aincr(key, initial=0):
+    cache = get_cache()
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, initial, None)
+        return await cache.aincr(key)
+
+
+async def aget_generation(key):
+    cache = get_cache()
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, _initial_generation(), None)
+        generation = await cache.aget(key)
+    return generation
+
+
+async def aget_list_key(request):
+    try:
+        generation = await aget_generation(LIST_GENERATION_KEY)
+    except RedisError as e:
+        logging.warning('Moment cache unavailable: %s', e)
+        return None
+
+    return LIST_KEY.format(
+        generation=generation,
+        viewer=get_viewer(request),
+        params=normalize_params(request)
+    )
+
+
+async def aget_detail_key(request, guid):
+    try:
+        generation = await aget_generation(
+            DETAIL_GENERATION_KEY.format(guid=guid))
+    except RedisError as e:
+        logging.warning('Moment cache unavailable: %s', e)
+        return None
+
+    return DETAIL_KEY.format(
+        guid=guid,
+        generation=generation,
+        viewer=get_viewer(request),
+        params=normalize_params(request)
+    )
+
+
+async def aget_response(key):
+    if key is None:
+        return None
+
+    try:
+        cached = await get_cache().aget(key)
+        await _aincr(HITS_KEY if cached is not None else MISSES_KEY)
+    except RedisError as e:
+        logging.warning('Moment cache read failed: %s', e)
+        return None
+    return cached
+
+
+async def aset_response(key, data, headers=None):
+    if key is None:
+        return
+
+    try:
+        await get_cache().aset(
+            key,
+            (data, headers or dict()),
+            settings.SNAP_MOMENT_CACHE_TIMEOUT
+        )
+    except RedisError as e:
+        logging.warning('Moment cache write failed: %s', e)
+
+
+def get_stats():
+    """Counted by every worker"""
+    cache = get_cache()
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def get_fragments(instances, host):
+    """Return {guid: fragment} of instances still valid"""
+    keys = {
+        FRAGMENT_KEY.format(guid=instance.guid, version=instance.version): instance
+        for instance in instances
+    }
+    fragments = dict()
+
+    try:
+        values = get_cache().get_many(keys.keys())
+    except RedisError as e:
+        logging.warning('Moment fragment read failed: %s', e)
+        return fragments
+
+    for key, value in values.items():
+        instance = keys[key]
+        update_at, fragment_host, fragment = value
+        if update_at == instance.update_at and fragment_host == host:
+            fragments[instance.guid] = fragment
+    return fragments
+
+
+def set_fragments(fragments, host):
+    """`fragments` is {instance: fragment}"""
+    try:
+        get_cache().set_many(
+            {
+                FRAGMENT_KEY.format(
+                    guid=instance.guid,
+                    version=instance.version
+                ): (
+                    instance.update_at,
+                    host,
+                    fragment
+                )
+                for instance, fragment in fragments.items()
+            },
+            settings.SNAP_MOMENT_FRAGMENT_TIMEOUT
+        )
+    except RedisError as e:
+        logging.warning('Moment fragment write failed: %s', e)
+
+
+def touch_moments(guids):
+    """
+    Relations of moments changed (tags, withs, attachments,
+    renditions, comments) without save, their fragments never read
+    again. Call in the transaction of the change.
+    """
+    if not guids:
+        return
+
+    Moment = apps.get_model('snap', 'Moment')
+    Moment.objects \
+        .filter(guid__in=guids) \
+        .update(version=F('version') + 1)
+
+
+def invalidate_moments(guids=None):
+    """Every list page and detail page of `guids`"""
+    try:
+        bump_generation(LIST_GENERATION_KEY)
+        for guid in guids or []:
+            bump_generation(DETAIL_GENERATION_KEY.format(guid=guid))
+    except RedisError as e:
+        # stale pages expire after SNAP_MOMENT_CACHE_TIMEOUT
+        logging.error('Moment cache invalidation failed: %s', e)
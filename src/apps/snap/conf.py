@@ -4,5 +4,89 @@ from appconf import AppConf
 
 
 class SnapAppConf(AppConf):
+    # radius (km) used when client not send `radius`
+    MOMENT_RADIUS = 50
+    MOMENT_MAX_RADIUS = 1000
+
+    # moment list filters (tags, since, until, user, radius) fetch ids
+    # of a filter by its index when it match at most that many moments,
+    # broader filters only checked against that candidates
+    MOMENT_PLAN_MAX_CANDIDATES = 5000
+
+    # nearby feed cell (geohash precision 5 ~ 4.9km) and
+    # max moments kept per cell
+    FEED_PRECISION = 5
+    FEED_MAX_LENGTH = 1000
+
+    # cache alias shared by every worker (see CACHES)
+    CACHE = 'snap'
+
+    # moment list and detail response cache (seconds), coordinates
+    # rounded to 3 decimals (~110m) share the same cached page
+    MOMENT_CACHE_TIMEOUT = 300
+    MOMENT_CACHE_COORDINATE_PRECISION = 3
+
+    # serialized moment fragment, keyed by guid and valid for
+    # their `update_at` only
+    MOMENT_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+    # max moments accepted by one bulk create request
+    BULK_MAX_SIZE = 100
+
+    # replies listed under every top level comment of a thread
+    COMMENT_REPLIES = 3
+    COMMENT_MAX_REPLIES = 20
+
+    # trending tags near a location (geohash precision 4 ~ 39km),
+    # window result kept for (seconds)
+    TRENDING_PRECISION = 4
+    TRENDING_TIMEOUT = 60
+
+    # attachment image renditions, name: max side (px)
+    ATTACHMENT_RENDITIONS = {
+        'thumbnail': 160,
+        'small': 480,
+        'medium': 1080,
+    }
+    ATTACHMENT_RENDITION_FORMAT = 'WEBP'
+    ATTACHMENT_RENDITION_QUALITY = 80
+
+    # original image stored again without EXIF (GPS, camera serial),
+    # XMP and comments, only the orientation kept
+    ATTACHMENT_STRIP_METADATA = True
+
+    # resumable upload, partial files dir must be shared by web servers
+    # (default FILE_UPLOAD_TEMP_DIR or system temp dir)
+    UPLOAD_TEMP_DIR = None
+    UPLOAD_MAX_SIZE = 1024 * 1024 * 1024
+    UPLOAD_CHUNK_MAX_SIZE = 16 * 1024 * 1024
+
+    # direct upload to S3 compatible storage with presigned PUT,
+    # disabled until bucket set (boto3 required). Endpoint url
+    # for non AWS server (MinIO, moto server), presigned url
+    # valid for (seconds), import claimed by a dead worker taken
+    # over after (seconds)
+    DIRECT_UPLOAD_BUCKET = None
+    DIRECT_UPLOAD_ENDPOINT_URL = None
+    DIRECT_UPLOAD_REGION = None
+    DIRECT_UPLOAD_ACCESS_KEY_ID = None
+    DIRECT_UPLOAD_SECRET_ACCESS_KEY = None
+    DIRECT_UPLOAD_PREFIX = 'uploads'
+    DIRECT_UPLOAD_EXPIRES = 60 * 60
+    DIRECT_UPLOAD_IMPORT_TIMEOUT = 60 * 60
+
+    # attachment download, files sent by the web server when set:
+    # nginx internal location prefix (X-Accel-Redirect) mapped to
+    # MEDIA_ROOT, or apache mod_xsendfile (X-Sendfile)
+    DOWNLOAD_ACCEL_REDIRECT_PREFIX = None
+    DOWNLOAD_SENDFILE = False
+    DOWNLOAD_MAX_AGE = 60 * 60 * 24
+
+    # unclaimed locations, attachments and unfinished uploads
+    # older than (seconds) deleted by `collect_orphans`
+    GC_TTL = 60 * 60 * 24
+    GC_BATCH_SIZE = 500
+    GC_WORKERS = 8
+
     class Meta:
         perefix = 'snap'
@@ -0,0 +1,180 @@
+"""
+Denormalized counters
+
+Moment `comment_count`, `attachment_count` and `with_count` are
+recomputed for the touched rows only, in the same transaction as the
+change. Recomputing (instead of +1/-1) keep them right after bulk
+queries that send no signal. `TagUsage` rows are hot (every moment
+of a popular tag) so they shift by atomic `count + n` instead.
+Drift is repaired by `reconcile_counters` command.
+"""
+from collections import Counter, defaultdict
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import (
+    Case,
+    CharField,
+    F,
+    Func,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    When
+)
+from django.db.models.functions import Cast, Coalesce
+
+MOMENT_COUNTERS = ('comment_count', 'attachment_count', 'with_count')
+
+
+def _count(queryset):
+    # COUNT(*) without GROUP BY, so one row per outer moment
+    return Coalesce(
+        Subquery(
+            queryset
+            .order_by()
+            .annotate(count=Func(F('id'), function='COUNT'))
+            .values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def get_moment_counters(fields=MOMENT_COUNTERS):
+    """{field: expression} of real counts for an outer moment query"""
+    Moment = apps.get_model('snap', 'Moment')
+    content_type = ContentType.objects.get_for_model(Moment)
+    object_id = Cast(OuterRef('id'), CharField(max_length=255))
+
+    expressions = {
+        'comment_count': lambda: _count(
+            apps.get_model('snap', 'Comment').objects.filter(
+                content_type=content_type,
+                object_id=object_id
+            )
+        ),
+        'attachment_count': lambda: _count(
+            apps.get_model('snap', 'Attachment').objects.filter(
+                content_type=content_type,
+                object_id=object_id
+            )
+        ),
+        'with_count': lambda: _count(
+            apps.get_model('snap', 'With').objects.filter(
+                moment_id=OuterRef('id')
+            )
+        ),
+    }
+    return {field: expressions[field]() for field in fields}
+
+
+def update_moment_counters(moment_ids, fields=MOMENT_COUNTERS):
+    """One UPDATE query whatever the number of moments"""
+    moment_ids = [moment_id for moment_id in moment_ids if moment_id]
+    if not moment_ids:
+        return 0
+
+    Moment = apps.get_model('snap', 'Moment')
+    return Moment.objects \
+        .filter(id__in=moment_ids) \
+        .update(**get_moment_counters(fields))
+
+
+def get_drifted_moments(moment_ids, fields=MOMENT_COUNTERS):
+    """Ids of moments their counters not match the real counts"""
+    Moment = apps.get_model('snap', 'Moment')
+    counters = get_moment_counters(fields)
+
+    # flat OR of leafs, eav queryset can't rewrite negated Q
+    drifted = Q()
+    for field in fields:
+        real = F('real_{}'.format(field))
+        drifted |= Q(**{'{}__lt'.format(field): real})
+        drifted |= Q(**{'{}__gt'.format(field): real})
+
+    return list(
+        Moment.objects
+        .filter(id__in=moment_ids)
+        .annotate(**{
+            'real_{}'.format(field): expression
+            for field, expression in counters.items()
+        })
+        .filter(drifted)
+        .values_list('id', flat=True)
+    )
+
+
+def update_tag_usage(content_type_id, added=(), removed=()):
+    """
+    Shift usage of one content type by the tag ids `added` and
+    `removed`, a tag id repeated once per object. One UPDATE per
+    distinct shift, concurrent writers never lose each other count.
+    """
+    deltas = Counter(added)
+    deltas.subtract(Counter(removed))
+    if not content_type_id:
+        return
+
+    TagUsage = apps.get_model('snap', 'TagUsage')
+
+    # row must exist before shifted, one created concurrently is kept
+    TagUsage.objects.bulk_create(
+        [
+            TagUsage(tag_id=tag_id, content_type_id=content_type_id, count=0)
+            for tag_id, delta in deltas.items()
+            if delta > 0
+        ],
+        ignore_conflicts=True
+    )
+
+    shifts = defaultdict(list)
+    for tag_id, delta in deltas.items():
+        if delta:
+            shifts[delta].append(tag_id)
+
+    for delta, tag_ids in shifts.items():
+        if delta > 0:
+            count = F('count') + delta
+        else:
+            # unsigned column, never below zero
+            count = Case(
+                When(count__gt=-delta, then=F('count') + delta),
+                default=0
+            )
+
+        TagUsage.objects \
+            .filter(tag_id__in=tag_ids, content_type_id=content_type_id) \
+            .update(count=count)
+
+
+def set_tag_usage(counts, content_type_id):
+    """`counts` is {tag_id: count}"""
+    TagUsage = apps.get_model('snap', 'TagUsage')
+
+    usages = {
+        usage.tag_id: usage for usage in
+        TagUsage.objects.filter(
+            tag_id__in=counts.keys(),
+            content_type_id=content_type_id
+        )
+    }
+    for tag_id, usage in usages.items():
+        usage.count = counts[tag_id]
+
+    TagUsage.objects.bulk_update(usages.values(), ['count'])
+
+    # created by concurrent transaction are left to `reconcile_counters`
+    TagUsage.objects.bulk_create(
+        [
+            TagUsage(
+                tag_id=tag_id,
+                content_type_id=content_type_id,
+                count=count
+            )
+            for tag_id, count in counts.items()
+            if tag_id not in usages
+        ],
+        ignore_conflicts=True
+    )
@@ -0,0 +1,118 @@
+"""
+Content addressed attachment files
+
+Attachment file hashed (sha256) before it reach the storage, when
+other attachment already hold the same bytes its file name is shared
+instead of storing a copy. No counter column, the reference count of
+a file is the number of attachments pointing to its name, so it can't
+drift. A file is deleted only once nothing reference it.
+"""
+import hashlib
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+
+READ_SIZE = 64 * 1024
+
+
+def get_digest(file):
+    """sha256 hex digest of a django File, read in chunks"""
+    digest = hashlib.sha256()
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+    for data in file.chunks(READ_SIZE):
+        digest.update(data)
+
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return digest.hexdigest()
+
+
+def get_storage():
+    Attachment = apps.get_registered_model('snap', 'Attachment')
+    return Attachment._meta.get_field('file').storage
+
+
+def find_duplicate(digest, exclude_id=None):
+    """Oldest attachment holding `digest` bytes still in storage"""
+    Attachment = apps.get_registered_model('snap', 'Attachment')
+    storage = get_storage()
+
+    queryset = Attachment.objects \
+        .filter(digest=digest) \
+        .exclude(file__isnull=True) \
+        .exclude(file='') \
+        .order_by('id')
+    if exclude_id:
+        queryset = queryset.exclude(id=exclude_id)
+
+    for attachment in queryset.only('id', 'file', 'filemime', 'exif', 'renditions')[:5]:
+        if storage.exists(attachment.file.name):
+            return attachment
+    return None
+
+
+def get_refcount(name):
+    Attachment = apps.get_registered_model('snap', 'Attachment')
+    return Attachment.objects.filter(file=name).count()
+
+
+def get_referenced(names, renditions=(), exclude_ids=()):
+    """
+    Subset of file `names` and rendition paths attachments
+    (except `exclude_ids`) still use.
+    """
+    Attachment = apps.get_registered_model('snap', 'Attachment')
+    queryset = Attachment.objects.exclude(id__in=exclude_ids)
+    referenced = set()
+
+    if names:
+        referenced.update(
+            queryset
+            .filter(file__in=names)
+            .values_list('file', flat=True)
+        )
+
+    if renditions:
+        # renditions copied to attachments sharing a file
+        q = Q()
+        for path in renditions:
+            q |= Q(rendition_paths__contains=path)
+
+        for values in queryset \
+                .annotate(rendition_paths=Cast('renditions', TextField())) \
+                .filter(q) \
+                .values_list('renditions', flat=True):
+            referenced.update(
+                rendition['path'] for rendition in (values or {}).values()
+            )
+    return referenced
+
+
+def delete_files(names, workers=1, dry_run=False):
+    """
+    Delete storage files in parallel, return (count, bytes).
+    Caller make sure nothing reference them.
+    """
+    storage = get_storage()
+
+    def delete(name):
+        try:
+            if not storage.exists(name):
+                return 0, 0
+            size = storage.size(name)
+            if not dry_run:
+                storage.delete(name)
+            return 1, size
+        except OSError as e:
+            logging.warning('File %s not deleted: %s', name, e)
+            return 0, 0
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        results = list(executor.map(delete, set(names)))
+    return sum(count for count, _size in results), sum(size for _count, size in results)
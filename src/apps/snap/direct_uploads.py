@@ -0,0 +1,222 @@
+"""
+Direct uploads to object storage
+
+Client PUT the file to a presigned url, bytes never pass through
+web workers. On complete the object size is checked with a HEAD,
+the attachment row created and a celery task import the object to
+attachment storage (hashed, deduplicated then processed). The upload
+row only locked to claim the import, never during the download.
+Work with any S3 compatible server, `SNAP_DIRECT_UPLOAD_ENDPOINT_URL`
+point to MinIO or moto server for local run.
+"""
+import logging
+import os
+
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from .conf import settings
+from .uploads import delete_partial, get_file_checksum, get_partial_path, store_file
+
+try:
+    import boto3
+    from botocore.exceptions import BotoCoreError, ClientError
+except ImportError:
+    boto3 = None
+
+    # never raised, keep except clauses valid without botocore
+    class BotoCoreError(Exception):
+        pass
+
+    ClientError = BotoCoreError
+
+_client = None
+
+
+def is_enabled():
+    return bool(settings.SNAP_DIRECT_UPLOAD_BUCKET)
+
+
+def get_client():
+    """Shared client, thread safe and costly to create"""
+    global _client
+    if boto3 is None:
+        raise ImproperlyConfigured(_("Direct upload require boto3"))
+
+    if _client is None:
+        _client = boto3.client(
+            's3',
+            endpoint_url=settings.SNAP_DIRECT_UPLOAD_ENDPOINT_URL,
+            region_name=settings.SNAP_DIRECT_UPLOAD_REGION,
+            aws_access_key_id=settings.SNAP_DIRECT_UPLOAD_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.SNAP_DIRECT_UPLOAD_SECRET_ACCESS_KEY
+        )
+    return _client
+
+
+def get_key(upload):
+    return '{}/{}/{}'.format(
+        settings.SNAP_DIRECT_UPLOAD_PREFIX.strip('/'),
+        upload.guid,
+        upload.filename
+    )
+
+
+def get_presigned_put(upload):
+    """Target the client PUT the whole file to, size signed"""
+    url = get_client().generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': settings.SNAP_DIRECT_UPLOAD_BUCKET,
+            'Key': upload.key,
+            'ContentLength': upload.filesize,
+        },
+        ExpiresIn=settings.SNAP_DIRECT_UPLOAD_EXPIRES,
+        HttpMethod='PUT'
+    )
+    return {
+        'method': 'PUT',
+        'url': url,
+        'headers': {'Content-Length': str(upload.filesize)},
+        'expires_in': settings.SNAP_DIRECT_UPLOAD_EXPIRES,
+    }
+
+
+def get_object_size(upload):
+    """Size of the uploaded object, None if not uploaded yet"""
+    try:
+        response = get_client().head_object(
+            Bucket=settings.SNAP_DIRECT_UPLOAD_BUCKET,
+            Key=upload.key
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+            return None
+        raise
+    return response['ContentLength']
+
+
+def delete_object(upload):
+    try:
+        get_client().delete_object(
+            Bucket=settings.SNAP_DIRECT_UPLOAD_BUCKET,
+            Key=upload.key
+        )
+    except (BotoCoreError, ClientError) as e:
+        logging.warning('Direct upload %s not deleted: %s', upload.guid, e)
+
+
+def complete_direct_upload(upload, checksum=None, **fields):
+    """
+    Attachment created without file, filled by `import_direct_upload`
+    task. `checksum` kept and checked once object downloaded.
+    """
+    from .tasks import schedule_import_direct_upload
+
+    try:
+        size = get_object_size(upload)
+    except (BotoCoreError, ClientError) as e:
+        logging.warning('Direct upload %s not checked: %s', upload.guid, e)
+        raise ValidationError(_("Storage unavailable, try again later"))
+
+    if size is None:
+        raise ValidationError(_("File not uploaded yet"))
+
+    if size != upload.filesize:
+        raise ValidationError(
+            _("Uploaded {} bytes, {} expected").format(size, upload.filesize)
+        )
+
+    Attachment = apps.get_registered_model('snap', 'Attachment')
+    fields.setdefault('name', upload.filename)
+    attachment = Attachment.objects.create(user=upload.user, **fields)
+
+    upload.offset = size
+    upload.checksum = checksum.lower() if checksum else None
+    upload.attachment = attachment
+    upload.save(update_fields=['offset', 'checksum', 'attachment', 'update_at'])
+
+    schedule_import_direct_upload(upload.id)
+    return attachment
+
+
+def claim_direct_upload(upload_id):
+    """
+    Mark the upload imported by this worker, None when already
+    imported, failed or claimed by another (live) worker.
+    """
+    AttachmentUpload = apps.get_registered_model('snap', 'AttachmentUpload')
+    stale = timezone.now() \
+        - timedelta(seconds=settings.SNAP_DIRECT_UPLOAD_IMPORT_TIMEOUT)
+
+    with transaction.atomic():
+        upload = AttachmentUpload.objects \
+            .select_for_update() \
+            .filter(id=upload_id) \
+            .first()
+        if upload is None or upload.error or upload.attachment is None \
+                or upload.attachment.file:
+            return None
+
+        if upload.import_at and upload.import_at > stale:
+            return None
+
+        upload.import_at = timezone.now()
+        upload.save(update_fields=['import_at', 'update_at'])
+    return upload
+
+
+def release_direct_upload(upload, error=None):
+    """Claim dropped, retried later unless `error` given"""
+    upload.import_at = None
+    upload.error = error
+    upload.save(update_fields=['import_at', 'error', 'update_at'])
+
+
+def import_direct_upload(upload):
+    """
+    Copy uploaded object (claimed upload) to attachment storage,
+    return the attachment. On checksum mismatch the attachment
+    kept without file and the upload `error` set.
+    """
+    attachment = upload.attachment
+    if attachment is None or attachment.file:
+        return attachment
+
+    path = get_partial_path(upload)
+    try:
+        with open(path, 'wb') as file:
+            # streamed in parts, memory stay constant
+            get_client().download_fileobj(
+                settings.SNAP_DIRECT_UPLOAD_BUCKET,
+                upload.key,
+                file
+            )
+
+        checksum = get_file_checksum(path)
+        if upload.checksum and upload.checksum != checksum:
+            logging.warning('Direct upload %s checksum mismatch', upload.guid)
+            release_direct_upload(upload, error=_("File checksum mismatch"))
+            delete_object(upload)
+            return None
+
+        store_file(attachment, path, os.path.basename(upload.filename), checksum)
+    except (BotoCoreError, ClientError) as e:
+        logging.warning('Direct upload %s not imported: %s', upload.guid, e)
+        release_direct_upload(upload)
+        return None
+    finally:
+        delete_partial(upload)
+
+    with transaction.atomic():
+        attachment.save()
+        upload.checksum = checksum
+        upload.save(update_fields=['checksum', 'update_at'])
+
+    delete_object(upload)
+    return attachment
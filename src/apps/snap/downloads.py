@@ -0,0 +1,152 @@
+"""
+Attachment download
+
+Strong ETag made of the file digest and size, conditional request
+answered 304 without touching the file. Single byte range served
+with 206 so video seek fetch only the bytes it need. When the web
+server can serve the file itself (nginx X-Accel-Redirect, apache
+X-Sendfile) the response carry the header only and the server send
+the file with zero copy, range included.
+"""
+import mimetypes
+import os
+import re
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.encoding import escape_uri_path
+from django.utils.http import http_date, quote_etag
+
+from .conf import settings
+
+READ_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_etag(attachment, size):
+    if attachment.digest:
+        return quote_etag('{}-{}'.format(attachment.digest, size))
+    # not hashed yet, size and modified time still change with file
+    return quote_etag('{}-{}'.format(size, int(attachment.update_at.timestamp())))
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive of a single range, None when
+    header missing or not supported (whole file served) and
+    False when unsatisfiable.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # suffix range, last n bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def get_offload_response(attachment):
+    storage = attachment.file.storage
+
+    if settings.SNAP_DOWNLOAD_ACCEL_REDIRECT_PREFIX:
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = escape_uri_path(
+            settings.SNAP_DOWNLOAD_ACCEL_REDIRECT_PREFIX.rstrip('/')
+            + '/' + attachment.file.name
+        )
+        return response
+
+    if settings.SNAP_DOWNLOAD_SENDFILE:
+        response = HttpResponse()
+        response['X-Sendfile'] = storage.path(attachment.file.name)
+        return response
+    return None
+
+
+def serve_attachment(request, attachment):
+    storage = attachment.file.storage
+    name = attachment.file.name
+    size = attachment.filesize if attachment.filesize is not None else storage.size(name)
+
+    etag = get_etag(attachment, size)
+    last_modified = attachment.update_at.timestamp()
+
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified)
+    )
+    if response is None:
+        response = get_offload_response(attachment)
+
+    if response is None:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+        # If-Range not matching mean file changed, send it whole
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if byte_range and if_range and if_range != etag:
+            byte_range = None
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return response
+
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                read_range(storage.open(name, 'rb'), start, length),
+                status=206
+            )
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+            response['Content-Length'] = str(length)
+        else:
+            # FileResponse use wsgi.file_wrapper (sendfile) when available
+            response = FileResponse(storage.open(name, 'rb'))
+            response['Content-Length'] = str(size)
+
+    if response.status_code in (200, 206):
+        # not processed yet, guessed from name
+        response['Content-Type'] = attachment.filemime \
+            or mimetypes.guess_type(name)[0] \
+            or 'application/octet-stream'
+        response['Content-Disposition'] = "inline; filename*=UTF-8''{}".format(
+            escape_uri_path(attachment.filename or os.path.basename(name))
+        )
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(
+        response,
+        private=True,
+        max_age=settings.SNAP_DOWNLOAD_MAX_AGE
+    )
+    return response
@@ -0,0 +1,165 @@
+"""
+Nearby moments feed
+
+Every moment pushed to a time ordered Redis sorted set of each
+geohash cell their locations belong to, score is `create_at` timestamp.
+Anonymous moments also pushed to the anonymous feed of the cell, the
+only one anonymous viewers read. Reading a feed merge the sorted sets
+of the viewer cell and their neighbours, so cost follow page size
+not table size. Feeds filled from existing moments by the
+`rebuild_moment_feed` command, until then (or when the cells are
+missing) readers fallback to the database.
+"""
+import heapq
+import logging
+
+from redis.exceptions import RedisError
+
+from apps.core.geo import geohash_neighbours
+from apps.core.utils import get_async_redis_connection, get_redis_connection
+from .conf import settings
+
+FEED_KEY = 'snap:feed:{cell}'
+ANONYMOUS_FEED_KEY = 'snap:feed:anonymous:{cell}'
+# set once every existing moment pushed
+FEED_BUILT_KEY = 'snap:feed:built'
+
+
+def get_keys(cell, anonymous=False):
+    if anonymous:
+        return [ANONYMOUS_FEED_KEY.format(cell=cell)]
+    return [FEED_KEY.format(cell=cell)]
+
+
+def moment_cells(moment):
+    precision = settings.SNAP_FEED_PRECISION
+    return {
+        geohash[:precision]
+        for geohash in moment.locations.values_list('geohash', flat=True)
+        if geohash
+    }
+
+
+def push_moment(moment, cells=None):
+    if cells is None:
+        cells = moment_cells(moment)
+
+    if not cells:
+        return
+
+    score = moment.create_at.timestamp()
+    max_length = settings.SNAP_FEED_MAX_LENGTH
+    anonymous = moment.visibility == moment.VisibilityChoice.ANONYMOUS
+
+    try:
+        pipe = get_redis_connection().pipeline(transaction=False)
+        for cell in cells:
+            keys = get_keys(cell)
+            if anonymous:
+                keys += get_keys(cell, anonymous=True)
+
+            for key in keys:
+                pipe.zadd(key, {moment.id: score})
+                # keep only newest moments
+                pipe.zremrangebyrank(key, 0, -(max_length + 1))
+        pipe.execute()
+    except RedisError as e:
+        logging.warning('Nearby feed push failed: %s', e)
+
+
+def remove_moment(moment_id, cells):
+    if not cells:
+        return
+
+    try:
+        pipe = get_redis_connection().pipeline(transaction=False)
+        for cell in cells:
+            for key in get_keys(cell) + get_keys(cell, anonymous=True):
+                pipe.zrem(key, moment_id)
+        pipe.execute()
+    except RedisError as e:
+        logging.warning('Nearby feed remove failed: %s', e)
+
+
+def _get_feed_keys(latitude, longitude, anonymous):
+    cells = geohash_neighbours(
+        latitude,
+        longitude,
+        settings.SNAP_FEED_PRECISION
+    )
+    return [get_keys(cell, anonymous=anonymous)[0] for cell in sorted(cells)]
+
+
+def _merge_feed(results, limit):
+    # each list already sorted newest first
+    merged = heapq.merge(
+        *results,
+        key=lambda entry: entry[1],
+        reverse=True
+    )
+
+    entries = list()
+    seen = set()
+    for member, score in merged:
+        moment_id = int(member)
+        if moment_id in seen:
+            continue
+
+        seen.add(moment_id)
+        entries.append((moment_id, score))
+        if len(entries) >= limit:
+            break
+    return entries
+
+
+def _pipe_read_feed(pipe, keys, limit, before):
+    max_score = '({}'.format(before) if before is not None else '+inf'
+
+    pipe.exists(FEED_BUILT_KEY)
+    pipe.exists(*keys)
+    for key in keys:
+        pipe.zrevrangebyscore(
+            key,
+            max_score,
+            '-inf',
+            start=0,
+            num=limit,
+            withscores=True
+        )
+
+
+def _get_feed_entries(results, limit):
+    built, cells = results[:2]
+    if not built or not cells:
+        return None
+    return _merge_feed(results[2:], limit)
+
+
+def read_feed(latitude, longitude, limit, before=None, anonymous=False):
+    """
+    Return [(moment_id, score), ...] newest first,
+    `before` is exclusive score of the previous page,
+    `anonymous` viewer read anonymous moments only.
+    None when feed not built or none of the cells exist, raise
+    RedisError, so caller can fallback to database.
+    """
+    pipe = get_redis_connection().pipeline(transaction=False)
+    _pipe_read_feed(
+        pipe,
+        _get_feed_keys(latitude, longitude, anonymous),
+        limit,
+        before
+    )
+    return _get_feed_entries(pipe.execute(), limit)
+
+
+async def aread_feed(latitude, longitude, limit, before=None, anonymous=False):
+    """`read_feed` with the asyncio client"""
+    pipe = get_async_redis_connection().pipeline(transaction=False)
+    _pipe_read_feed(
+        pipe,
+        _get_feed_keys(latitude, longitude, anonymous),
+        limit,
+        before
+    )
+    return _get_feed_entries(await pipe.execute(), limit)
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+from django.db import transaction
+
+from apps.snap.models.base import COMMENT_PATH_LENGTH
+
+Comment = apps.get_registered_model('snap', 'Comment')
+CommentTree = apps.get_registered_model('snap', 'CommentTree')
+
+
+class Command(BaseCommand):
+    help = _("Fill comment `path` and `depth` from `CommentTree` rows")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        parents = dict(CommentTree.objects.values_list('child_id', 'parent_id'))
+        ids = list(Comment.objects.order_by('id').values_list('id', flat=True))
+        paths = dict()
+
+        def resolve(comment_id):
+            # walk up to the nearest resolved ancestor
+            chain = list()
+            while comment_id not in paths:
+                if comment_id in chain:
+                    raise CommandError(
+                        _("Comment {} reply to their own reply".format(comment_id))
+                    )
+                chain.append(comment_id)
+                parent_id = parents.get(comment_id)
+                if parent_id is None:
+                    break
+                comment_id = parent_id
+
+            path, depth = paths.get(comment_id, ('', -1))
+            for comment_id in reversed(chain):
+                path += Comment(id=comment_id).get_path_segment()
+                depth += 1
+                paths[comment_id] = (path, depth)
+
+        for comment_id in ids:
+            resolve(comment_id)
+
+        too_deep = [k for k, (path, _depth) in paths.items() if len(path) > COMMENT_PATH_LENGTH]
+        if too_deep:
+            raise CommandError(
+                _("Comment thread too deep: {}".format(too_deep[:10]))
+            )
+
+        batch_size = options['batch_size']
+        total = 0
+        for index in range(0, len(ids), batch_size):
+            objs = list()
+            for comment_id in ids[index:index + batch_size]:
+                path, depth = paths[comment_id]
+                objs.append(Comment(id=comment_id, path=path, depth=depth))
+
+            with transaction.atomic():
+                Comment.objects.bulk_update(objs, ['path', 'depth'])
+            total += len(objs)
+
+        self.stdout.write(
+            self.style.SUCCESS(_("{} comments OK".format(total)))
+        )
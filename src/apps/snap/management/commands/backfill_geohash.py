@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+from django.db import transaction
+
+from apps.core.geo import geohash_encode
+
+Location = apps.get_registered_model('snap', 'Location')
+Profile = apps.get_registered_model('user', 'Profile')
+
+
+class Command(BaseCommand):
+    help = _("Fill `geohash` of locations and profiles in bulk batches")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help=_("Recompute rows already have geohash")
+        )
+
+    def backfill(self, model, batch_size, recompute):
+        queryset = model.objects.order_by('id')
+        if not recompute:
+            queryset = queryset.filter(geohash__isnull=True)
+
+        last_id = 0
+        total = 0
+        while True:
+            objs = list(
+                queryset
+                .filter(id__gt=last_id)
+                .only('id', 'latitude', 'longitude')[:batch_size]
+            )
+            if not objs:
+                break
+
+            for obj in objs:
+                obj.geohash = geohash_encode(obj.latitude, obj.longitude)
+
+            with transaction.atomic():
+                model.objects.bulk_update(objs, ['geohash'])
+
+            last_id = objs[-1].id
+            total += len(objs)
+
+        return total
+
+    def handle(self, *args, **options):
+        for model in (Location, Profile):
+            total = self.backfill(
+                model,
+                options['batch_size'],
+                options['all']
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    _("{} {} OK".format(total, model._meta.verbose_name_plural))
+                )
+            )
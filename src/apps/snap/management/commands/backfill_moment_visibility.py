@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+
+from redis.exceptions import RedisError
+
+from apps.core.utils import get_redis_connection
+from apps.snap import feeds
+from apps.snap.conf import settings
+
+Moment = apps.get_registered_model('snap', 'Moment')
+
+
+class Command(BaseCommand):
+    help = _("Set visibility of moments created before the field existed")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--feed',
+            action='store_true',
+            help=_("Push anonymous moments to the anonymous nearby feeds")
+        )
+
+    def backfill(self, batch_size):
+        # author deleted later (user SET_NULL) was not anonym,
+        # history tell who ever had an author
+        authored = Moment.history \
+            .filter(user__isnull=False) \
+            .values('id')
+
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Moment.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+
+            total += Moment.objects \
+                .filter(id__in=ids, user__isnull=True) \
+                .exclude(visibility=Moment.VisibilityChoice.ANONYMOUS) \
+                .exclude(id__in=authored) \
+                .update(visibility=Moment.VisibilityChoice.ANONYMOUS)
+            last_id = ids[-1]
+
+    def push_feed(self, batch_size):
+        precision = settings.SNAP_FEED_PRECISION
+        max_length = settings.SNAP_FEED_MAX_LENGTH
+        rows = Moment.objects \
+            .filter(
+                visibility=Moment.VisibilityChoice.ANONYMOUS,
+                locations__geohash__isnull=False
+            ) \
+            .values_list('id', 'create_at', 'locations__geohash') \
+            .iterator(chunk_size=batch_size)
+
+        connection = get_redis_connection()
+        pipe = connection.pipeline(transaction=False)
+        keys = set()
+        total = 0
+
+        for moment_id, create_at, geohash in rows:
+            key = feeds.get_keys(geohash[:precision], anonymous=True)[0]
+            pipe.zadd(key, {moment_id: create_at.timestamp()})
+            keys.add(key)
+            total += 1
+
+            if total % batch_size == 0:
+                pipe.execute()
+
+        # keep only newest moments
+        for key in keys:
+            pipe.zremrangebyrank(key, 0, -(max_length + 1))
+        pipe.execute()
+        return total
+
+    def handle(self, *args, **options):
+        total = self.backfill(options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(_("{} moments set anonymous".format(total)))
+        )
+
+        if options['feed']:
+            try:
+                total = self.push_feed(options['batch_size'])
+            except RedisError as e:
+                self.stderr.write(_("Feed not pushed: {}".format(e)))
+                return
+
+            self.stdout.write(
+                self.style.SUCCESS(_("{} moment locations pushed to feeds".format(total)))
+            )
@@ -0,0 +1,109 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from apps.core.geo import geohash_encode
+from apps.snap.api.v1.moment.filters import querying_distance
+
+Location = apps.get_registered_model('snap', 'Location')
+Moment = apps.get_registered_model('snap', 'Moment')
+
+
+class Command(BaseCommand):
+    help = _("Measure moment radius search latency while `snap_location` "
+             "grows. Run against a scratch database, rows are rolled back "
+             "unless --keep given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[10000, 100000, 1000000, 10000000]
+        )
+        parser.add_argument('--radius', type=float, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--keep', action='store_true')
+
+    def seed(self, total, batch_size):
+        ct = ContentType.objects.get_for_model(Moment)
+
+        while total > 0:
+            size = min(batch_size, total)
+            moments = [
+                Moment(title='benchmark') for _i in range(size)
+            ]
+            Moment.objects.bulk_create(moments)
+
+            # some backends (mysql) not return pk from bulk_create
+            ids = Moment.objects \
+                .filter(guid__in=[moment.guid for moment in moments]) \
+                .values_list('id', flat=True)
+
+            locations = list()
+            for pk in ids:
+                latitude = random.uniform(-90, 90)
+                longitude = random.uniform(-180, 180)
+                locations.append(Location(
+                    content_type=ct,
+                    object_id=str(pk),
+                    latitude=latitude,
+                    longitude=longitude,
+                    # bulk_create skip save(), radius search scan geohash
+                    geohash=geohash_encode(latitude, longitude)
+                ))
+            Location.objects.bulk_create(locations)
+            total -= size
+
+    def measure(self, radius, repeat):
+        timings = list()
+        for _i in range(repeat):
+            latitude = random.uniform(-60, 60)
+            longitude = random.uniform(-180, 180)
+            queryset = querying_distance(
+                Moment.objects.all(),
+                latitude,
+                longitude,
+                radius=radius
+            ).order_by('distance')
+
+            start = time.perf_counter()
+            list(queryset.values_list('id', 'distance')[:25])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        return (
+            statistics.median(timings),
+            timings[int(len(timings) * 0.95) - 1]
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+
+        with transaction.atomic():
+            current = Location.objects.count()
+            for size in sizes:
+                if size > current:
+                    self.seed(size - current, options['batch_size'])
+                    current = size
+
+                median, p95 = self.measure(
+                    options['radius'],
+                    options['repeat']
+                )
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        _("{} rows: median {:.2f} ms, p95 {:.2f} ms".format(
+                            current, median, p95))
+                    )
+                )
+
+            if not options['keep']:
+                transaction.set_rollback(True)
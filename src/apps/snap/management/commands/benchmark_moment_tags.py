@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+Moment = apps.get_registered_model('snap', 'Moment')
+
+
+class Command(BaseCommand):
+    help = _("Measure queries and time of saving a moment with many "
+             "hashtags. Created rows are rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def measure(self, label, func, repeat):
+        queries = 0
+        elapsed = 0
+        for _index in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                func()
+                elapsed += time.perf_counter() - start
+            queries = len(context.captured_queries)
+
+        self.stdout.write(
+            _("{:<24} {:>6} queries {:>10.2f} ms".format(
+                label, queries, elapsed / repeat * 1000))
+        )
+
+    def handle(self, *args, **options):
+        total = options['tags']
+        repeat = options['repeat']
+        hashtags = ' '.join('#tag{}'.format(i) for i in range(total))
+
+        with transaction.atomic():
+            state = {'index': 0}
+
+            def create():
+                state['index'] += 1
+                state['moment'] = Moment.objects.create(
+                    title='benchmark {}'.format(state['index']),
+                    summary=hashtags
+                )
+
+            def save_unchanged():
+                state['moment'].save()
+
+            def save_one_changed():
+                state['index'] += 1
+                moment = state['moment']
+                moment.summary = '{} #changed{}'.format(
+                    hashtags.rsplit(' ', 1)[0], state['index'])
+                moment.save()
+
+            def save_removed():
+                moment = state['moment']
+                moment.summary = hashtags if moment.summary != hashtags else ''
+                moment.save()
+
+            def legacy_set():
+                # previous behaviour, taggit set() every save
+                state['moment'].tags.set(
+                    ['tag{}'.format(i) for i in range(total)]
+                )
+
+            self.measure('create', create, repeat)
+            self.measure('save unchanged', save_unchanged, repeat)
+            self.measure('save 1 tag changed', save_one_changed, repeat)
+            self.measure('save all tags toggled', save_removed, repeat)
+            self.measure('legacy tags.set', legacy_set, repeat)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(_("Benchmark moment tags OK")))
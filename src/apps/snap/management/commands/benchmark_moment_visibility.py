@@ -0,0 +1,131 @@
+import random
+import statistics
+import time
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import Q
+
+Moment = apps.get_registered_model('snap', 'Moment')
+
+
+class Command(BaseCommand):
+    help = _("Measure moment feed latency of anonymous and registered viewers "
+             "while `snap_moment` grows. Run against a scratch database, rows "
+             "are rolled back unless --keep given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[10000, 100000, 1000000]
+        )
+        parser.add_argument(
+            '--anonymous-ratio',
+            type=float,
+            default=0.2,
+            help=_("Part of seeded moments posted anonymously")
+        )
+        parser.add_argument('--limit', type=int, default=25)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--explain', action='store_true')
+        parser.add_argument('--keep', action='store_true')
+
+    def seed(self, total, batch_size, ratio):
+        user = get_user_model().objects.order_by('id').first()
+        now = timezone.now()
+
+        while total > 0:
+            size = min(batch_size, total)
+            moments = list()
+            for _i in range(size):
+                author = None if random.random() < ratio else user
+                moments.append(Moment(
+                    title='benchmark',
+                    user=author,
+                    visibility=Moment.get_visibility(author)
+                ))
+            Moment.objects.bulk_create(moments)
+
+            # batches spread over a year, ties ordered by id
+            Moment.objects \
+                .filter(guid__in=[moment.guid for moment in moments]) \
+                .update(create_at=now - timedelta(minutes=random.randint(0, 525600)))
+            total -= size
+
+    def get_queries(self, viewer, limit):
+        base = Moment.objects \
+            .filter(Moment.get_visible_q(viewer)) \
+            .order_by('-create_at', '-id')
+
+        # page far in the feed, keyset condition like KeysetPagination
+        cursor = list(base.values_list('create_at', 'id')[limit * 20:limit * 20 + 1])
+        queries = {'first page': base}
+        if cursor:
+            create_at, moment_id = cursor[0]
+            queries['deep page'] = base.filter(
+                Q(create_at__lt=create_at) | Q(create_at=create_at, id__lt=moment_id)
+            )
+        return queries
+
+    def measure(self, queryset, limit, repeat):
+        timings = list()
+        for _i in range(repeat):
+            start = time.perf_counter()
+            list(queryset.values_list('id', flat=True)[:limit])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        return (
+            statistics.median(timings),
+            timings[max(int(len(timings) * 0.95) - 1, 0)]
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        viewers = {
+            'anonymous': AnonymousUser(),
+            'registered': get_user_model()(),
+        }
+
+        with transaction.atomic():
+            current = Moment.objects.count()
+            for size in sizes:
+                if size > current:
+                    self.seed(
+                        size - current,
+                        options['batch_size'],
+                        options['anonymous_ratio']
+                    )
+                    current = size
+
+                for name, viewer in viewers.items():
+                    queries = self.get_queries(viewer, options['limit'])
+                    for page, queryset in queries.items():
+                        median, p95 = self.measure(
+                            queryset,
+                            options['limit'],
+                            options['repeat']
+                        )
+                        self.stdout.write(
+                            self.style.SUCCESS(
+                                _("{} rows, {} {}: median {:.2f} ms, p95 {:.2f} ms".format(
+                                    current, name, page, median, p95))
+                            )
+                        )
+                        if options['explain']:
+                            self.stdout.write(
+                                queryset.values_list('id', flat=True)[:options['limit']].explain()
+                            )
+
+            if not options['keep']:
+                transaction.set_rollback(True)
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import uuid
+
+import requests
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+
+from apps.snap import direct_uploads
+from apps.snap.conf import settings
+
+
+class Command(BaseCommand):
+    help = _("Round trip a presigned PUT against the direct upload storage (AWS, MinIO, moto server)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=1024 * 1024,
+            help=_("Bytes uploaded")
+        )
+        parser.add_argument(
+            '--create-bucket',
+            action='store_true',
+            help=_("Create the bucket if missing (local stand-in)")
+        )
+
+    def handle(self, *args, **options):
+        if not direct_uploads.is_enabled():
+            raise CommandError(_("SNAP_DIRECT_UPLOAD_BUCKET not set"))
+
+        client = direct_uploads.get_client()
+        bucket = settings.SNAP_DIRECT_UPLOAD_BUCKET
+
+        if options['create_bucket']:
+            existing = [item['Name'] for item in client.list_buckets().get('Buckets', [])]
+            if bucket not in existing:
+                client.create_bucket(Bucket=bucket)
+
+        # stand-in for an upload row, never saved
+        class Upload(object):
+            guid = uuid.uuid4()
+            filename = 'check.bin'
+            filesize = options['size']
+
+        upload = Upload()
+        upload.key = direct_uploads.get_key(upload)
+        data = os.urandom(upload.filesize)
+
+        presigned = direct_uploads.get_presigned_put(upload)
+        response = requests.put(
+            presigned['url'],
+            data=data,
+            headers=presigned['headers'],
+            timeout=60
+        )
+        if response.status_code >= 300:
+            raise CommandError(_("PUT failed {}: {}".format(
+                response.status_code, response.text[:200])))
+
+        size = direct_uploads.get_object_size(upload)
+        body = client.get_object(Bucket=bucket, Key=upload.key)['Body'].read()
+        direct_uploads.delete_object(upload)
+
+        if size != upload.filesize or hashlib.sha256(body).digest() != hashlib.sha256(data).digest():
+            raise CommandError(_("Stored object differ from uploaded bytes"))
+
+        self.stdout.write(
+            self.style.SUCCESS(_("{} bytes uploaded to {}/{} OK".format(
+                size, bucket, upload.key)))
+        )
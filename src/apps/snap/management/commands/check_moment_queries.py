@@ -0,0 +1,115 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.snap import caches
+from apps.snap.api.v1.moment.views import MomentViewSet
+
+UserModel = get_user_model()
+Moment = apps.get_registered_model('snap', 'Moment')
+Attachment = apps.get_registered_model('snap', 'Attachment')
+With = apps.get_registered_model('snap', 'With')
+
+
+class Command(BaseCommand):
+    help = _("Assert moment list run in a fixed number of queries "
+             "whatever the page size. Seeded rows are rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-sizes',
+            nargs='+',
+            type=int,
+            default=[25, 100]
+        )
+        parser.add_argument('--max-queries', type=int, default=10)
+
+    def seed(self, total):
+        user = UserModel.objects.create_user(
+            'check-moment-queries',
+            password=None
+        )
+        friend = UserModel.objects.create_user(
+            'check-moment-queries-with',
+            password=None
+        )
+
+        for index in range(total):
+            moment = Moment.objects.create(
+                title='moment {} #check #query'.format(index),
+                summary='#summary',
+                user=user
+            )
+            moment.locations.create(latitude=-6.2, longitude=106.8)
+
+            attachment = Attachment.objects.create(
+                name='attachment {} #check'.format(index),
+                caption='#caption'
+            )
+            attachment.locations.create(latitude=-6.2, longitude=106.8)
+            moment.attachments.add(attachment)
+
+            With.objects.create(user=friend, moment=moment)
+        return friend
+
+    def count_queries(self, page_size, params, viewer):
+        # cold cache, worst case
+        guids = list(Moment.objects.values_list('guid', flat=True))
+        caches.touch_moments(guids)
+        caches.invalidate_moments(guids)
+
+        view = MomentViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get(
+            '/',
+            # first cursor page
+            {'limit': page_size, 'cursor': '', **params}
+        )
+        # registered viewer see every seeded (non-anonym) moment
+        force_authenticate(request, user=viewer)
+
+        with CaptureQueriesContext(connection) as context:
+            response = view(request)
+            response.render()
+
+        if len(response.data['results']) != page_size:
+            raise CommandError(
+                _("Expected {} moments got {}".format(
+                    page_size, len(response.data['results'])))
+            )
+        return len(context.captured_queries)
+
+    def handle(self, *args, **options):
+        page_sizes = options['page_sizes']
+        failures = list()
+
+        with transaction.atomic():
+            viewer = self.seed(max(page_sizes))
+
+            for params in ({}, {'latitude': -6.2, 'longitude': 106.8}):
+                counts = {
+                    size: self.count_queries(size, params, viewer)
+                    for size in page_sizes
+                }
+                self.stdout.write(
+                    _("{} {}".format(params or 'feed', counts))
+                )
+
+                if len(set(counts.values())) > 1 \
+                        or max(counts.values()) > options['max_queries']:
+                    failures.append(params or 'feed')
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(
+                _("Query count grow with page size: {}".format(failures))
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(_("Moment list query count OK"))
+        )
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+
+from apps.snap import orphans
+
+
+class Command(BaseCommand):
+    help = _("Delete unclaimed locations, attachments (with files) and unfinished uploads")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl',
+            type=int,
+            help=_("Orphans older than (seconds), default SNAP_GC_TTL")
+        )
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help=_("Files deleted in parallel")
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help=_("Report only, nothing deleted")
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help=_("Show totals of previous runs")
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            metrics = orphans.get_metrics()
+        else:
+            if options['ttl'] is not None and options['ttl'] < 0:
+                raise CommandError(_("--ttl can't be negative"))
+
+            metrics = orphans.collect_orphans(
+                ttl=options['ttl'],
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                dry_run=options['dry_run']
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(' '.join(
+                '{} {}'.format(key, value) for key, value in metrics.items()
+            ) + (' (dry run)' if options['dry_run'] else ''))
+        )
@@ -0,0 +1,166 @@
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+
+from apps.snap import caches
+from apps.snap.dedup import delete_files, get_digest, get_referenced, get_storage
+
+Attachment = apps.get_registered_model('snap', 'Attachment')
+Moment = apps.get_registered_model('snap', 'Moment')
+
+
+class Command(BaseCommand):
+    help = _("Hash attachment files and collapse duplicates to one stored file")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help=_("Hash again attachments already hashed")
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help=_("Files hashed in parallel")
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help=_("Report only, nothing written or deleted")
+        )
+
+    def hash_file(self, name):
+        storage = get_storage()
+        try:
+            with storage.open(name, 'rb') as file:
+                return name, get_digest(file), storage.size(name)
+        except (FileNotFoundError, OSError) as e:
+            self.stderr.write(_("{}: {}".format(name, e)))
+            return name, None, 0
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError(_("--workers must be at least 1"))
+
+        dry_run = options['dry_run']
+        rows = list(
+            Attachment.objects
+            .exclude(file__isnull=True)
+            .exclude(file='')
+            .order_by('id')
+            .values_list('id', 'file', 'digest')
+        )
+
+        # each stored name hashed once, even shared by many rows
+        names = {
+            name for _id, name, digest in rows
+            if options['all'] or not digest
+        }
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            hashed = {
+                name: (digest, size) for name, digest, size in
+                executor.map(self.hash_file, names)
+                if digest
+            }
+
+        digests = dict()
+        changed = list()
+        for attachment_id, name, digest in rows:
+            if name in hashed:
+                if hashed[name][0] != digest:
+                    changed.append(Attachment(id=attachment_id, digest=hashed[name][0]))
+                digest = hashed[name][0]
+            if digest:
+                digests.setdefault(digest, []).append((attachment_id, name))
+
+        # oldest file of every digest kept, others point to it
+        collapsed = list()
+        for digest, files in digests.items():
+            if len({name for _id, name in files}) < 2:
+                continue
+
+            _id, kept = files[0]
+            collapsed.extend(
+                (attachment_id, name, kept)
+                for attachment_id, name in files
+                if name != kept
+            )
+
+        reclaimed = 0
+        if dry_run:
+            storage = get_storage()
+            for name in {name for _id, name, _kept in collapsed}:
+                if name in hashed:
+                    reclaimed += hashed[name][1]
+                elif storage.exists(name):
+                    reclaimed += storage.size(name)
+        else:
+            with transaction.atomic():
+                Attachment.objects.bulk_update(changed, ['digest'], batch_size=500)
+
+                kept = {
+                    attachment.file.name: attachment for attachment in
+                    Attachment.objects
+                    .filter(file__in={kept for _id, _name, kept in collapsed})
+                    .order_by('-id')
+                }
+                duplicates = Attachment.objects.in_bulk(
+                    [attachment_id for attachment_id, _name, _kept in collapsed]
+                )
+
+                updated = list()
+                renditions = list()
+                for attachment_id, name, kept_name in collapsed:
+                    attachment = duplicates[attachment_id]
+                    source = kept[kept_name]
+
+                    attachment.file.name = kept_name
+                    attachment.filepath = kept_name
+                    attachment.filename = os.path.basename(kept_name)
+                    if source.filemime:
+                        renditions.extend(
+                            rendition['path'] for rendition in
+                            attachment.renditions.values()
+                        )
+                        attachment.filemime = source.filemime
+                        attachment.exif = source.exif
+                        attachment.renditions = source.renditions
+                    updated.append(attachment)
+
+                Attachment.objects.bulk_update(
+                    updated,
+                    ['file', 'filepath', 'filename', 'filemime', 'exif', 'renditions'],
+                    batch_size=500
+                )
+
+                # serialized moments contain file urls
+                guids = list(
+                    Moment.objects
+                    .filter(attachments__id__in=[attachment.id for attachment in updated])
+                    .values_list('guid', flat=True)
+                    .distinct()
+                )
+                caches.touch_moments(guids)
+
+            names = {name for _id, name, _kept in collapsed}
+            referenced = get_referenced(names, renditions)
+            _count, reclaimed = delete_files(
+                [path for path in names.union(renditions) if path not in referenced],
+                workers=options['workers']
+            )
+
+            if collapsed:
+                caches.invalidate_moments(guids)
+
+        self.stdout.write(
+            self.style.SUCCESS(_("{} files hashed, {} attachments collapsed, {} bytes reclaimed{}".format(
+                len(hashed), len(collapsed), reclaimed,
+                ' (dry run)' if dry_run else ''
+            )))
+        )
@@ -0,0 +1,260 @@
+import asyncio
+import io
+import random
+import statistics
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+
+from redis.exceptions import RedisError
+
+from apps.core.utils import get_redis_connection
+from apps.snap import feeds
+
+Moment = apps.get_registered_model('snap', 'Moment')
+Location = apps.get_registered_model('snap', 'Location')
+
+# sync and async route of every endpoint
+ENDPOINTS = {
+    'feed': ('/api/snap/v1/moments/', '/api/snap/v1/async/moments/'),
+    'list': ('/api/snap/v1/moments/', '/api/snap/v1/async/moments/'),
+    'tags': ('/api/snap/v1/tags/', '/api/snap/v1/async/tags/'),
+}
+
+
+class Command(BaseCommand):
+    help = _("Compare requests/sec and latency of the moment feed served "
+             "by the WSGI (sync views) and ASGI (async views) handlers, "
+             "both driven in process with the same concurrency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoint',
+            choices=list(ENDPOINTS),
+            default='feed'
+        )
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--latitude', type=float, default=-6.2)
+        parser.add_argument('--longitude', type=float, default=106.8)
+        parser.add_argument(
+            '--radius',
+            type=float,
+            default=10,
+            help=_("Search radius (km) of the list endpoint")
+        )
+        parser.add_argument(
+            '--spread',
+            type=float,
+            default=0.05,
+            help=_("Viewers spread around the location (degrees), feed "
+                   "and list viewers farther than the cache rounding "
+                   "(~110m) miss the response cache")
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help=_("Moments created around the location first, "
+                   "deleted after unless --keep given")
+        )
+        parser.add_argument('--keep', action='store_true')
+        parser.add_argument(
+            '--handler',
+            choices=['wsgi', 'asgi', 'both'],
+            default='both'
+        )
+
+    def seed(self, total, latitude, longitude, spread):
+        moments = Moment.objects.bulk_create([
+            Moment(title='loadtest', visibility=Moment.VisibilityChoice.ANONYMOUS)
+            for _i in range(total)
+        ])
+        moments = list(Moment.objects.filter(guid__in=[m.guid for m in moments]))
+
+        content_type = ContentType.objects.get_for_model(Moment)
+        locations = [
+            Location(
+                content_type=content_type,
+                object_id=moment.id,
+                latitude=latitude + random.uniform(-spread, spread),
+                longitude=longitude + random.uniform(-spread, spread)
+            )
+            for moment in moments
+        ]
+        for location in locations:
+            # geohash set on save
+            location.save()
+
+        for moment in moments:
+            feeds.push_moment(moment)
+        return [moment.id for moment in moments]
+
+    def get_requests(self, options, path):
+        query = dict()
+        if options['endpoint'] == 'tags':
+            query['window'] = '24h'
+
+        # unique client address, per client throttling not hit
+        for index in range(options['requests']):
+            params = dict(query)
+            if options['endpoint'] in ('feed', 'list'):
+                # spread viewers, not only cached pages timed
+                params.update({
+                    'latitude': options['latitude']
+                    + random.uniform(-options['spread'], options['spread']),
+                    'longitude': options['longitude']
+                    + random.uniform(-options['spread'], options['spread']),
+                })
+            if options['endpoint'] == 'feed':
+                params['feed'] = 'nearby'
+            elif options['endpoint'] == 'list':
+                # database list sorted by distance, cursor paginated
+                params['cursor'] = ''
+                params['radius'] = options['radius']
+            address = '10.{}.{}.{}'.format(
+                index >> 16 & 255, index >> 8 & 255, index & 255)
+            yield path, urlencode(params), address
+
+    def is_feed_built(self):
+        try:
+            return bool(get_redis_connection().exists(feeds.FEED_BUILT_KEY))
+        except RedisError:
+            return False
+
+    def get_host(self):
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*']
+        return hosts[0] if hosts else 'localhost'
+
+    def run_wsgi(self, requests, concurrency):
+        application = get_wsgi_application()
+        host = self.get_host()
+
+        def call(request):
+            path, query, address = request
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'QUERY_STRING': query,
+                'REMOTE_ADDR': address,
+                'SERVER_NAME': host,
+                'SERVER_PORT': '80',
+                'HTTP_HOST': host,
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': io.BytesIO(),
+                'wsgi.errors': io.StringIO(),
+            }
+            status = list()
+
+            start = time.perf_counter()
+            response = application(
+                environ,
+                lambda code, headers, *args: status.append(int(code[:3]))
+            )
+            b''.join(response)
+            response.close()
+            return time.perf_counter() - start, status[0]
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(call, requests))
+
+    def run_asgi(self, requests, concurrency):
+        application = get_asgi_application()
+        host = self.get_host()
+
+        async def call(request, semaphore):
+            path, query, address = request
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': path,
+                'raw_path': path.encode('ascii'),
+                'query_string': query.encode('ascii'),
+                'headers': [(b'host', host.encode('ascii'))],
+                'client': (address, 0),
+                'server': (host, 80),
+            }
+            status = list()
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            async with semaphore:
+                start = time.perf_counter()
+                await application(scope, receive, send)
+                return time.perf_counter() - start, status[0]
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(
+                *[call(request, semaphore) for request in requests]
+            )
+
+        return asyncio.run(run())
+
+    def report(self, name, results, elapsed):
+        timings = sorted(timing * 1000 for timing, _status in results)
+        errors = sum(1 for _timing, status in results if status >= 400)
+        self.stdout.write(
+            self.style.SUCCESS(
+                _("{}: {:.1f} requests/sec, median {:.2f} ms, p99 {:.2f} ms, "
+                  "{} errors".format(
+                      name,
+                      len(results) / elapsed,
+                      statistics.median(timings),
+                      timings[max(int(len(timings) * 0.99) - 1, 0)],
+                      errors))
+            )
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError(_("--requests and --concurrency must be positive"))
+
+        seeded = list()
+        if options['seed']:
+            seeded = self.seed(
+                options['seed'],
+                options['latitude'],
+                options['longitude'],
+                options['spread']
+            )
+
+        if options['endpoint'] == 'feed' and not self.is_feed_built():
+            self.stderr.write(
+                _("Nearby feed not built, database list timed instead "
+                  "(run rebuild_moment_feed)")
+            )
+
+        handlers = ['wsgi', 'asgi'] if options['handler'] == 'both' \
+            else [options['handler']]
+        try:
+            for name in handlers:
+                path = ENDPOINTS[options['endpoint']][name == 'asgi']
+                requests = list(self.get_requests(options, path))
+                run = self.run_wsgi if name == 'wsgi' else self.run_asgi
+
+                start = time.perf_counter()
+                results = run(requests, options['concurrency'])
+                self.report(name, results, time.perf_counter() - start)
+        finally:
+            if seeded and not options['keep']:
+                for moment in Moment.objects.filter(id__in=seeded):
+                    # signals remove the moment from the feed
+                    moment.delete()
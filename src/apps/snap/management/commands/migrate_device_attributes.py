@@ -0,0 +1,114 @@
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from eav.models import Value
+
+from apps.snap.models.device import DEVICE_ATTRIBUTES
+
+Device = apps.get_registered_model('snap', 'Device')
+Moment = apps.get_registered_model('snap', 'Moment')
+Comment = apps.get_registered_model('snap', 'Comment')
+Attachment = apps.get_registered_model('snap', 'Attachment')
+
+
+class Command(BaseCommand):
+    help = _("Move device eav attributes of moments, comments "
+             "and attachments to hashed device fingerprint")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--delete-values',
+            action='store_true',
+            help=_("Delete migrated device eav values, devices can't be "
+                   "rehashed after SECRET_KEY rotation then")
+        )
+
+    def get_attributes(self, content_type, ids):
+        """Return {entity_id: {slug: value}}"""
+        values = Value.objects \
+            .filter(
+                entity_ct=content_type,
+                entity_id__in=ids,
+                attribute__slug__in=DEVICE_ATTRIBUTES
+            ) \
+            .values_list('entity_id', 'attribute__slug', 'value_text')
+
+        attributes = dict()
+        for entity_id, slug, value in values:
+            attributes.setdefault(entity_id, dict())[slug] = value
+        return attributes
+
+    def migrate(self, model, batch_size, delete_values):
+        content_type = ContentType.objects.get_for_model(model)
+        queryset = model.objects \
+            .filter(user__isnull=True, device__isnull=True) \
+            .order_by('id')
+
+        last_id = 0
+        total = 0
+        while True:
+            objs = list(queryset.filter(id__gt=last_id).only('id')[:batch_size])
+            if not objs:
+                break
+
+            last_id = objs[-1].id
+            attributes = self.get_attributes(
+                content_type,
+                [obj.id for obj in objs]
+            )
+
+            devices = {
+                entity_id: Device.objects.make_device(value)
+                for entity_id, value in attributes.items()
+            }
+            devices = {k: v for k, v in devices.items() if v}
+            if not devices:
+                continue
+
+            with transaction.atomic():
+                fingerprints = {v.fingerprint: v for v in devices.values()}
+                Device.objects.bulk_create(
+                    fingerprints.values(),
+                    ignore_conflicts=True
+                )
+                ids = dict(
+                    Device.objects
+                    .filter(fingerprint__in=fingerprints)
+                    .values_list('fingerprint', 'id')
+                )
+
+                updated = list()
+                for obj in objs:
+                    device = devices.get(obj.id)
+                    if device:
+                        obj.device_id = ids[device.fingerprint]
+                        updated.append(obj)
+
+                model.objects.bulk_update(updated, ['device'])
+
+                if delete_values:
+                    Value.objects.filter(
+                        entity_ct=content_type,
+                        entity_id__in=[obj.id for obj in updated],
+                        attribute__slug__in=DEVICE_ATTRIBUTES
+                    ).delete()
+
+            total += len(updated)
+        return total
+
+    def handle(self, *args, **options):
+        for model in (Moment, Comment, Attachment):
+            total = self.migrate(
+                model,
+                options['batch_size'],
+                options['delete_values']
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    _("{} {} OK".format(total, model._meta.verbose_name_plural))
+                )
+            )
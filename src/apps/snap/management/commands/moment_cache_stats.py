@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+
+from apps.snap import caches
+
+
+class Command(BaseCommand):
+    help = _("Show moment response cache hit/miss counters")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true')
+
+    def handle(self, *args, **options):
+        stats = caches.get_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                _("hits {} misses {} ratio {:.1f}%".format(
+                    stats['hits'], stats['misses'], ratio))
+            )
+        )
+
+        if options['reset']:
+            caches.reset_stats()
+            self.stdout.write(self.style.SUCCESS(_("Counters reset")))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+
+from django.db.models import Q
+
+from apps.snap.tasks import import_direct_upload, process_attachment
+
+Attachment = apps.get_registered_model('snap', 'Attachment')
+AttachmentUpload = apps.get_registered_model('snap', 'AttachmentUpload')
+
+
+class Command(BaseCommand):
+    help = _("Import pending direct uploads and process attachments not processed yet (mime, EXIF, renditions)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help=_("Process again attachments already processed")
+        )
+        parser.add_argument(
+            '--delay',
+            action='store_true',
+            help=_("Send to celery workers instead of running here")
+        )
+
+    def handle(self, *args, **options):
+        # direct uploads completed but not imported yet
+        pending = AttachmentUpload.objects \
+            .filter(key__isnull=False, attachment__isnull=False, error__isnull=True) \
+            .filter(Q(attachment__file__isnull=True) | Q(attachment__file=''))
+
+        imported = 0
+        for upload_id in pending.values_list('id', flat=True).iterator():
+            if options['delay']:
+                import_direct_upload.delay(upload_id)
+            else:
+                import_direct_upload(upload_id)
+            imported += 1
+
+        queryset = Attachment.objects \
+            .exclude(file__isnull=True) \
+            .exclude(file='')
+        if not options['all']:
+            queryset = queryset.filter(filemime__isnull=True)
+
+        total = 0
+        for attachment_id in queryset.values_list('id', flat=True).iterator():
+            if options['delay']:
+                process_attachment.delay(attachment_id)
+            else:
+                process_attachment(attachment_id)
+            total += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(_("{} direct uploads imported, {} attachments OK".format(imported, total)))
+        )
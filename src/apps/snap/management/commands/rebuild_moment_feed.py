@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+
+from redis.exceptions import RedisError
+
+from apps.core.utils import get_redis_connection
+from apps.snap import feeds
+from apps.snap.conf import settings
+
+Moment = apps.get_registered_model('snap', 'Moment')
+
+
+class Command(BaseCommand):
+    help = _("Push existing moments to the nearby feeds. Readers use "
+             "the database until the feeds are built.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help=_("Delete every feed first, drop moments no longer "
+                   "there (database read meanwhile)")
+        )
+
+    def clear(self, connection, batch_size):
+        # readers fallback to database until rebuilt
+        connection.delete(feeds.FEED_BUILT_KEY)
+
+        keys = list()
+        for key in connection.scan_iter(
+            match=feeds.FEED_KEY.format(cell='*'),
+            count=batch_size
+        ):
+            keys.append(key)
+            if len(keys) >= batch_size:
+                connection.unlink(*keys)
+                keys = list()
+        if keys:
+            connection.unlink(*keys)
+
+    def push(self, connection, batch_size):
+        precision = settings.SNAP_FEED_PRECISION
+        max_length = settings.SNAP_FEED_MAX_LENGTH
+        rows = Moment.objects \
+            .filter(locations__geohash__isnull=False) \
+            .values_list('id', 'create_at', 'visibility', 'locations__geohash') \
+            .iterator(chunk_size=batch_size)
+
+        pipe = connection.pipeline(transaction=False)
+        keys = set()
+        total = 0
+
+        for moment_id, create_at, visibility, geohash in rows:
+            cell = geohash[:precision]
+            cell_keys = feeds.get_keys(cell)
+            if visibility == Moment.VisibilityChoice.ANONYMOUS:
+                cell_keys += feeds.get_keys(cell, anonymous=True)
+
+            for key in cell_keys:
+                pipe.zadd(key, {moment_id: create_at.timestamp()})
+                keys.add(key)
+            total += 1
+
+            if total % batch_size == 0:
+                pipe.execute()
+
+        # keep only newest moments
+        for key in keys:
+            pipe.zremrangebyrank(key, 0, -(max_length + 1))
+        pipe.set(feeds.FEED_BUILT_KEY, 1)
+        pipe.execute()
+        return total
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError(_("--batch-size must be positive"))
+
+        connection = get_redis_connection()
+        try:
+            if options['clear']:
+                self.clear(connection, options['batch_size'])
+            total = self.push(connection, options['batch_size'])
+        except RedisError as e:
+            raise CommandError(_("Feed not built: {}".format(e)))
+
+        self.stdout.write(
+            self.style.SUCCESS(_("{} moment locations pushed to feeds".format(total)))
+        )
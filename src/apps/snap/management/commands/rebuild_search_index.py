@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+from django.db import transaction
+
+from apps.snap import search
+
+SearchDocument = apps.get_registered_model('snap', 'SearchDocument')
+
+
+class Command(BaseCommand):
+    help = _("Index every moment, attachment and comment for full-text search")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help=_("Drop the whole index first")
+        )
+
+    def rebuild(self, model, batch_size):
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                model.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            last_id = ids[-1]
+            with transaction.atomic():
+                search.index_objects(model, ids, related=False)
+            total += len(ids)
+        return total
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            total, _rows = SearchDocument.objects.all().delete()
+            self.stdout.write(
+                self.style.SUCCESS(_("{} index rows deleted".format(total)))
+            )
+
+        for model in search.get_models().values():
+            total = self.rebuild(model, options['batch_size'])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    _("{} {} indexed".format(total, model._meta.verbose_name))
+                )
+            )
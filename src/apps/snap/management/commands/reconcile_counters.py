@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count
+
+from apps.snap import counters
+
+Moment = apps.get_registered_model('snap', 'Moment')
+Attachment = apps.get_registered_model('snap', 'Attachment')
+TagUsage = apps.get_registered_model('snap', 'TagUsage')
+TaggedItem = apps.get_registered_model('taggit', 'TaggedItem')
+
+
+class Command(BaseCommand):
+    help = _("Repair drift of moment counters and tag usage in bulk")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def reconcile_moments(self, batch_size):
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                Moment.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            last_id = ids[-1]
+            with transaction.atomic():
+                drifted = counters.get_drifted_moments(ids)
+                counters.update_moment_counters(drifted)
+            total += len(drifted)
+        return total
+
+    def reconcile_tags(self, model):
+        content_type = ContentType.objects.get_for_model(model)
+        counts = dict(
+            TaggedItem.objects
+            .filter(content_type=content_type)
+            .order_by()
+            .values('tag_id')
+            .annotate(count=Count('id'))
+            .values_list('tag_id', 'count')
+        )
+        usages = dict(
+            TagUsage.objects
+            .filter(content_type=content_type)
+            .values_list('tag_id', 'count')
+        )
+
+        drifted = {
+            tag_id: counts.get(tag_id, 0)
+            for tag_id in set(counts) | set(usages)
+            if counts.get(tag_id, 0) != usages.get(tag_id)
+        }
+        if drifted:
+            with transaction.atomic():
+                counters.set_tag_usage(drifted, content_type.id)
+        return len(drifted)
+
+    def handle(self, *args, **options):
+        total = self.reconcile_moments(options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(_("{} moments repaired".format(total)))
+        )
+
+        for model in (Moment, Attachment):
+            total = self.reconcile_tags(model)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    _("{} {} tag usages repaired".format(
+                        total, model._meta.verbose_name))
+                )
+            )
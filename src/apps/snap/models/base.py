@@ -2,20 +2,63 @@ import os
 
 from decimal import Decimal
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.contenttypes.fields import (
     GenericForeignKey,
     GenericRelation
 )
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.utils.http import int_to_base36
 from django.utils.translation import gettext_lazy as _
 
 from taggit.managers import TaggableManager
 from eav.managers import EntityManager
 
+from apps.core.geo import geohash_encode
 from apps.core.models.common import AbstractCommonField
 from ..conf import settings
+from ..dedup import find_duplicate, get_digest
+from ..tasks import schedule_process_attachment
 from .utils import SetAttachmentTags
 
+# comment path made of fixed width base36 id per level,
+# ordering by path list each reply right after its parent
+COMMENT_PATH_STEP = 8
+COMMENT_PATH_LENGTH = 255
+
+
+class LocationQuerySet(models.QuerySet):
+    """
+    `geohash` derived from the coordinate by `save()`, radius and nearby
+    lookups (`geohash_q`) never match a NULL geohash. Bulk writes skip
+    `save()` so they set it here, `update()` of the coordinate must set
+    `geohash` too.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.geohash = geohash_encode(obj.latitude, obj.longitude)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if {'latitude', 'longitude'} & set(fields):
+            objs = list(objs)
+            for obj in objs:
+                obj.geohash = geohash_encode(obj.latitude, obj.longitude)
+            fields = set(fields) | {'geohash'}
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if {'latitude', 'longitude'} & set(kwargs) and 'geohash' not in kwargs:
+            raise ValueError(
+                "Location coordinate updated without `geohash`, "
+                "use save() or set geohash_encode(latitude, longitude)"
+            )
+        return super().update(**kwargs)
+
 
 class AbstractLocation(AbstractCommonField):
     user = models.ForeignKey(
@@ -47,13 +90,38 @@ class AbstractLocation(AbstractCommonField):
 
     latitude = models.FloatField(default=Decimal(0.0), db_index=True)
     longitude = models.FloatField(default=Decimal(0.0), db_index=True)
+    geohash = models.CharField(
+        max_length=12,
+        editable=False,
+        null=True,
+        blank=True,
+        db_index=True
+    )
+
+    objects = LocationQuerySet.as_manager()
 
     class Meta:
         abstract = True
+        indexes = [
+            # bounding-box prefilter for radius search
+            models.Index(
+                fields=['content_type', 'latitude', 'longitude'],
+                name='%(app_label)s_%(class)s_bbox_idx'
+            ),
+            # unclaimed rows by age, for claim and garbage collect
+            models.Index(
+                fields=['content_type', 'object_id', 'create_at'],
+                name='%(app_label)s_%(class)s_unclaimed_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return '{}, {}'.format(self.latitude, self.longitude)
 
+    def save(self, *args, **kwargs):
+        self.geohash = geohash_encode(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
+
 
 class AbstractAttachment(SetAttachmentTags, AbstractCommonField):
     user = models.ForeignKey(
@@ -63,6 +131,14 @@ class AbstractAttachment(SetAttachmentTags, AbstractCommonField):
         null=True,
         blank=True
     )
+    device = models.ForeignKey(
+        'snap.Device',
+        related_name='attachments',
+        on_delete=models.SET_NULL,
+        editable=False,
+        null=True,
+        blank=True
+    )
     content_type = models.ForeignKey(
         ContentType,
         on_delete=models.CASCADE,
@@ -102,6 +178,18 @@ class AbstractAttachment(SetAttachmentTags, AbstractCommonField):
         null=True,
         blank=True
     )
+    # sha256 of the file, same bytes stored once
+    digest = models.CharField(
+        max_length=64,
+        editable=False,
+        db_index=True,
+        null=True,
+        blank=True
+    )
+
+    # filled by `apps.snap.tasks.process_attachment`
+    renditions = models.JSONField(default=dict, editable=False, blank=True)
+    exif = models.JSONField(editable=False, null=True, blank=True)
 
     name = models.CharField(max_length=255, null=True, blank=True)
     identifier = models.CharField(max_length=255, null=True, blank=True)
@@ -127,19 +215,60 @@ class AbstractAttachment(SetAttachmentTags, AbstractCommonField):
 
     class Meta:
         abstract = True
+        indexes = [
+            # unclaimed rows by age, for claim and garbage collect
+            models.Index(
+                fields=['content_type', 'object_id', 'create_at'],
+                name='%(app_label)s_%(class)s_unclaimed_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    def share_file(self, duplicate):
+        """Use file of `duplicate` holding same bytes, nothing stored"""
+        self.file.name = duplicate.file.name
+        self.file._committed = True
+
+        # same bytes, same processing result
+        self.filemime = duplicate.filemime
+        self.exif = duplicate.exif
+        self.renditions = duplicate.renditions
+        self._file_shared = True
+
     def save(self, *args, **kwargs):
         if not self.name and self.file:
             self.name = os.path.basename(self.file.name)
 
+        # hash before the file reach storage
+        if self.file and not self.file._committed:
+            self.digest = get_digest(self.file)
+            duplicate = find_duplicate(self.digest, exclude_id=self.id)
+            if duplicate:
+                self.share_file(duplicate)
+
+        # new or replaced file need processing
+        file_changed = bool(self.file) and self.file.name != self.filepath
+
         if self.file:
             self.filesize = self.file.size
 
         super().save(*args, **kwargs)
 
+        if file_changed:
+            # stored name known only after saved
+            self.filename = os.path.basename(self.file.name)
+            self.filepath = self.file.name
+            type(self).objects.filter(id=self.id).update(
+                filename=self.filename,
+                filepath=self.filepath
+            )
+            # shared file already processed unless its owner pending
+            if not (getattr(self, '_file_shared', False) and self.filemime):
+                schedule_process_attachment(self.id)
+            self._file_shared = False
+
 
 class AbstractComment(AbstractCommonField):
     user = models.ForeignKey(
@@ -149,6 +278,14 @@ class AbstractComment(AbstractCommonField):
         null=True,
         blank=True
     )
+    device = models.ForeignKey(
+        'snap.Device',
+        related_name='comments',
+        on_delete=models.SET_NULL,
+        editable=False,
+        null=True,
+        blank=True
+    )
     content_type = models.ForeignKey(
         ContentType,
         on_delete=models.CASCADE,
@@ -159,13 +296,77 @@ class AbstractComment(AbstractCommonField):
     content_object = GenericForeignKey('content_type', 'object_id')
     comment_content = models.TextField()
 
+    # materialized path of thread, kept by `CommentTree`
+    path = models.CharField(
+        max_length=COMMENT_PATH_LENGTH,
+        editable=False,
+        null=True,
+        blank=True
+    )
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
     class Meta:
         abstract = True
         ordering = ['-create_at']
+        indexes = [
+            models.Index(
+                fields=['content_type', 'object_id', 'path'],
+                name='%(app_label)s_%(class)s_thread_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.comment_content
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        # new comment is root until `CommentTree` give the parent
+        if not self.path:
+            self.set_path()
+
+    def get_path_segment(self):
+        return int_to_base36(self.id).zfill(COMMENT_PATH_STEP)
+
+    def set_path(self, parent=None):
+        """Move comment and their replies under `parent` (or to root)"""
+        old_path = self.path
+        old_depth = self.depth
+
+        if parent and old_path and parent.path \
+                and parent.path.startswith(old_path):
+            raise ValidationError(_("Comment can't reply to their own reply"))
+
+        if parent:
+            path = (parent.path or parent.get_path_segment()) \
+                + self.get_path_segment()
+            depth = parent.depth + 1
+        else:
+            path = self.get_path_segment()
+            depth = 0
+
+        if len(path) > COMMENT_PATH_LENGTH:
+            raise ValidationError(_("Comment thread too deep"))
+
+        model = type(self)
+        model.objects.filter(id=self.id).update(path=path, depth=depth)
+
+        if old_path and old_path != path:
+            model.objects \
+                .filter(
+                    content_type_id=self.content_type_id,
+                    object_id=self.object_id,
+                    path__startswith=old_path
+                ) \
+                .exclude(id=self.id) \
+                .update(
+                    path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (depth - old_depth)
+                )
+
+        self.path = path
+        self.depth = depth
+
     @property
     def activity_creator(self):
         return self.activity.user.name
@@ -189,3 +390,13 @@ class AbstractCommentTree(AbstractCommonField):
     def __str__(self) -> str:
         return 'parent: {parent} - child: {child}' \
             .format(parent=self.parent.id, child=self.child.id)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.child.set_path(self.parent)
+
+    def delete(self, *args, **kwargs):
+        child = self.child
+        result = super().delete(*args, **kwargs)
+        child.set_path()
+        return result
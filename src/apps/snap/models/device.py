@@ -0,0 +1,117 @@
+from django.db import models, IntegrityError, transaction
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from apps.core.models.common import AbstractCommonField
+
+# eav attributes identify anonym device,
+# see `create_moment_attribute` command.
+# Hashes keyed by SECRET_KEY, rotating it invalidates every stored
+# fingerprint and hash: anonym users lose ownership of what they posted
+# (raw values not stored, so they can't be rehashed).
+DEVICE_ATTRIBUTES = (
+    'device_iccid',
+    'device_imei',
+    'device_imsi',
+    'device_uuid',
+)
+
+
+class DeviceQuerySet(models.QuerySet):
+    def get_values(self, attributes):
+        """Return [(slug, value)] of device attributes given"""
+        return [
+            (slug, str(attributes[slug]).strip())
+            for slug in DEVICE_ATTRIBUTES
+            if attributes.get(slug) not in (None, '')
+        ]
+
+    def make_fingerprint(self, attributes):
+        """
+        :attributes is {slug: value}, only device attributes used.
+        Return None when no device attribute given.
+        """
+        values = self.get_values(attributes)
+        if not values:
+            return None
+
+        return salted_hmac(
+            'snap.device',
+            '|'.join('{}={}'.format(slug, value) for slug, value in values),
+            algorithm='sha256'
+        ).hexdigest()
+
+    def make_hashes(self, attributes):
+        """Return {slug: hash} of every device attribute given"""
+        return {
+            slug: salted_hmac(
+                'snap.device.{}'.format(slug),
+                value,
+                algorithm='sha256'
+            ).hexdigest()
+            for slug, value in self.get_values(attributes)
+        }
+
+    def make_device(self, attributes):
+        """Return unsaved device, None when no device attribute given"""
+        fingerprint = self.make_fingerprint(attributes)
+        if not fingerprint:
+            return None
+        return self.model(
+            fingerprint=fingerprint,
+            hashes=self.make_hashes(attributes)
+        )
+
+    def get_for_attributes(self, attributes):
+        device = self.make_device(attributes)
+        if not device:
+            return None
+
+        try:
+            with transaction.atomic():
+                instance, _created = self.get_or_create(
+                    fingerprint=device.fingerprint,
+                    defaults={'hashes': device.hashes}
+                )
+        except IntegrityError:
+            # created by concurrent request
+            instance = self.get(fingerprint=device.fingerprint)
+        return instance
+
+    def is_match(self, device_id, attributes):
+        """
+        Device attributes given are any subset of the device attributes,
+        ie. owner send only `device_uuid` of moment created with
+        `device_uuid` and `device_imei`.
+        """
+        hashes = self.make_hashes(attributes)
+        if not hashes:
+            return False
+
+        stored = self.filter(id=device_id) \
+            .values_list('hashes', flat=True) \
+            .first()
+        if not stored:
+            return False
+
+        return all(
+            constant_time_compare(stored.get(slug, ''), value)
+            for slug, value in hashes.items()
+        )
+
+
+class AbstractDevice(AbstractCommonField):
+    """
+    Anonym user identity, hashed from their device attributes
+    so ownership check is one indexed lookup.
+    """
+    fingerprint = models.CharField(max_length=64, unique=True)
+    # {slug: hash} of each attribute, owner check match any subset
+    hashes = models.JSONField(default=dict, editable=False)
+
+    objects = DeviceQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def __str__(self) -> str:
+        return self.fingerprint
@@ -4,11 +4,25 @@ from apps.core.utils import is_model_registered
 from simple_history.models import HistoricalRecords
 
 from .base import *
+from .device import *
 from .moment import *
+from .search import *
+from .tag import *
+from .upload import *
 
 __all__ = list()
 
 
+if not is_model_registered('snap', 'Device'):
+    class Device(AbstractDevice):
+        history = HistoricalRecords(inherit=True)
+
+        class Meta(AbstractDevice.Meta):
+            pass
+
+    __all__.append('Device')
+
+
 if not is_model_registered('snap', 'Location'):
     class Location(AbstractLocation):
         history = HistoricalRecords(inherit=True)
@@ -69,6 +83,41 @@ if not is_model_registered('snap', 'With'):
     __all__.append('With')
 
 
+if not is_model_registered('snap', 'TagUsage'):
+    # counter cache, rebuilt by `reconcile_counters` so no history
+    class TagUsage(AbstractTagUsage):
+        class Meta(AbstractTagUsage.Meta):
+            pass
+
+    __all__.append('TagUsage')
+
+
+if not is_model_registered('snap', 'AttachmentUpload'):
+    # offset change every chunk, history would be noise
+    class AttachmentUpload(AbstractAttachmentUpload):
+        class Meta(AbstractAttachmentUpload.Meta):
+            pass
+
+    __all__.append('AttachmentUpload')
+
+
+if not is_model_registered('snap', 'SearchDocument'):
+    # derived index, rebuilt by `rebuild_search_index` so no history
+    class SearchDocument(AbstractSearchDocument):
+        class Meta(AbstractSearchDocument.Meta):
+            pass
+
+    __all__.append('SearchDocument')
+
+
+if not is_model_registered('snap', 'SearchPosting'):
+    class SearchPosting(AbstractSearchPosting):
+        class Meta(AbstractSearchPosting.Meta):
+            pass
+
+    __all__.append('SearchPosting')
+
+
 # register eav
 eav.register(Moment)
 eav.register(Comment)
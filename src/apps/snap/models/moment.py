@@ -11,6 +11,10 @@ from .utils import SetMomentTags
 
 
 class AbstractMoment(SetMomentTags, AbstractCommonField):
+    class VisibilityChoice(models.TextChoices):
+        ANONYMOUS = 'anonymous', _("Anonymous and registered users")
+        REGISTERED = 'registered', _("Registered users only")
+
     title = models.CharField(db_index=True, max_length=255)
     summary = models.TextField(null=True, blank=True)
 
@@ -22,6 +26,14 @@ class AbstractMoment(SetMomentTags, AbstractCommonField):
         null=True,
         blank=True
     )
+    device = models.ForeignKey(
+        'snap.Device',
+        related_name='moments',
+        on_delete=models.SET_NULL,
+        editable=False,
+        null=True,
+        blank=True
+    )
     locations = GenericRelation('snap.Location', related_query_name='moment')
     attachments = GenericRelation(
         'snap.Attachment',
@@ -40,15 +52,62 @@ class AbstractMoment(SetMomentTags, AbstractCommonField):
         related_name='moment_withs'
     )
 
+    # kept by `apps.snap.counters.update_moment_counters`
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    attachment_count = models.PositiveIntegerField(default=0, editable=False)
+    with_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # bumped by `apps.snap.caches.touch_moments` when a relation change
+    # without save, serialized fragments keyed by it
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    # who can see, set once when created (see `get_visibility`)
+    visibility = models.CharField(
+        choices=VisibilityChoice.choices,
+        default=VisibilityChoice.REGISTERED,
+        max_length=16,
+        editable=False
+    )
+
     objects = EntityManager()
 
     class Meta:
         abstract = True
         ordering = ['-create_at']
+        indexes = [
+            # anonymous viewer feed, newest first
+            models.Index(
+                fields=['visibility', 'create_at', 'id'],
+                name='%(app_label)s_%(class)s_visibility_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.title
 
+    @classmethod
+    def get_visibility(cls, user):
+        """
+        Anonymous viewer only see anonymous moment, registered
+        viewer see both. `user` is the author (or their id).
+        """
+        if user is None:
+            return cls.VisibilityChoice.ANONYMOUS
+        return cls.VisibilityChoice.REGISTERED
+
+    @classmethod
+    def get_visible_q(cls, viewer):
+        """Filter of moments `viewer` can see, none for registered"""
+        if viewer is not None and viewer.is_authenticated:
+            return models.Q()
+        return models.Q(visibility=cls.VisibilityChoice.ANONYMOUS)
+
+    def save(self, *args, **kwargs):
+        # kept after author deleted, moment stay non-anonym
+        if self._state.adding:
+            self.visibility = self.get_visibility(self.user_id)
+        super().save(*args, **kwargs)
+
 
 class AbstractWith(AbstractCommonField):
     user = models.ForeignKey(
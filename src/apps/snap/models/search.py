@@ -0,0 +1,75 @@
+from django.db import models
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+
+from apps.core.models.common import AbstractCommonField
+from .moment import AbstractMoment
+
+
+class AbstractSearchDocument(AbstractCommonField):
+    """
+    One indexed moment, attachment or comment, kept by
+    `apps.snap.search.index_objects`. `moment` is the object
+    itself or the moment it belong to, for location filter
+    and visibility.
+    """
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name='search_documents'
+    )
+    object_id = models.PositiveBigIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    object_guid = models.UUIDField()
+
+    moment = models.ForeignKey(
+        'snap.Moment',
+        related_name='search_documents',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    visibility = models.CharField(
+        choices=AbstractMoment.VisibilityChoice.choices,
+        default=AbstractMoment.VisibilityChoice.REGISTERED,
+        max_length=16
+    )
+    text = models.CharField(max_length=255, blank=True)
+    # number of terms, for ranking
+    length = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_type', 'object_id'],
+                name='%(app_label)s_%(class)s_unique'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class AbstractSearchPosting(models.Model):
+    """Inverted index, how many times `term` appear in `document`"""
+    document = models.ForeignKey(
+        'snap.SearchDocument',
+        related_name='postings',
+        on_delete=models.CASCADE
+    )
+    term = models.CharField(max_length=64)
+    frequency = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        abstract = True
+        constraints = [
+            # term lookup first, then the documents
+            models.UniqueConstraint(
+                fields=['term', 'document'],
+                name='%(app_label)s_%(class)s_unique'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return '{}: {}'.format(self.term, self.frequency)
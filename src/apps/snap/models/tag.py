@@ -0,0 +1,40 @@
+from django.db import models
+from django.contrib.contenttypes.models import ContentType
+
+from apps.core.models.common import AbstractCommonField
+
+
+class AbstractTagUsage(AbstractCommonField):
+    """
+    Number of objects of one type tagged with a tag,
+    kept by `apps.snap.counters.update_tag_usage`
+    """
+    tag = models.ForeignKey(
+        'taggit.Tag',
+        related_name='usages',
+        on_delete=models.CASCADE
+    )
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name='tag_usages'
+    )
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tag', 'content_type'],
+                name='%(app_label)s_%(class)s_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['content_type', '-count'],
+                name='%(app_label)s_%(class)s_count_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return '{}: {}'.format(self.tag_id, self.count)
@@ -0,0 +1,73 @@
+from django.db import models
+
+from apps.core.models.common import AbstractCommonField
+from ..conf import settings
+
+
+class AbstractAttachmentUpload(AbstractCommonField):
+    """
+    Resumable upload, chunks appended to a partial file
+    until `offset` reach `filesize` then turned to attachment.
+    Direct upload has `key`, file PUT by client to object storage.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='attachment_uploads',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True
+    )
+    filename = models.CharField(max_length=255)
+    filesize = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    checksum = models.CharField(
+        max_length=64,
+        editable=False,
+        null=True,
+        blank=True
+    )
+    key = models.CharField(
+        max_length=255,
+        editable=False,
+        null=True,
+        blank=True
+    )
+    attachment = models.OneToOneField(
+        'snap.Attachment',
+        related_name='upload',
+        on_delete=models.SET_NULL,
+        editable=False,
+        null=True,
+        blank=True
+    )
+
+    # direct upload import claimed by a worker at, error seen by
+    # the client when the import failed (checksum mismatch)
+    import_at = models.DateTimeField(editable=False, null=True, blank=True)
+    error = models.CharField(
+        max_length=255,
+        editable=False,
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        abstract = True
+        indexes = [
+            # unfinished uploads by age, for garbage collect
+            models.Index(
+                fields=['attachment', 'update_at'],
+                name='%(app_label)s_%(class)s_exp_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return '{} ({}/{})'.format(self.filename, self.offset, self.filesize)
+
+    @property
+    def is_direct(self):
+        return bool(self.key)
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.filesize
@@ -1,47 +1,186 @@
 import re
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
+from django.db.models import DEFERRED, Q
+
+from ..counters import update_tag_usage
+from ..trending import push_moment_tags
+
+TAG_RE = re.compile(r'#(\w+)')
 
 
 def extract_tags(content):
     # extracting the tags
-    return re.findall("#(\w+)", content)
+    return TAG_RE.findall(content)
+
+
+def get_tag_key(name):
+    """Same key for tags taggit consider equal"""
+    if getattr(settings, 'TAGGIT_CASE_INSENSITIVE', False):
+        return name.lower()
+    return name
+
+
+def get_or_create_tags(tag_model, names):
+    """
+    Return {key: tag} of `names`, existing tags fetched
+    in one query and missing ones bulk created.
+    """
+    names = {get_tag_key(name): name for name in names}
+    if not names:
+        return dict()
+
+    def fetch():
+        if getattr(settings, 'TAGGIT_CASE_INSENSITIVE', False):
+            q = Q()
+            for name in names.values():
+                q |= Q(name__iexact=name)
+        else:
+            q = Q(name__in=names.values())
+        return {
+            get_tag_key(tag.name): tag
+            for tag in tag_model.objects.filter(q)
+        }
+
+    tags = fetch()
+    missing = [name for key, name in names.items() if key not in tags]
+    if missing:
+        objs = list()
+        for name in missing:
+            tag = tag_model(name=name)
+            tag.slug = tag.slugify(name)
+            objs.append(tag)
+
+        tag_model.objects.bulk_create(objs, ignore_conflicts=True)
+        tags = fetch()
+
+        # slug taken by other tag name, let taggit find a free slug
+        for key, name in names.items():
+            if key not in tags:
+                tags[key] = tag_model.objects.create(name=name)
+
+    return tags
+
+
+def bulk_add_tags(tagged):
+    """
+    Add tags to instances of one model in batch.
+    `tagged` is {instance: [name, ...]}
+    """
+    tagged = {instance: names for instance, names in tagged.items() if names}
+    if not tagged:
+        return
+
+    model = type(next(iter(tagged)))
+    through = model.tags.through
+    tags = get_or_create_tags(
+        through.tag_model(),
+        [name for names in tagged.values() for name in names]
+    )
+
+    content_type = ContentType.objects.get_for_model(model)
+    through.objects.bulk_create(
+        [
+            through(tag=tags[key], content_type=content_type, object_id=instance.id)
+            for instance, names in tagged.items()
+            for key in {get_tag_key(name) for name in names}
+        ],
+        ignore_conflicts=True
+    )
+    update_tag_usage(
+        content_type.id,
+        added=[
+            tags[key].id
+            for names in tagged.values()
+            for key in {get_tag_key(name) for name in names}
+        ]
+    )
+
+    if model._meta.model_name == 'moment':
+        # after commit, moment locations set after their tags
+        trending = {
+            instance.id: list({tags[get_tag_key(name)].name for name in names})
+            for instance, names in tagged.items()
+        }
+        transaction.on_commit(lambda: push_moment_tags(trending))
 
 
 class SetTags(object):
-    @transaction.atomic
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+    """
+    Tags extracted from hashtags in `tag_fields`, only
+    the difference with current tags written on save.
+    """
+    tag_fields = ()
 
-        # set tags after object created!
-        self.set_tags()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._tag_source = instance.get_tag_source()
+        return instance
 
+    def get_tag_source(self):
+        # deferred field is unknown so always re-tagged
+        return tuple(
+            self.__dict__.get(field, DEFERRED)
+            for field in self.tag_fields
+        )
 
-class SetMomentTags(SetTags):
-    def set_tags(self):
-        tags_in_title = extract_tags(self.title)
-        tags_in_summary = []
-        if self.summary:
-            tags_in_summary = extract_tags(self.summary)
+    def get_tags(self):
+        tags = list()
+        for field in self.tag_fields:
+            content = getattr(self, field)
+            if content:
+                tags.extend(extract_tags(content))
+        return tags
 
-        tags = tags_in_title + tags_in_summary
-        if tags:
-            self.tags.set(tags)
+    def set_tags(self, adding=False):
+        through = self.tags.through
+        content_type = ContentType.objects.get_for_model(self)
+        tags = {get_tag_key(name): name for name in self.get_tags()}
+
+        current = dict()
+        if not adding:
+            current = {
+                get_tag_key(name): tag_id for tag_id, name in
+                through.objects
+                .filter(content_type=content_type, object_id=self.id)
+                .values_list('tag_id', 'tag__name')
+            }
+
+        removed = [tag_id for key, tag_id in current.items() if key not in tags]
+        if removed:
+            through.objects.filter(
+                content_type=content_type,
+                object_id=self.id,
+                tag_id__in=removed
+            ).delete()
+            update_tag_usage(content_type.id, removed=removed)
+
+        added = [name for key, name in tags.items() if key not in current]
+        if added:
+            bulk_add_tags({self: added})
+
+        if removed or added:
+            getattr(self, '_prefetched_objects_cache', {}).pop('tags', None)
+        return bool(removed or added)
 
     @transaction.atomic
     def save(self, *args, **kwargs):
+        adding = self._state.adding
         super().save(*args, **kwargs)
 
         # set tags after object created!
-        self.set_tags()
+        source = self.get_tag_source()
+        previous = getattr(self, '_tag_source', (DEFERRED,))
+        if adding or DEFERRED in previous or source != previous:
+            self.set_tags(adding=adding)
+        self._tag_source = source
+
+
+class SetMomentTags(SetTags):
+    tag_fields = ('title', 'summary')
 
 
 class SetAttachmentTags(SetTags):
-    def set_tags(self):
-        tags_in_name = extract_tags(self.name)
-        tags_in_caption = []
-        if self.caption:
-            tags_in_caption = extract_tags(self.caption)
-
-        tags = tags_in_name + tags_in_caption
-        if tags:
-            self.tags.set(tags)
+    tag_fields = ('name', 'caption')
@@ -0,0 +1,193 @@
+"""
+Orphan garbage collector
+
+Locations and attachments created alone wait to be claimed by a moment
+(`content_type` and `object_id` set). Unclaimed ones older than
+`SNAP_GC_TTL` and uploads never completed are deleted in batches read
+from the `unclaimed` index, files deleted in parallel once no other
+attachment share them. Run by celery beat (`collect_orphans` task) or
+the `collect_orphans` command.
+"""
+import logging
+import time
+
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .conf import settings
+from .dedup import delete_files, get_referenced
+from .uploads import delete_partial
+
+METRICS_KEY = 'snap:orphans:{metric}'
+METRICS = ('locations', 'attachments', 'uploads', 'files', 'bytes')
+LAST_RUN_KEY = 'snap:orphans:last_run'
+
+
+def iter_batches(queryset, batch_size):
+    """Lists of (create_at, id) by keyset, index ordered"""
+    last = None
+    while True:
+        batch = queryset.order_by('create_at', 'id')
+        if last:
+            batch = batch.filter(
+                Q(create_at__gt=last[0]) | Q(create_at=last[0], id__gt=last[1])
+            )
+
+        rows = list(batch.values_list('create_at', 'id')[:batch_size])
+        if not rows:
+            return
+
+        yield [row_id for _create_at, row_id in rows]
+        last = rows[-1]
+
+
+def get_unclaimed(model, cutoff):
+    return model.objects.filter(
+        content_type__isnull=True,
+        object_id__isnull=True,
+        create_at__lt=cutoff
+    )
+
+
+def collect_locations(cutoff, batch_size, dry_run=False):
+    Location = apps.get_registered_model('snap', 'Location')
+    queryset = get_unclaimed(Location, cutoff)
+
+    total = 0
+    for ids in iter_batches(queryset, batch_size):
+        if dry_run:
+            total += len(ids)
+            continue
+
+        # filter again, claimed since the batch read stay
+        _deleted, rows = queryset.filter(id__in=ids).delete()
+        total += rows.get(Location._meta.label, 0)
+    return total
+
+
+def collect_attachments(cutoff, batch_size, workers, dry_run=False):
+    Attachment = apps.get_registered_model('snap', 'Attachment')
+    queryset = get_unclaimed(Attachment, cutoff)
+
+    total = files = size = 0
+    for ids in iter_batches(queryset, batch_size):
+        with transaction.atomic():
+            rows = list(
+                queryset
+                .filter(id__in=ids)
+                .select_for_update()
+                .values_list('id', 'file', 'renditions')
+            )
+            if not dry_run:
+                queryset.filter(id__in=[row[0] for row in rows]).delete()
+
+        names = {name for _id, name, _renditions in rows if name}
+        renditions = {
+            rendition['path']
+            for _id, _name, values in rows
+            for rendition in (values or {}).values()
+        }
+
+        # shared with attachments kept, by digest dedup
+        referenced = get_referenced(names, renditions, exclude_ids=ids)
+
+        count, freed = delete_files(
+            [path for path in names | renditions if path not in referenced],
+            workers=workers,
+            dry_run=dry_run
+        )
+        total += len(rows)
+        files += count
+        size += freed
+    return total, files, size
+
+
+def collect_uploads(cutoff, batch_size, dry_run=False):
+    """Uploads never completed, return (uploads, partial bytes)"""
+    AttachmentUpload = apps.get_registered_model('snap', 'AttachmentUpload')
+    queryset = AttachmentUpload.objects.filter(
+        attachment__isnull=True,
+        update_at__lt=cutoff
+    )
+
+    if dry_run:
+        result = queryset.aggregate(total=Count('id'), size=Sum('offset'))
+        return result['total'], result['size'] or 0
+
+    total = size = 0
+    while True:
+        uploads = list(queryset.order_by('update_at', 'id')[:batch_size])
+        if not uploads:
+            return total, size
+
+        for upload in uploads:
+            delete_partial(upload)
+            if upload.is_direct:
+                from .direct_uploads import delete_object
+                delete_object(upload)
+            size += upload.offset
+
+        queryset.filter(id__in=[upload.id for upload in uploads]).delete()
+        total += len(uploads)
+
+
+def collect_orphans(ttl=None, batch_size=None, workers=None, dry_run=False):
+    """Delete orphans of every kind, return metrics of the run"""
+    ttl = settings.SNAP_GC_TTL if ttl is None else ttl
+    batch_size = batch_size or settings.SNAP_GC_BATCH_SIZE
+    workers = workers or settings.SNAP_GC_WORKERS
+    cutoff = timezone.now() - timedelta(seconds=ttl)
+    started = time.monotonic()
+
+    attachments, files, size = collect_attachments(cutoff, batch_size, workers, dry_run)
+    uploads, partial_size = collect_uploads(cutoff, batch_size, dry_run)
+    metrics = {
+        'locations': collect_locations(cutoff, batch_size, dry_run),
+        'attachments': attachments,
+        'uploads': uploads,
+        'files': files,
+        'bytes': size + partial_size,
+    }
+
+    logging.info(
+        'Orphans %s in %.1fs: %s',
+        'found' if dry_run else 'collected',
+        time.monotonic() - started,
+        ' '.join('{}={}'.format(key, value) for key, value in metrics.items())
+    )
+    if not dry_run:
+        record_metrics(metrics)
+    return metrics
+
+
+def record_metrics(metrics):
+    """
+    Totals since first run in the shared cache (celery beat and
+    the command run in other processes), read by `collect_orphans --stats`
+    """
+    cache = caches[settings.SNAP_CACHE]
+    try:
+        for metric, value in metrics.items():
+            key = METRICS_KEY.format(metric=metric)
+            cache.add(key, 0, None)
+            cache.incr(key, value)
+        cache.set(LAST_RUN_KEY, timezone.now().isoformat(), None)
+    except RedisError as e:
+        # totals still logged above
+        logging.warning('Orphans metrics not recorded: %s', e)
+
+
+def get_metrics():
+    cache = caches[settings.SNAP_CACHE]
+    metrics = {
+        metric: cache.get(METRICS_KEY.format(metric=metric), 0)
+        for metric in METRICS
+    }
+    metrics['last_run'] = cache.get(LAST_RUN_KEY)
+    return metrics
@@ -0,0 +1,338 @@
+"""
+Full-text search
+
+Inverted index in two tables, `SearchDocument` per indexed moment,
+attachment or comment and `SearchPosting` per (term, document) with
+the term frequency. Index updated on commit of every save, only the
+postings that changed are written. Same tables on every database
+backend, no FULLTEXT or FTS extension needed.
+
+Results ranked by BM25 computed by the database from the postings of
+the query terms, so cost follow the number of matching postings.
+"""
+import math
+import re
+
+from collections import Counter
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import (
+    Avg,
+    Case,
+    Count,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    Sum,
+    Value,
+    When
+)
+
+from apps.core.geo import bounding_box_q, geohash_q, haversine
+
+TOKEN_RE = re.compile(r'#?\w+')
+TERM_MIN_LENGTH = 2
+TERM_MAX_LENGTH = 64
+TEXT_LENGTH = 255
+
+# indexed fields of every searchable model
+SEARCH_FIELDS = {
+    'moment': ('title', 'summary'),
+    'attachment': ('caption',),
+    'comment': ('comment_content',),
+}
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text, expand=True):
+    """Lower case terms, hashtag give `#tag` and `tag` when `expand`"""
+    terms = list()
+    for token in TOKEN_RE.findall((text or '').lower()):
+        words = [token, token[1:]] if expand and token.startswith('#') else [token]
+        terms.extend(
+            word[:TERM_MAX_LENGTH] for word in words
+            if len(word.lstrip('#')) >= TERM_MIN_LENGTH
+        )
+    return terms
+
+
+def get_models():
+    return {
+        name: apps.get_registered_model('snap', name)
+        for name in SEARCH_FIELDS
+    }
+
+
+def get_moment_ids(model_name, objects):
+    """{object id: moment id} of the moment each object belong to"""
+    Moment = apps.get_registered_model('snap', 'Moment')
+    Attachment = apps.get_registered_model('snap', 'Attachment')
+    moment_ct = ContentType.objects.get_for_model(Moment)
+    attachment_ct = ContentType.objects.get_for_model(Attachment)
+
+    if model_name == 'moment':
+        return {instance.id: instance.id for instance in objects}
+
+    moment_ids = dict()
+    on_attachment = dict()
+    for instance in objects:
+        if not instance.object_id:
+            continue
+
+        if instance.content_type_id == moment_ct.id:
+            moment_ids[instance.id] = int(instance.object_id)
+        elif instance.content_type_id == attachment_ct.id:
+            on_attachment[instance.id] = int(instance.object_id)
+
+    # comment of an attachment belong to the attachment moment
+    if on_attachment:
+        attachments = dict(
+            Attachment.objects
+            .filter(id__in=on_attachment.values(), content_type=moment_ct)
+            .values_list('id', 'object_id')
+        )
+        for object_id, attachment_id in on_attachment.items():
+            if attachments.get(attachment_id):
+                moment_ids[object_id] = int(attachments[attachment_id])
+    return moment_ids
+
+
+def index_objects(model, ids, related=True):
+    """
+    Index or reindex objects of one searchable model,
+    queries count not grow with the number of objects.
+    """
+    SearchDocument = apps.get_registered_model('snap', 'SearchDocument')
+    SearchPosting = apps.get_registered_model('snap', 'SearchPosting')
+    Moment = apps.get_registered_model('snap', 'Moment')
+
+    model_name = model._meta.model_name
+    fields = SEARCH_FIELDS[model_name]
+    content_type = ContentType.objects.get_for_model(model)
+
+    objects = list(model.objects.filter(id__in=set(ids)))
+    gone = set(ids) - {instance.id for instance in objects}
+    if gone:
+        SearchDocument.objects \
+            .filter(content_type=content_type, object_id__in=gone) \
+            .delete()
+    if not objects:
+        return
+
+    moment_ids = get_moment_ids(model_name, objects)
+    visibilities = dict(
+        Moment.objects
+        .filter(id__in=set(moment_ids.values()))
+        .values_list('id', 'visibility')
+    )
+
+    documents = {
+        document.object_id: document for document in
+        SearchDocument.objects.filter(
+            content_type=content_type,
+            object_id__in=[instance.id for instance in objects]
+        )
+    }
+
+    terms = dict()
+    changed = list()
+    created = list()
+    for instance in objects:
+        text = ' '.join(
+            getattr(instance, field) or '' for field in fields
+        ).strip()
+        terms[instance.id] = Counter(tokenize(text))
+
+        moment_id = moment_ids.get(instance.id)
+        values = {
+            'object_guid': instance.guid,
+            'moment_id': moment_id if moment_id in visibilities else None,
+            'visibility': visibilities.get(moment_id)
+            or Moment.get_visibility(instance.user_id),
+            'text': text[:TEXT_LENGTH],
+            'length': sum(terms[instance.id].values()),
+        }
+
+        document = documents.get(instance.id)
+        if document is None:
+            created.append(SearchDocument(
+                content_type=content_type,
+                object_id=instance.id,
+                **values
+            ))
+        elif any(getattr(document, key) != value for key, value in values.items()):
+            for key, value in values.items():
+                setattr(document, key, value)
+            changed.append(document)
+
+    SearchDocument.objects.bulk_update(changed, ['object_guid', 'moment', 'visibility', 'text', 'length'])
+    if created:
+        SearchDocument.objects.bulk_create(created, ignore_conflicts=True)
+        # some backends (mysql) not return pk from bulk_create
+        documents = {
+            document.object_id: document for document in
+            SearchDocument.objects.filter(
+                content_type=content_type,
+                object_id__in=[instance.id for instance in objects]
+            )
+        }
+
+    # only postings that changed
+    document_ids = {document.id: object_id for object_id, document in documents.items()}
+    current = {
+        (document_ids[posting.document_id], posting.term): posting
+        for posting in SearchPosting.objects.filter(document_id__in=document_ids)
+    }
+
+    removed = [
+        posting.id for (object_id, term), posting in current.items()
+        if term not in terms[object_id]
+    ]
+    updated = list()
+    added = list()
+    for object_id, counts in terms.items():
+        for term, frequency in counts.items():
+            posting = current.get((object_id, term))
+            if posting is None:
+                added.append(SearchPosting(
+                    document=documents[object_id],
+                    term=term,
+                    frequency=frequency
+                ))
+            elif posting.frequency != frequency:
+                posting.frequency = frequency
+                updated.append(posting)
+
+    if removed:
+        SearchPosting.objects.filter(id__in=removed).delete()
+    SearchPosting.objects.bulk_update(updated, ['frequency'])
+    SearchPosting.objects.bulk_create(added, ignore_conflicts=True)
+
+    if related and model_name == 'moment':
+        # attachments linked by bulk update after saved, no signal
+        Attachment = apps.get_registered_model('snap', 'Attachment')
+        attachment_ids = list(
+            Attachment.objects
+            .filter(
+                content_type=content_type,
+                object_id__in=[str(instance.id) for instance in objects]
+            )
+            .values_list('id', flat=True)
+        )
+        if attachment_ids:
+            index_objects(Attachment, attachment_ids)
+
+
+def schedule_index(model, ids):
+    """Index after commit, relations set later in same transaction included"""
+    ids = list(ids)
+    transaction.on_commit(lambda: index_objects(model, ids))
+
+
+def delete_documents(model, ids):
+    SearchDocument = apps.get_registered_model('snap', 'SearchDocument')
+    SearchDocument.objects.filter(
+        content_type=ContentType.objects.get_for_model(model),
+        object_id__in=ids
+    ).delete()
+
+
+def get_idf(terms):
+    """{term: idf} and average document length, BM25 idf never negative"""
+    SearchDocument = apps.get_registered_model('snap', 'SearchDocument')
+    SearchPosting = apps.get_registered_model('snap', 'SearchPosting')
+
+    stats = SearchDocument.objects.aggregate(total=Count('id'), length=Avg('length'))
+    frequencies = dict(
+        SearchPosting.objects
+        .filter(term__in=terms)
+        .order_by()
+        .values('term')
+        .annotate(count=Count('id'))
+        .values_list('term', 'count')
+    )
+
+    total = stats['total'] or 0
+    idf = {
+        term: math.log(1 + (total - count + 0.5) / (count + 0.5))
+        for term, count in frequencies.items()
+    }
+    return idf, stats['length'] or 1
+
+
+def search(query, viewer=None, types=None, tag=None,
+           latitude=None, longitude=None, radius=None):
+    """
+    Documents matching any term of `query` annotated with BM25 `score`,
+    order by ('-score', '-id') for keyset pagination.
+    """
+    SearchDocument = apps.get_registered_model('snap', 'SearchDocument')
+    SearchPosting = apps.get_registered_model('snap', 'SearchPosting')
+    Moment = apps.get_registered_model('snap', 'Moment')
+    Location = apps.get_registered_model('snap', 'Location')
+
+    # `#tag` of the query match hashtag only
+    terms = sorted(set(tokenize(query, expand=False)))
+    if not terms:
+        return SearchDocument.objects.none()
+
+    idf, average_length = get_idf(terms)
+    terms = [term for term in terms if term in idf]
+    if not terms:
+        return SearchDocument.objects.none()
+
+    frequency = F('postings__frequency')
+    norm = BM25_K1 * (1 - BM25_B) \
+        + BM25_K1 * BM25_B * F('length') / Value(float(average_length))
+    weight = Case(
+        *[When(postings__term=term, then=Value(idf[term])) for term in terms],
+        output_field=FloatField()
+    )
+
+    queryset = SearchDocument.objects \
+        .filter(postings__term__in=terms) \
+        .annotate(score=Sum(
+            weight * frequency * Value(BM25_K1 + 1) / (frequency + norm),
+            output_field=FloatField()
+        )) \
+        .select_related('content_type')
+
+    # registered viewer see everything
+    if not (viewer is not None and viewer.is_authenticated):
+        queryset = queryset.filter(visibility=Moment.VisibilityChoice.ANONYMOUS)
+
+    if types:
+        queryset = queryset.filter(
+            content_type__in=[
+                ContentType.objects.get_for_model(model)
+                for name, model in get_models().items()
+                if name in types
+            ]
+        )
+
+    if tag:
+        queryset = queryset.filter(Exists(
+            SearchPosting.objects.filter(
+                document=OuterRef('pk'),
+                term='#{}'.format(tag.lstrip('#').lower())
+            )
+        ))
+
+    if latitude is not None and longitude is not None and radius is not None:
+        locations = Location.objects \
+            .filter(content_type=ContentType.objects.get_for_model(Moment)) \
+            .filter(
+                geohash_q(latitude, longitude, radius),
+                bounding_box_q(latitude, longitude, radius)
+            ) \
+            .annotate(distance=haversine(latitude, longitude)) \
+            .filter(distance__lte=radius)
+        queryset = queryset.filter(moment_id__in=locations.values('object_id'))
+
+    return queryset
@@ -0,0 +1,178 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from . import caches, counters, feeds, search
+
+Moment = apps.get_registered_model('snap', 'Moment')
+Attachment = apps.get_registered_model('snap', 'Attachment')
+Comment = apps.get_registered_model('snap', 'Comment')
+
+
+def _related_moment_guids(content_type_id, object_id):
+    """Moment guids a location or attachment belong to"""
+    if not content_type_id or not object_id:
+        return []
+
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    if model is Attachment:
+        attachment = Attachment.objects \
+            .filter(id=object_id) \
+            .values('content_type_id', 'object_id') \
+            .first()
+        if not attachment:
+            return []
+        return _related_moment_guids(**attachment)
+
+    if model is Moment:
+        return list(
+            Moment.objects
+            .filter(id=object_id)
+            .values_list('guid', flat=True)
+        )
+    return []
+
+
+def _invalidate_on_commit(guids):
+    transaction.on_commit(lambda: caches.invalidate_moments(guids))
+
+
+def _invalidate_related(guids):
+    # relation changed, moment `update_at` not
+    caches.touch_moments(guids)
+    _invalidate_on_commit(guids)
+
+
+def moment_delete_handler(sender, instance, **kwargs):
+    # locations deleted along with moment, collect cells first
+    cells = feeds.moment_cells(instance)
+    moment_id = instance.id
+
+    transaction.on_commit(lambda: feeds.remove_moment(moment_id, cells))
+
+
+def moment_cache_handler(sender, instance, **kwargs):
+    _invalidate_on_commit([instance.guid])
+
+
+def moment_related_cache_handler(sender, instance, **kwargs):
+    # location or attachment
+    guids = _related_moment_guids(instance.content_type_id, instance.object_id)
+    if guids:
+        _invalidate_related(guids)
+
+
+def with_cache_handler(sender, instance, **kwargs):
+    guids = list(
+        Moment.objects
+        .filter(id=instance.moment_id)
+        .values_list('guid', flat=True)
+    )
+    _invalidate_related(guids)
+
+
+def m2m_cache_handler(sender, instance, action, **kwargs):
+    # tags of moment or attachment and moment withs
+    if not action.startswith('post_'):
+        return
+
+    if isinstance(instance, Moment):
+        _invalidate_related([instance.guid])
+    elif isinstance(instance, Attachment):
+        moment_related_cache_handler(sender, instance)
+
+
+def _moment_id(content_type_id, object_id):
+    """Moment id a comment or attachment directly belong to"""
+    if not content_type_id or not object_id:
+        return None
+
+    if ContentType.objects.get_for_id(content_type_id).model_class() is Moment:
+        return int(object_id)
+    return None
+
+
+def comment_counter_handler(sender, instance, created=True, **kwargs):
+    if not created:
+        return
+
+    moment_id = _moment_id(instance.content_type_id, instance.object_id)
+    if moment_id:
+        counters.update_moment_counters([moment_id], ['comment_count'])
+        moment_related_cache_handler(sender, instance)
+
+
+def attachment_counter_handler(sender, instance, **kwargs):
+    moment_id = _moment_id(instance.content_type_id, instance.object_id)
+    if moment_id:
+        counters.update_moment_counters([moment_id], ['attachment_count'])
+
+
+def with_counter_handler(sender, instance, created=True, **kwargs):
+    if created:
+        counters.update_moment_counters([instance.moment_id], ['with_count'])
+
+
+def withs_m2m_counter_handler(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # user side, `pk_set` are moments
+        counters.update_moment_counters(pk_set or [], ['with_count'])
+    else:
+        counters.update_moment_counters([instance.id], ['with_count'])
+
+
+def tags_m2m_counter_handler(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if reverse:
+        # tag side, `model` is moment or attachment, clear left to
+        # `reconcile_counters`
+        tag_ids = [instance.id] * len(pk_set or [])
+        content_type_id = ContentType.objects.get_for_model(model).id
+        if action == 'post_add':
+            counters.update_tag_usage(content_type_id, added=tag_ids)
+        elif action == 'post_remove':
+            counters.update_tag_usage(content_type_id, removed=tag_ids)
+        return
+
+    if action == 'pre_clear':
+        instance._cleared_tag_ids = list(
+            instance.tags.values_list('id', flat=True)
+        )
+        return
+
+    # taggit send only tags really added or removed in `pk_set`
+    content_type_id = ContentType.objects.get_for_model(instance).id
+    if action == 'post_add':
+        counters.update_tag_usage(content_type_id, added=pk_set or [])
+    elif action == 'post_remove':
+        counters.update_tag_usage(content_type_id, removed=pk_set or [])
+    elif action == 'post_clear':
+        counters.update_tag_usage(
+            content_type_id,
+            removed=getattr(instance, '_cleared_tag_ids', [])
+        )
+
+
+def tagged_pre_delete_handler(sender, instance, **kwargs):
+    # tagged items deleted along with moment or attachment
+    instance._deleted_tag_ids = list(
+        instance.tags.values_list('id', flat=True)
+    )
+
+
+def tagged_post_delete_handler(sender, instance, **kwargs):
+    counters.update_tag_usage(
+        ContentType.objects.get_for_model(instance).id,
+        removed=getattr(instance, '_deleted_tag_ids', [])
+    )
+
+
+def search_index_handler(sender, instance, **kwargs):
+    search.schedule_index(sender, [instance.id])
+
+
+def search_delete_handler(sender, instance, **kwargs):
+    object_id = instance.id
+    transaction.on_commit(lambda: search.delete_documents(sender, [object_id]))
@@ -0,0 +1,277 @@
+import io
+import logging
+import mimetypes
+import os
+import struct
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from celery import shared_task
+from PIL import Image, ImageOps, UnidentifiedImageError
+from PIL.ExifTags import TAGS
+
+from apps.snap.conf import settings
+
+RENDITION_PATH = 'attachments/renditions/{guid}/{name}.{extension}'
+
+EXIF_ORIENTATION = 0x0112
+EXIF_GPS_INFO = 0x8825
+
+# APP1 (EXIF, XMP), APP13 (IPTC) and comment segments
+JPEG_METADATA_MARKERS = (0xE1, 0xED, 0xFE)
+JPEG_START_OF_SCAN = 0xDA
+
+
+def sniff_mime(file, name):
+    """Return (mime, image), image is None for non image file"""
+    try:
+        image = Image.open(file)
+        image.verify()
+
+        # verify() leave the image unusable, open again
+        file.seek(0)
+        image = Image.open(file)
+        return Image.MIME.get(image.format), image
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        mime, _encoding = mimetypes.guess_type(name)
+        return mime or 'application/octet-stream', None
+
+
+def extract_exif(image):
+    """EXIF as json safe dict, binary values skipped"""
+    exif = dict()
+    for tag, value in image.getexif().items():
+        # location never kept, stripped from the file too
+        if isinstance(value, bytes) or tag == EXIF_GPS_INFO:
+            continue
+
+        name = TAGS.get(tag, str(tag))
+        if not isinstance(value, (int, float, str)):
+            value = str(value)
+        exif[name] = value
+    return exif
+
+
+def make_renditions(attachment, image):
+    """
+    Resize to every `SNAP_ATTACHMENT_RENDITIONS` size, saved without
+    EXIF (stripped) and rotated as the EXIF orientation tell.
+    """
+    image_format = settings.SNAP_ATTACHMENT_RENDITION_FORMAT
+    extension = image_format.lower()
+    storage = attachment.file.storage
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    renditions = dict()
+    for name, size in settings.SNAP_ATTACHMENT_RENDITIONS.items():
+        rendition = image.copy()
+        rendition.thumbnail((size, size), Image.LANCZOS)
+
+        output = io.BytesIO()
+        rendition.save(
+            output,
+            image_format,
+            quality=settings.SNAP_ATTACHMENT_RENDITION_QUALITY
+        )
+
+        path = RENDITION_PATH.format(
+            guid=attachment.guid,
+            name=name,
+            extension=extension
+        )
+        if storage.exists(path):
+            storage.delete(path)
+        path = storage.save(path, ContentFile(output.getvalue()))
+
+        renditions[name] = {
+            'path': path,
+            'width': rendition.width,
+            'height': rendition.height,
+            'size': output.tell(),
+        }
+    return renditions
+
+
+def get_orientation_exif(image):
+    """EXIF holding only the orientation, None when upright"""
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    if orientation == 1:
+        return None
+
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = orientation
+    return exif.tobytes()
+
+
+def strip_jpeg(data, exif=None):
+    """Metadata segments dropped, image data copied as is (lossless)"""
+    output = [data[:2]]
+    position = 2
+    stripped = False
+
+    while position + 4 <= len(data) and data[position] == 0xFF:
+        marker = data[position + 1]
+        if marker == JPEG_START_OF_SCAN:
+            output.append(data[position:])
+            return b''.join(output) if stripped else None
+
+        length, = struct.unpack('>H', data[position + 2:position + 4])
+        segment = data[position:position + 2 + length]
+        position += 2 + length
+
+        if marker not in JPEG_METADATA_MARKERS:
+            output.append(segment)
+            continue
+
+        if exif and not stripped:
+            # orientation kept where the EXIF was
+            output.append(b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif)
+        stripped = True
+
+    # no image data found, leave the file alone
+    return None
+
+
+def strip_metadata(file, image):
+    """
+    Original bytes without metadata, None when nothing stripped.
+    JPEG segments dropped losslessly, PNG and WebP saved again
+    (lossless), other formats kept as uploaded.
+    """
+    exif = get_orientation_exif(image)
+
+    if image.format == 'JPEG':
+        file.seek(0)
+        return strip_jpeg(file.read(), exif)
+
+    if image.format not in ('PNG', 'WEBP') \
+            or getattr(image, 'n_frames', 1) > 1:
+        return None
+
+    if not (image.getexif() or image.info.get('xmp')
+            or image.info.get('exif')):
+        return None
+
+    params = {'lossless': True} if image.format == 'WEBP' else dict()
+    if exif:
+        params['exif'] = exif
+
+    output = io.BytesIO()
+    image.save(output, image.format, **params)
+    return output.getvalue()
+
+
+def replace_file(attachment, data):
+    """
+    Store `data` as the attachment file, every attachment sharing
+    the old file (same digest) moved to it.
+    """
+    Attachment = apps.get_registered_model('snap', 'Attachment')
+    storage = attachment.file.storage
+    old_name = attachment.file.name
+
+    name = storage.save(old_name, ContentFile(data))
+    Attachment.objects.filter(file=old_name).update(
+        file=name,
+        filepath=name,
+        filename=os.path.basename(name),
+        filesize=len(data)
+    )
+    if not Attachment.objects.filter(file=old_name).exists():
+        storage.delete(old_name)
+
+
+@shared_task(ignore_result=True)
+def process_attachment(attachment_id):
+    """Sniff mime, extract EXIF and make renditions of an attachment"""
+    from apps.snap.signals import _related_moment_guids
+    from apps.snap import caches
+
+    Attachment = apps.get_registered_model('snap', 'Attachment')
+
+    try:
+        attachment = Attachment.objects.get(id=attachment_id)
+    except Attachment.DoesNotExist:
+        return
+
+    if not attachment.file:
+        return
+
+    exif = None
+    renditions = dict()
+    stripped = None
+
+    with attachment.file.open('rb') as file:
+        filemime, image = sniff_mime(file, attachment.file.name)
+
+        if image is not None:
+            try:
+                exif = extract_exif(image)
+                renditions = make_renditions(attachment, image)
+                if settings.SNAP_ATTACHMENT_STRIP_METADATA:
+                    stripped = strip_metadata(file, image)
+            except (Image.DecompressionBombError, OSError) as e:
+                logging.warning('Attachment %s rendition failed: %s', attachment_id, e)
+
+    # update() not save(), no new processing scheduled
+    Attachment.objects.filter(id=attachment_id).update(
+        filemime=filemime,
+        exif=exif,
+        renditions=renditions
+    )
+    if stripped is not None:
+        replace_file(attachment, stripped)
+
+    # serialized moments contain renditions
+    guids = _related_moment_guids(attachment.content_type_id, attachment.object_id)
+    caches.touch_moments(guids)
+    caches.invalidate_moments(guids)
+
+
+def schedule_process_attachment(attachment_id):
+    def delay():
+        try:
+            # no publish retry, never block the request
+            process_attachment.apply_async((attachment_id,), retry=False)
+        except Exception as e:
+            # broker down, `process_attachments` command can catch up
+            logging.warning('Attachment processing not scheduled: %s', e)
+
+    transaction.on_commit(delay)
+
+
+@shared_task(ignore_result=True)
+def import_direct_upload(upload_id):
+    """Copy a direct upload object to attachment storage"""
+    from apps.snap.direct_uploads import (
+        claim_direct_upload,
+        import_direct_upload as import_upload
+    )
+
+    # row locked to claim only, download run outside the transaction
+    upload = claim_direct_upload(upload_id)
+    if upload is not None:
+        import_upload(upload)
+
+
+def schedule_import_direct_upload(upload_id):
+    def delay():
+        try:
+            import_direct_upload.apply_async((upload_id,), retry=False)
+        except Exception as e:
+            logging.warning('Direct upload import not scheduled: %s', e)
+
+    transaction.on_commit(delay)
+
+
+@shared_task(ignore_result=True)
+def collect_orphans():
+    """Run by celery beat, see `beat_schedule`"""
+    from apps.snap.orphans import collect_orphans as collect
+
+    collect()
@@ -1,3 +1,1091 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import tempfile
+import time
+import uuid
 
-# Create your tests here.
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+import requests
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches as django_caches
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework.throttling import SimpleRateThrottle
+
+from apps.core import utils as core_utils
+from apps.core.api import throttling
+from apps.core.geo import geohash_encode
+from apps.snap import (
+    caches,
+    counters,
+    direct_uploads,
+    feeds,
+    orphans,
+    tasks,
+    threads,
+    trending,
+    uploads
+)
+from apps.snap.api.v1.moment.filters import MomentQueryPlanner
+from apps.snap.api.v1.moment.serializers import CreateMomentSerializer
+from apps.snap.conf import settings
+
+try:
+    import boto3
+    import moto
+except ImportError:
+    boto3 = moto = None
+
+try:
+    import fakeredis
+    from fakeredis import aioredis
+except ImportError:
+    fakeredis = aioredis = None
+
+AttachmentUpload = apps.get_registered_model('snap', 'AttachmentUpload')
+
+# every worker share `snap` in production (Redis)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'snap': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'snap',
+    },
+}
+
+
+@override_settings(CACHES=CACHES)
+class MomentCacheTest(TestCase):
+    def setUp(self):
+        django_caches['snap'].clear()
+        django_caches['default'].clear()
+
+    def get_request(self, **params):
+        request = APIRequestFactory().get('/', params)
+        request.user = None
+        request.query_params = request.GET
+        return request
+
+    def test_stored_in_snap_cache(self):
+        key = caches.get_list_key(self.get_request())
+        self.assertIsNone(caches.get_response(key))
+        caches.set_response(key, {'results': []})
+
+        self.assertEqual(caches.get_response(key), ({'results': []}, {}))
+        self.assertIsNotNone(django_caches['snap'].get(key))
+        self.assertIsNone(django_caches['default'].get(key))
+        self.assertEqual(caches.get_stats(), {'hits': 1, 'misses': 1})
+
+    def test_invalidate_change_key(self):
+        request = self.get_request(latitude='-6.2001', longitude='106.8')
+        key = caches.get_list_key(request)
+        detail_key = caches.get_detail_key(request, 'guid')
+
+        caches.invalidate_moments(['guid'])
+        self.assertNotEqual(caches.get_list_key(request), key)
+        self.assertNotEqual(caches.get_detail_key(request, 'guid'), detail_key)
+
+    def test_fail_open(self):
+        broken = mock.Mock()
+        broken.get.side_effect = RedisConnectionError('down')
+        broken.set.side_effect = RedisConnectionError('down')
+        broken.incr.side_effect = RedisConnectionError('down')
+
+        with mock.patch.object(caches, 'get_cache', return_value=broken):
+            key = caches.get_list_key(self.get_request())
+            self.assertIsNone(key)
+            self.assertIsNone(caches.get_response(key))
+            caches.set_response(key, {})
+            caches.invalidate_moments(['guid'])
+
+
+class LocationGeohashTest(TestCase):
+    def test_bulk_write_set_geohash(self):
+        Location = apps.get_registered_model('snap', 'Location')
+        Location.objects.bulk_create([Location(latitude=-6.2, longitude=106.8)])
+
+        location = Location.objects.get()
+        self.assertEqual(location.geohash, geohash_encode(-6.2, 106.8))
+
+        location.latitude = 1.5
+        Location.objects.bulk_update([location], ['latitude'])
+        location.refresh_from_db()
+        self.assertEqual(location.geohash, geohash_encode(1.5, 106.8))
+
+        with self.assertRaises(ValueError):
+            Location.objects.update(latitude=0)
+
+
+@override_settings(CACHES=CACHES)
+class BulkCreateMomentTest(APITestCase):
+    def test_moments_indexed(self):
+        Location = apps.get_registered_model('snap', 'Location')
+        SearchDocument = apps.get_registered_model('snap', 'SearchDocument')
+        locations = [
+            Location.objects.create(latitude=-6.2, longitude=106.8)
+            for _i in range(2)
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/snap/v1/moments/bulk/',
+                {'moments': [
+                    {'title': 'flood #banjir', 'locations': [str(locations[0].guid)]},
+                    {'title': 'sunny beach', 'locations': [str(locations[1].guid)]},
+                ]},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            SearchDocument.objects.filter(content_type__model='moment').count(),
+            2
+        )
+
+
+@override_settings(CACHES=CACHES)
+class TagUsageTest(TestCase):
+    def get_usage(self):
+        TagUsage = apps.get_registered_model('snap', 'TagUsage')
+        return dict(
+            TagUsage.objects
+            .filter(content_type__model='moment')
+            .values_list('tag__name', 'count')
+        )
+
+    def test_shift_by_added_and_removed(self):
+        Moment = apps.get_registered_model('snap', 'Moment')
+        first = Moment.objects.create(title='#flood #rain')
+        Moment.objects.create(title='#flood')
+        self.assertEqual(self.get_usage(), {'flood': 2, 'rain': 1})
+
+        first.title = '#rain #storm'
+        first.save()
+        self.assertEqual(self.get_usage(), {'flood': 1, 'rain': 1, 'storm': 1})
+
+        first.tags.clear()
+        first.delete()
+        self.assertEqual(self.get_usage(), {'flood': 1, 'rain': 0, 'storm': 0})
+
+    def test_never_below_zero(self):
+        Moment = apps.get_registered_model('snap', 'Moment')
+        moment = Moment.objects.create(title='#flood')
+        content_type_id = ContentType.objects.get_for_model(Moment).id
+        tag_id = moment.tags.get().id
+
+        counters.update_tag_usage(content_type_id, removed=[tag_id] * 3)
+        self.assertEqual(self.get_usage(), {'flood': 0})
+
+
+@override_settings(CACHES=CACHES)
+class MomentQueryPlannerTest(APITestCase):
+    def setUp(self):
+        django_caches['snap'].clear()
+        Moment = apps.get_registered_model('snap', 'Moment')
+        self.moments = [
+            Moment.objects.create(
+                title='#flood {}'.format(index),
+                visibility=Moment.VisibilityChoice.ANONYMOUS
+            )
+            for index in range(3)
+        ]
+
+    def test_plan_served_on_hit(self):
+        url = '/api/snap/v1/moments/'
+        miss = self.client.get(url, {'tags': 'flood'})
+        hit = self.client.get(url, {'tags': 'flood'})
+
+        self.assertEqual(miss['X-Cache'], 'MISS')
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertEqual(hit['X-Query-Plan'], miss['X-Query-Plan'])
+        self.assertEqual(len(hit.data['results']), 3)
+
+    def test_relative_time_resolved_in_key(self):
+        request = APIRequestFactory().get('/', {'since': '6h'})
+        request.query_params = request.GET
+        key = caches.normalize_params(request)
+
+        with mock.patch('time.time', return_value=time.time() + 3600):
+            self.assertNotEqual(caches.normalize_params(request), key)
+
+    @override_settings(SNAP_MOMENT_PLAN_MAX_CANDIDATES=2)
+    def test_drifted_tag_usage_fallback_to_join(self):
+        TagUsage = apps.get_registered_model('snap', 'TagUsage')
+        TagUsage.objects.update(count=0)
+
+        planner = MomentQueryPlanner(tags=['flood'])
+        queryset = planner.filter(apps.get_registered_model('snap', 'Moment').objects.all())
+
+        self.assertEqual(set(queryset), set(self.moments))
+        self.assertEqual(planner.plan, 'tag:0 > tag:overflow > tag:scan')
+
+    def test_candidates_of_visible_moments(self):
+        Moment = apps.get_registered_model('snap', 'Moment')
+        user = get_user_model().objects.create_user('author', password=None)
+        registered = Moment.objects.create(title='#flood', user=user)
+
+        planner = MomentQueryPlanner(
+            since=registered.create_at - timedelta(hours=1),
+            viewer=AnonymousUser()
+        )
+        filters = dict((item[0], item) for item in planner.get_filters())
+        self.assertEqual(filters['time'][1], 3)
+        self.assertIn('visibility', str(filters['time'][2].query))
+
+        planner = MomentQueryPlanner(user=user.guid, viewer=AnonymousUser())
+        self.assertEqual(planner.get_filters()[0][1], 0)
+        planner = MomentQueryPlanner(user=user.guid, viewer=user)
+        self.assertEqual(planner.get_filters()[0][1], 1)
+
+
+@override_settings(CACHES=CACHES)
+class MomentListQueriesTest(APITestCase):
+    """Moment list run in a fixed number of queries whatever the page size"""
+    QUERIES = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        UserModel = get_user_model()
+        Moment = apps.get_registered_model('snap', 'Moment')
+        Attachment = apps.get_registered_model('snap', 'Attachment')
+        With = apps.get_registered_model('snap', 'With')
+
+        user = UserModel.objects.create_user('moment-owner', password=None)
+        cls.viewer = UserModel.objects.create_user('moment-with', password=None)
+
+        for index in range(100):
+            moment = Moment.objects.create(
+                title='moment {} #check #query'.format(index),
+                summary='#summary',
+                user=user
+            )
+            moment.locations.create(latitude=-6.2, longitude=106.8)
+
+            attachment = Attachment.objects.create(
+                name='attachment {} #check'.format(index),
+                caption='#caption'
+            )
+            attachment.locations.create(latitude=-6.2, longitude=106.8)
+            moment.attachments.add(attachment)
+
+            With.objects.create(user=cls.viewer, moment=moment)
+
+    def setUp(self):
+        # registered viewer see every seeded (non-anonym) moment
+        self.client.force_authenticate(self.viewer)
+
+    def test_list_and_nearby(self):
+        for params in ({}, {'latitude': -6.2, 'longitude': 106.8}):
+            for limit in (25, 100):
+                with self.subTest(params=params, limit=limit):
+                    # cold cache, worst case
+                    django_caches['snap'].clear()
+
+                    # first cursor page
+                    with self.assertNumQueries(self.QUERIES):
+                        response = self.client.get(
+                            '/api/snap/v1/moments/',
+                            {'limit': limit, 'cursor': '', **params}
+                        )
+                    self.assertEqual(len(response.data['results']), limit)
+
+
+@skipUnless(moto and boto3, "moto and boto3 required")
+@override_settings(
+    CACHES=CACHES,
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    SNAP_DIRECT_UPLOAD_BUCKET='snap-test',
+    SNAP_DIRECT_UPLOAD_REGION='us-east-1',
+    SNAP_DIRECT_UPLOAD_ACCESS_KEY_ID='testing',
+    SNAP_DIRECT_UPLOAD_SECRET_ACCESS_KEY='testing'
+)
+class DirectUploadTest(APITestCase):
+    data = b'direct upload ' * 1024
+
+    def setUp(self):
+        mock_aws = moto.mock_aws()
+        mock_aws.start()
+        self.addCleanup(mock_aws.stop)
+
+        # client bound to the mocked endpoints
+        direct_uploads._client = None
+        self.addCleanup(setattr, direct_uploads, '_client', None)
+        direct_uploads.get_client().create_bucket(Bucket='snap-test')
+
+    def upload(self, checksum):
+        response = self.client.post(
+            '/api/snap/v1/attachments/uploads/',
+            {'filename': 'direct.txt', 'filesize': len(self.data), 'direct': True},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        guid = response.data['guid']
+        presigned = response.data['presigned']
+
+        put = requests.put(
+            presigned['url'],
+            data=self.data,
+            headers=presigned['headers']
+        )
+        self.assertEqual(put.status_code, 200)
+
+        response = self.client.post(
+            '/api/snap/v1/attachments/uploads/{}/complete/'.format(guid),
+            {'checksum': checksum},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+
+        upload = AttachmentUpload.objects.get(guid=guid)
+        tasks.import_direct_upload(upload.id)
+        upload.refresh_from_db()
+        return upload
+
+    def test_import(self):
+        upload = self.upload(hashlib.sha256(self.data).hexdigest())
+
+        self.assertIsNone(upload.error)
+        with upload.attachment.file.open('rb') as file:
+            self.assertEqual(file.read(), self.data)
+        self.assertIsNone(direct_uploads.get_object_size(upload))
+
+    def test_checksum_mismatch(self):
+        upload = self.upload('0' * 64)
+
+        self.assertFalse(upload.attachment.file)
+        response = self.client.get(
+            '/api/snap/v1/attachments/uploads/{}/'.format(upload.guid)
+        )
+        self.assertEqual(response.data['error'], 'File checksum mismatch')
+
+        # never imported again
+        self.assertIsNone(direct_uploads.claim_direct_upload(upload.id))
+
+
+@override_settings(CACHES=CACHES)
+class MomentFragmentTest(APITestCase):
+    def setUp(self):
+        django_caches['snap'].clear()
+        Moment = apps.get_registered_model('snap', 'Moment')
+        self.moment = Moment.objects.create(
+            title='#flood',
+            visibility=Moment.VisibilityChoice.ANONYMOUS
+        )
+
+    def test_relation_change_not_served_stale(self):
+        With = apps.get_registered_model('snap', 'With')
+        user = get_user_model().objects.create_user('with', password=None)
+        url = '/api/snap/v1/moments/{}/'.format(self.moment.guid)
+        self.assertEqual(self.client.get(url).data['with_count'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            With.objects.create(user=user, moment=self.moment)
+        self.assertEqual(self.client.get(url).data['with_count'], 1)
+
+    def test_fragment_of_older_version_never_read(self):
+        stale = type(self.moment).objects.get(id=self.moment.id)
+
+        # reader loaded the moment before the relation changed
+        caches.touch_moments([self.moment.guid])
+        caches.set_fragments({stale: {'title': 'stale'}}, 'testserver')
+
+        self.moment.refresh_from_db()
+        self.assertEqual(caches.get_fragments([self.moment], 'testserver'), {})
+
+
+@override_settings(CACHES=CACHES, MEDIA_ROOT=tempfile.mkdtemp())
+class AttachmentMetadataTest(TestCase):
+    def make_image(self, image_format):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010f] = 'Camera'
+        exif[0x8825] = {1: 'S', 2: (6.0, 12.0, 0.0)}
+
+        output = io.BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(output, image_format, exif=exif)
+        return output.getvalue()
+
+    def process(self, name, data):
+        Attachment = apps.get_registered_model('snap', 'Attachment')
+        attachment = Attachment.objects.create(
+            file=SimpleUploadedFile(name, data)
+        )
+        tasks.process_attachment(attachment.id)
+        attachment.refresh_from_db()
+        return attachment
+
+    def test_strip(self):
+        for name, image_format in (('a.jpg', 'JPEG'), ('a.png', 'PNG')):
+            with self.subTest(image_format=image_format):
+                attachment = self.process(name, self.make_image(image_format))
+
+                with attachment.file.open('rb') as file:
+                    image = Image.open(file)
+                    image.load()
+                    exif = image.getexif()
+                    self.assertEqual(image.size, (40, 20))
+                self.assertEqual(dict(exif), {0x0112: 6})
+                self.assertEqual(attachment.filesize, attachment.file.size)
+                self.assertNotIn('GPSInfo', attachment.exif)
+                self.assertEqual(attachment.exif['Make'], 'Camera')
+
+    def test_nothing_to_strip(self):
+        output = io.BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(output, 'JPEG')
+
+        attachment = self.process('plain.jpg', output.getvalue())
+        with attachment.file.open('rb') as file:
+            self.assertEqual(file.read(), output.getvalue())
+
+
+@override_settings(CACHES=CACHES)
+class OrphanMetricsTest(TestCase):
+    def test_recorded_in_snap_cache(self):
+        django_caches['snap'].clear()
+        orphans.record_metrics({'locations': 2, 'bytes': 10})
+        orphans.record_metrics({'locations': 1, 'bytes': 5})
+
+        metrics = orphans.get_metrics()
+        self.assertEqual(metrics['locations'], 3)
+        self.assertEqual(metrics['bytes'], 15)
+        self.assertIsNotNone(metrics['last_run'])
+        self.assertIsNone(django_caches['default'].get('snap:orphans:locations'))
+
+
+@override_settings(CACHES=CACHES)
+class PaginationTest(APITestCase):
+    url = '/api/snap/v1/moments/'
+
+    @classmethod
+    def setUpTestData(cls):
+        Moment = apps.get_registered_model('snap', 'Moment')
+        for index in range(3):
+            Moment.objects.create(
+                title='moment {}'.format(index),
+                visibility=Moment.VisibilityChoice.ANONYMOUS
+            )
+
+    def setUp(self):
+        django_caches['snap'].clear()
+
+    def test_limit_without_cursor_keep_limit_offset(self):
+        response = self.client.get(self.url, {'limit': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertIn('offset=2', response.data['next'])
+
+    def test_cursor_pages(self):
+        response = self.client.get(self.url, {'limit': 2, 'cursor': ''})
+        self.assertNotIn('count', response.data)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor_not_found(self):
+        for values in (['yesterday', 1], ['2026-01-01T00:00:00Z', 'abc'], [None, 1]):
+            with self.subTest(values=values):
+                cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=CACHES)
+class DeviceOwnerTest(APITestCase):
+    def setUp(self):
+        Attribute = apps.get_registered_model('eav', 'Attribute')
+        for slug in ('device_uuid', 'device_imei'):
+            Attribute.objects.create(
+                slug=slug,
+                name=slug,
+                datatype=Attribute.TYPE_TEXT
+            )
+
+    def create_moment(self, attributes, locations=None):
+        if locations is None:
+            locations = [
+                self.client.post(
+                    '/api/snap/v1/locations/',
+                    {'latitude': -6.2, 'longitude': 106.8},
+                    format='json'
+                ).data['guid']
+            ]
+        return self.client.post(
+            '/api/snap/v1/moments/',
+            {
+                'title': 'anonym',
+                'locations': locations,
+                'attributes': [
+                    {'slug': slug, 'value_text': value}
+                    for slug, value in attributes.items()
+                ],
+            },
+            format='json'
+        )
+
+    def test_validation_not_create_device(self):
+        Device = apps.get_registered_model('snap', 'Device')
+        request = APIRequestFactory().post('/api/snap/v1/moments/')
+        request.user = AnonymousUser()
+        serializer = CreateMomentSerializer(
+            data={
+                'title': 'anonym',
+                'locations': [],
+                'attributes': [{'slug': 'device_uuid', 'value_text': 'u1'}],
+            },
+            context={'request': request}
+        )
+
+        # resolved on save, rejected requests not write devices
+        self.assertTrue(serializer.is_valid())
+        self.assertFalse(Device.objects.exists())
+
+    def test_owner_match_attribute_subset(self):
+        Device = apps.get_registered_model('snap', 'Device')
+        response = self.create_moment({'device_uuid': 'u1', 'device_imei': 'i1'})
+        self.assertEqual(response.status_code, 201)
+        device = Device.objects.get()
+
+        self.assertTrue(Device.objects.is_match(device.id, {'device_uuid': 'u1'}))
+        self.assertTrue(Device.objects.is_match(device.id, {'device_imei': 'i1'}))
+        self.assertFalse(Device.objects.is_match(device.id, {'device_uuid': 'u2'}))
+        self.assertFalse(Device.objects.is_match(
+            device.id,
+            {'device_uuid': 'u1', 'device_iccid': 'c1'}
+        ))
+
+        # subset not create another device nor change the owner
+        response = self.client.delete(
+            '/api/snap/v1/moments/{}/'.format(response.data['guid']),
+            {'attributes': [{'slug': 'device_uuid', 'value_text': 'u1'}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Device.objects.count(), 1)
+
+
+@override_settings(CACHES=CACHES)
+class CommentThreadTest(APITestCase):
+    # target, roots page (reply counts annotated), first replies
+    THREAD_QUERIES = 3
+
+    def setUp(self):
+        Moment = apps.get_registered_model('snap', 'Moment')
+        self.moment, self.other = [
+            Moment.objects.create(
+                title=title,
+                visibility=Moment.VisibilityChoice.ANONYMOUS
+            )
+            for title in ('moment', 'other')
+        ]
+
+    def comment(self, moment, parent=None):
+        data = {
+            'content_type': 'moment',
+            'object_id': str(moment.guid),
+            'comment_content': 'comment',
+        }
+        if parent:
+            data['parent'] = str(parent)
+        return self.client.post('/api/snap/v1/comments/', data, format='json')
+
+    def test_parent_of_another_object_rejected(self):
+        Comment = apps.get_registered_model('snap', 'Comment')
+        parent = self.comment(self.other).data['guid']
+
+        response = self.comment(self.moment, parent=parent)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.data)
+        self.assertEqual(Comment.objects.count(), 1)
+
+        response = self.comment(self.other, parent=parent)
+        self.assertEqual(response.status_code, 201)
+
+    def reply(self, parent, moment=None):
+        Comment = apps.get_registered_model('snap', 'Comment')
+        CommentTree = apps.get_registered_model('snap', 'CommentTree')
+        moment = moment or self.moment
+        comment = Comment.objects.create(
+            content_type=ContentType.objects.get_for_model(moment),
+            object_id=moment.id,
+            comment_content='comment'
+        )
+        if parent:
+            CommentTree.objects.create(parent=parent, child=comment)
+        return comment
+
+    def get_thread(self, replies, **params):
+        response = self.client.get('/api/snap/v1/comments/', {
+            'content_type': 'moment',
+            'object_id': str(self.moment.guid),
+            'replies': replies,
+            **params
+        })
+        self.assertEqual(response.status_code, 200)
+        return {root['guid']: root for root in response.data['results']}
+
+    def test_nested_tree(self):
+        root = self.reply(None)
+        first = self.reply(root)
+        nested = self.reply(first)
+        second = self.reply(root)
+        alone = self.reply(None)
+
+        def guids(comments):
+            return [comment['guid'] for comment in comments]
+
+        # `replies` first replies in thread order, nested under parent
+        thread = self.get_thread(2)
+        self.assertEqual(thread[str(root.guid)]['reply_count'], 3)
+        self.assertEqual(guids(thread[str(root.guid)]['replies']), [str(first.guid)])
+        self.assertEqual(
+            guids(thread[str(root.guid)]['replies'][0]['replies']),
+            [str(nested.guid)]
+        )
+        self.assertEqual(thread[str(alone.guid)]['reply_count'], 0)
+        self.assertEqual(thread[str(alone.guid)]['replies'], [])
+
+        thread = self.get_thread(3)
+        self.assertEqual(
+            guids(thread[str(root.guid)]['replies']),
+            [str(first.guid), str(second.guid)]
+        )
+        self.assertEqual(
+            thread[str(root.guid)]['replies'][0]['parent'],
+            str(root.guid)
+        )
+
+    def test_replies_capped(self):
+        root = self.reply(None)
+        for _i in range(3):
+            self.reply(root)
+
+        thread = self.get_thread(1)
+        self.assertEqual(len(thread[str(root.guid)]['replies']), 1)
+        with override_settings(SNAP_COMMENT_MAX_REPLIES=2):
+            thread = self.get_thread(10)
+        self.assertEqual(len(thread[str(root.guid)]['replies']), 2)
+        self.assertEqual(thread[str(root.guid)]['reply_count'], 3)
+
+    def test_thread_queries(self):
+        """Thread page in a fixed number of queries whatever its size"""
+        Moment = apps.get_registered_model('snap', 'Moment')
+        for total in (5, 20):
+            with self.subTest(total=total):
+                self.moment = Moment.objects.create(
+                    title='thread',
+                    visibility=Moment.VisibilityChoice.ANONYMOUS
+                )
+                for _i in range(total):
+                    parent = self.reply(None)
+                    for _j in range(3):
+                        parent = self.reply(parent)
+
+                with self.assertNumQueries(self.THREAD_QUERIES):
+                    thread = self.get_thread(3, limit=total, cursor='')
+                self.assertEqual(len(thread), total)
+                self.assertTrue(all(
+                    root['reply_count'] == 3 for root in thread.values()
+                ))
+
+    def test_thread_of_hidden_moment_not_found(self):
+        Moment = apps.get_registered_model('snap', 'Moment')
+        user = get_user_model().objects.create_user('author', password=None)
+        hidden = Moment.objects.create(title='registered', user=user)
+
+        self.client.force_authenticate(user)
+        guid = self.comment(hidden).data['guid']
+        self.comment(self.moment)
+        params = {'content_type': 'moment', 'object_id': str(hidden.guid)}
+        self.assertEqual(
+            self.client.get('/api/snap/v1/comments/', params).status_code,
+            200
+        )
+
+        self.client.force_authenticate(None)
+        self.assertEqual(
+            self.client.get('/api/snap/v1/comments/', params).status_code,
+            404
+        )
+        self.assertEqual(
+            self.client.get('/api/snap/v1/comments/{}/'.format(guid)).status_code,
+            404
+        )
+        self.assertEqual(self.comment(hidden).status_code, 400)
+
+        response = self.client.get('/api/snap/v1/comments/', {'content_type': 'moment'})
+        self.assertEqual(
+            [comment['guid'] for comment in response.data['results']],
+            [str(comment.guid) for comment in threads.get_thread(
+                ContentType.objects.get_for_model(Moment),
+                self.moment.id
+            )]
+        )
+
+
+@override_settings(
+    CACHES=CACHES,
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    SNAP_UPLOAD_TEMP_DIR=tempfile.mkdtemp()
+)
+class ChunkedUploadTest(APITestCase):
+    data = b'0123456789' * 10
+
+    def setUp(self):
+        response = self.client.post(
+            '/api/snap/v1/attachments/uploads/',
+            {'filename': 'chunked.txt', 'filesize': len(self.data)},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.url = '/api/snap/v1/attachments/uploads/{}/'.format(response.data['guid'])
+        self.upload = AttachmentUpload.objects.get(guid=response.data['guid'])
+
+    def append(self, data, offset, checksum=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        if checksum:
+            headers['HTTP_UPLOAD_CHECKSUM'] = checksum
+        return self.client.generic(
+            'PATCH',
+            self.url,
+            data,
+            content_type='application/offset+octet-stream',
+            **headers
+        )
+
+    def get_partial(self):
+        with open(uploads.get_partial_path(self.upload), 'rb') as file:
+            return file.read()
+
+    def complete(self, checksum):
+        return self.client.post(
+            self.url + 'complete/',
+            {'name': 'chunked', 'checksum': checksum},
+            format='json'
+        )
+
+    def test_offset_mismatch_conflict(self):
+        self.assertEqual(self.append(self.data[:40], 0).data['offset'], 40)
+
+        response = self.append(self.data[40:], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 40)
+
+    def test_failed_chunk_truncated_to_offset(self):
+        self.append(self.data[:40], 0)
+
+        # checksum mismatch
+        response = self.append(self.data[40:80], 40, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_partial(), self.data[:40])
+
+        # connection dropped midway
+        self.upload.refresh_from_db()
+        with self.assertRaises(DjangoValidationError):
+            uploads.append_chunk(self.upload, io.BytesIO(self.data[40:60]), 40)
+        self.assertEqual(self.get_partial(), self.data[:40])
+
+        response = self.append(
+            self.data[40:80],
+            40,
+            checksum=hashlib.sha256(self.data[40:80]).hexdigest()
+        )
+        self.assertEqual(response.data['offset'], 80)
+
+    def test_chunk_over_filesize(self):
+        response = self.append(self.data + b'!', 0)
+        self.assertEqual(response.status_code, 400)
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.offset, 0)
+
+    def test_complete_verify_checksum(self):
+        Attachment = apps.get_registered_model('snap', 'Attachment')
+        self.append(self.data[:50], 0)
+        self.assertEqual(self.complete('0' * 64).status_code, 400)
+
+        self.append(self.data[50:], 50)
+        self.assertFalse(Attachment.objects.exists())
+        self.assertEqual(self.complete('0' * 64).status_code, 400)
+        self.assertFalse(Attachment.objects.exists())
+
+        response = self.complete(hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachment.objects.get()
+        with attachment.file.open('rb') as file:
+            self.assertEqual(file.read(), self.data)
+
+
+@override_settings(CACHES=CACHES, MEDIA_ROOT=tempfile.mkdtemp())
+class DownloadTest(APITestCase):
+    data = bytes(range(256)) * 4
+
+    def setUp(self):
+        Attachment = apps.get_registered_model('snap', 'Attachment')
+        self.attachment = Attachment.objects.create(
+            file=SimpleUploadedFile('data.bin', self.data)
+        )
+        self.url = '/api/snap/v1/attachments/{}/download/'.format(
+            self.attachment.guid)
+
+    def get(self, **headers):
+        return self.client.get(self.url, **headers)
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+
+        # end past the size clamped
+        response = self.get(HTTP_RANGE='bytes=1000-2000')
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1023/1024')
+
+    def test_suffix_range(self):
+        response = self.get(HTTP_RANGE='bytes=-24')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1023/1024')
+        self.assertEqual(b''.join(response.streaming_content), self.data[-24:])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE='bytes=1024-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+
+        etag = response['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+            304
+        )
+
+    def test_if_range_mismatch_whole_file(self):
+        etag = self.get()['ETag']
+
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"changed"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '1024')
+
+    def test_offload_headers(self):
+        with override_settings(SNAP_DOWNLOAD_ACCEL_REDIRECT_PREFIX='/protected/'):
+            response = self.get(HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected/' + self.attachment.file.name
+        )
+        self.assertEqual(response.content, b'')
+
+        with override_settings(SNAP_DOWNLOAD_SENDFILE=True):
+            response = self.get()
+        self.assertEqual(response['X-Sendfile'], self.attachment.file.path)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+
+@skipUnless(fakeredis, "fakeredis not installed")
+@override_settings(CACHES=CACHES)
+class NearbyFeedTest(APITestCase):
+    def setUp(self):
+        django_caches['snap'].clear()
+        redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patcher = mock.patch.object(core_utils, '_redis_connection', redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        Moment = apps.get_registered_model('snap', 'Moment')
+        Location = apps.get_registered_model('snap', 'Location')
+        self.moments = list()
+        for index in range(3):
+            moment = Moment.objects.create(
+                title='nearby {}'.format(index),
+                visibility=Moment.VisibilityChoice.ANONYMOUS
+            )
+            Location.objects.create(
+                content_object=moment,
+                latitude=-6.2 + index * 0.001,
+                longitude=106.8
+            )
+            self.moments.append(moment)
+
+    def test_cold_feed_read_database(self):
+        self.assertIsNone(feeds.read_feed(-6.2, 106.8, 10))
+
+        # pushed after deploy, feed still not built
+        feeds.push_moment(self.moments[0])
+        self.assertIsNone(feeds.read_feed(-6.2, 106.8, 10))
+
+        response = self.client.get(
+            '/api/snap/v1/moments/',
+            {'feed': 'nearby', 'latitude': -6.2, 'longitude': 106.8}
+        )
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_rebuild(self):
+        call_command('rebuild_moment_feed', '--clear', stdout=io.StringIO())
+
+        entries = feeds.read_feed(-6.2, 106.8, 10, anonymous=True)
+        self.assertEqual(
+            [moment_id for moment_id, _score in entries],
+            [moment.id for moment in reversed(self.moments)]
+        )
+        # cells without any moment read the database
+        self.assertIsNone(feeds.read_feed(40.7, -74.0, 10))
+
+
+@override_settings(CACHES=CACHES)
+class AsyncViewTest(APITestCase):
+    def setUp(self):
+        django_caches['snap'].clear()
+        Moment = apps.get_registered_model('snap', 'Moment')
+        self.moments = [
+            Moment.objects.create(
+                title='async {} #flood'.format(index),
+                visibility=Moment.VisibilityChoice.ANONYMOUS
+            )
+            for index in range(3)
+        ]
+
+    def assertParity(self, path, params=None):
+        sync = self.client.get('/api/snap/v1/' + path, params)
+        # cached sync response never served to the async route
+        django_caches['snap'].clear()
+        response = self.client.get('/api/snap/v1/async/' + path, params)
+
+        self.assertEqual(response.status_code, sync.status_code)
+        self.assertEqual(json.loads(response.content), json.loads(sync.content))
+        return response
+
+    def test_moment_list(self):
+        response = self.assertParity('moments/', {'cursor': ''})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(json.loads(response.content)['results']), 3)
+
+        response = self.client.get('/api/snap/v1/async/moments/', {'cursor': ''})
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_moment_detail(self):
+        self.assertParity('moments/{}/'.format(self.moments[0].guid))
+        response = self.assertParity('moments/{}/'.format(uuid.uuid4()))
+        self.assertEqual(response.status_code, 404)
+
+    def test_tag_list(self):
+        self.assertParity('tags/')
+        self.assertParity('tags/', {'window': '24h'})
+
+    @skipUnless(fakeredis, "fakeredis not installed")
+    @mock.patch.object(
+        SimpleRateThrottle,
+        'THROTTLE_RATES',
+        {'anon': '2/minute', 'user': '100/minute'}
+    )
+    def test_throttled(self):
+        server = fakeredis.FakeServer()
+        with mock.patch.object(
+            throttling,
+            'get_async_redis_connection',
+            side_effect=lambda: aioredis.FakeRedis(server=server)
+        ):
+            statuses = [
+                self.client.get('/api/snap/v1/async/tags/').status_code
+                for _i in range(3)
+            ]
+            response = self.client.get('/api/snap/v1/async/moments/')
+
+        self.assertEqual(statuses, [200, 200, 429])
+        # one bucket per client, shared by every async route
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response['Retry-After']), (29, 30))
+
+
+@skipUnless(fakeredis, "fakeredis not installed")
+@override_settings(CACHES=CACHES)
+class TrendingTest(APITestCase):
+    def setUp(self):
+        django_caches['snap'].clear()
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patcher = mock.patch.object(core_utils, '_redis_connection', self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_windows(self):
+        now = timezone.now()
+        trending.push_tags(['flood', 'rain'], now=now)
+        trending.push_tags(['flood'], now=now - timedelta(hours=3))
+        trending.push_tags(['drought'], now=now - timedelta(days=3))
+        trending.push_tags(['ancient'], now=now - timedelta(days=10))
+
+        self.assertEqual(
+            trending.read_trending('24h', 10),
+            [('flood', 2), ('rain', 1)]
+        )
+        self.assertEqual(
+            trending.read_trending('7d', 10),
+            [('flood', 2), ('rain', 1), ('drought', 1)]
+        )
+        self.assertEqual(trending.read_trending('7d', 1), [('flood', 2)])
+
+    def test_bucket_expiry(self):
+        trending.push_tags(['flood'])
+
+        for period, (_format, _length, expire) in trending.PERIODS.items():
+            key = trending.get_key(period, trending.get_buckets(period, 1)[0])
+            ttl = self.redis.ttl(key)
+            self.assertTrue(0 < ttl <= expire.total_seconds(), (period, ttl))
+
+    def test_location(self):
+        precision = settings.SNAP_TRENDING_PRECISION
+        trending.push_tags(['near'], cells={geohash_encode(-6.2, 106.8, precision)})
+        trending.push_tags(['far'], cells={geohash_encode(40.7, -74.0, precision)})
+
+        self.assertEqual(
+            trending.read_trending('24h', 10, latitude=-6.2, longitude=106.8),
+            [('near', 1)]
+        )
+        self.assertEqual(
+            sorted(trending.read_trending('24h', 10)),
+            [('far', 1), ('near', 1)]
+        )
+
+    def test_database_fallback(self):
+        Moment = apps.get_registered_model('snap', 'Moment')
+        for title in ('#flood', '#flood #rain'):
+            Moment.objects.create(
+                title=title,
+                visibility=Moment.VisibilityChoice.ANONYMOUS
+            )
+
+        with mock.patch.object(
+            trending,
+            'read_trending',
+            side_effect=RedisConnectionError('down')
+        ):
+            response = self.client.get('/api/snap/v1/tags/', {'window': '24h'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(tag['name'], tag['count']) for tag in response.data['results']],
+            [('flood', 2), ('rain', 1)]
+        )
@@ -0,0 +1,169 @@
+"""
+Comment threads
+
+Every comment hold the materialized path of their thread (see
+`AbstractComment.set_path`), so a thread, a subtree or reply counts
+are one ordered query over the (content_type, object_id, path) index.
+"""
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import (
+    CharField,
+    Count,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery
+)
+from django.db.models.functions import Cast, Coalesce, Substr
+
+from .models.base import COMMENT_PATH_STEP
+
+Comment = apps.get_registered_model('snap', 'Comment')
+Moment = apps.get_registered_model('snap', 'Moment')
+
+
+def get_visible_targets(model, viewer):
+    """
+    Commented objects of `model` the viewer can see. Moment filtered
+    on their visibility index, other objects follow the visibility of
+    their moment, or of their author when not attached to a moment.
+    """
+    visible_q = Moment.get_visible_q(viewer)
+    if model is Moment:
+        return Moment.objects.filter(visible_q)
+
+    queryset = model.objects.all()
+    if not visible_q:
+        # registered viewer see everything
+        return queryset
+
+    field_names = {field.name for field in model._meta.get_fields()}
+    q = Q(user__isnull=True) if 'user' in field_names else Q()
+    if 'content_type' in field_names:
+        moment_ct = ContentType.objects.get_for_model(Moment)
+        moment_ids = Moment.objects \
+            .filter(visible_q) \
+            .annotate(target_id=Cast('id', CharField())) \
+            .values('target_id')
+        q = Q(content_type=moment_ct, object_id__in=moment_ids) \
+            | (~Q(content_type=moment_ct) & q)
+    return queryset.filter(q)
+
+
+def get_visible_q(model, viewer):
+    """Filter of comments on `model` objects the viewer can see"""
+    if viewer is not None and viewer.is_authenticated:
+        return Q()
+
+    target_ids = get_visible_targets(model, viewer) \
+        .annotate(target_id=Cast('id', CharField())) \
+        .values('target_id')
+    return Q(object_id__in=target_ids)
+
+
+def get_thread(content_type, object_id):
+    """Every comment of an object, each reply right after its parent"""
+    return Comment.objects \
+        .filter(content_type=content_type, object_id=str(object_id)) \
+        .order_by('path')
+
+
+def get_subtree(comment, include_self=True):
+    queryset = get_thread(comment.content_type_id, comment.object_id) \
+        .filter(path__startswith=comment.path)
+
+    if not include_self:
+        queryset = queryset.exclude(id=comment.id)
+    return queryset
+
+
+def get_reply_counts(content_type, object_id, depth=0):
+    """
+    Return {path: count} of replies (at any level) under
+    every comment at `depth` of an object.
+    """
+    length = (depth + 1) * COMMENT_PATH_STEP
+    return dict(
+        get_thread(content_type, object_id)
+        .filter(depth__gt=depth)
+        .annotate(ancestor=Substr('path', 1, length))
+        .order_by()
+        .values('ancestor')
+        .annotate(count=Count('id'))
+        .values_list('ancestor', 'count')
+    )
+
+
+def _descendants(outer='path'):
+    return Comment.objects.filter(
+        content_type_id=OuterRef('content_type_id'),
+        object_id=OuterRef('object_id'),
+        path__startswith=OuterRef(outer),
+        depth__gt=OuterRef('depth')
+    )
+
+
+def get_roots(content_type, object_id, replies):
+    """
+    Top level comments of an object, annotated with their
+    `reply_count` and path of their last reply listed
+    (`replies` th reply in thread order).
+    """
+    reply_count = _descendants() \
+        .order_by() \
+        .values('content_type_id') \
+        .annotate(count=Count('id')) \
+        .values('count')
+
+    last_reply_path = _descendants() \
+        .order_by('path') \
+        .values('path')[replies - 1:replies]
+
+    return get_thread(content_type, object_id) \
+        .filter(depth=0) \
+        .annotate(
+            reply_count=Coalesce(
+                Subquery(reply_count, output_field=IntegerField()),
+                0
+            ),
+            last_reply_path=Subquery(last_reply_path)
+        )
+
+
+def get_first_replies(roots):
+    """
+    First replies of every root (annotated by `get_roots`)
+    in one ranged query over the thread index.
+    """
+    roots = [root for root in roots if root.reply_count]
+    if not roots:
+        return []
+
+    q = Q()
+    for root in roots:
+        root_q = Q(path__startswith=root.path, depth__gt=0)
+        if root.last_reply_path:
+            root_q &= Q(path__lte=root.last_reply_path)
+        q |= root_q
+
+    return list(
+        get_thread(roots[0].content_type_id, roots[0].object_id)
+        .filter(q)
+        .select_related('user')
+    )
+
+
+def build_tree(roots, replies):
+    """Set `replies` of every comment, return roots"""
+    nodes = dict()
+    for comment in list(roots) + list(replies):
+        comment.replies = list()
+        nodes[comment.path] = comment
+
+    for comment in replies:
+        parent = nodes.get(comment.path[:-COMMENT_PATH_STEP])
+        comment.parent_guid = parent.guid if parent else None
+        if parent:
+            parent.replies.append(comment)
+    return roots
@@ -0,0 +1,149 @@
+"""
+Trending tags
+
+Every tag added to a moment increment hourly and daily Redis sorted
+sets, globally and for the geohash cells of the moment locations.
+A window read union the buckets it cover (24 hours or 7 days, the
+viewer cell and their neighbours) into a result sorted set kept
+for a short time, so most reads are a single ZREVRANGE.
+"""
+import logging
+
+from datetime import timedelta
+
+from django.apps import apps
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from apps.core.geo import geohash_encode, geohash_neighbours
+from apps.core.utils import get_async_redis_connection, get_redis_connection
+from .conf import settings
+
+TRENDING_KEY = 'snap:trending:{period}:{bucket}'
+TRENDING_CELL_KEY = 'snap:trending:{period}:{bucket}:{cell}'
+RESULT_KEY = 'snap:trending:result:{window}:{cell}'
+
+# bucket format, bucket length and how long bucket kept
+PERIODS = {
+    'hour': ('%Y%m%d%H', timedelta(hours=1), timedelta(days=2)),
+    'day': ('%Y%m%d', timedelta(days=1), timedelta(days=8)),
+}
+
+# window: (period, number of buckets)
+WINDOWS = {
+    '24h': ('hour', 24),
+    '7d': ('day', 7),
+}
+
+
+def get_buckets(period, count, now=None):
+    """Buckets of `period` newest first, current bucket included"""
+    bucket_format, length, _expire = PERIODS[period]
+    now = now or timezone.now()
+    return [(now - length * index).strftime(bucket_format) for index in range(count)]
+
+
+def get_key(period, bucket, cell=None):
+    if cell:
+        return TRENDING_CELL_KEY.format(period=period, bucket=bucket, cell=cell)
+    return TRENDING_KEY.format(period=period, bucket=bucket)
+
+
+def push_tags(names, cells=None, now=None):
+    """Increment `names` in current buckets of every period"""
+    if not names:
+        return
+
+    pipe = get_redis_connection().pipeline(transaction=False)
+    for period, (_format, _length, expire) in PERIODS.items():
+        bucket = get_buckets(period, 1, now=now)[0]
+
+        for cell in [None] + sorted(cells or []):
+            key = get_key(period, bucket, cell)
+            for name in names:
+                pipe.zincrby(key, 1, name)
+            pipe.expire(key, expire)
+    pipe.execute()
+
+
+def push_moment_tags(tagged):
+    """
+    `tagged` is {moment_id: [name, ...]} of just added tags,
+    cells read from the moment locations in one query.
+    """
+    tagged = {moment_id: names for moment_id, names in tagged.items() if names}
+    if not tagged:
+        return
+
+    Moment = apps.get_model('snap', 'Moment')
+    precision = settings.SNAP_TRENDING_PRECISION
+    cells = dict()
+
+    locations = Moment.objects \
+        .filter(id__in=tagged.keys(), locations__geohash__isnull=False) \
+        .values_list('id', 'locations__geohash')
+
+    for moment_id, geohash in locations:
+        cells.setdefault(moment_id, set()).add(geohash[:precision])
+
+    try:
+        for moment_id, names in tagged.items():
+            push_tags(names, cells.get(moment_id))
+    except RedisError as e:
+        logging.warning('Trending tags push failed: %s', e)
+
+
+def _get_trending_keys(window, latitude=None, longitude=None):
+    """(result key, bucket keys) of a window read"""
+    period, count = WINDOWS[window]
+    buckets = get_buckets(period, count)
+
+    if latitude is not None and longitude is not None:
+        precision = settings.SNAP_TRENDING_PRECISION
+        center = geohash_encode(latitude, longitude, precision)
+        cells = sorted(geohash_neighbours(latitude, longitude, precision))
+    else:
+        center = 'all'
+        cells = [None]
+
+    return (
+        RESULT_KEY.format(window=window, cell=center),
+        [get_key(period, bucket, cell) for bucket in buckets for cell in cells]
+    )
+
+
+def read_trending(window, limit, latitude=None, longitude=None):
+    """
+    Return [(name, count), ...] most used first.
+    Raise RedisError so caller can fallback to database.
+    """
+    connection = get_redis_connection()
+    result_key, keys = _get_trending_keys(window, latitude, longitude)
+
+    if not connection.exists(result_key):
+        pipe = connection.pipeline(transaction=False)
+        pipe.zunionstore(result_key, keys)
+        pipe.expire(result_key, settings.SNAP_TRENDING_TIMEOUT)
+        pipe.execute()
+
+    return [
+        (name.decode('utf-8'), int(score)) for name, score in
+        connection.zrevrange(result_key, 0, limit - 1, withscores=True)
+    ]
+
+
+async def aread_trending(window, limit, latitude=None, longitude=None):
+    """`read_trending` with the asyncio client"""
+    connection = get_async_redis_connection()
+    result_key, keys = _get_trending_keys(window, latitude, longitude)
+
+    if not await connection.exists(result_key):
+        pipe = connection.pipeline(transaction=False)
+        pipe.zunionstore(result_key, keys)
+        pipe.expire(result_key, settings.SNAP_TRENDING_TIMEOUT)
+        await pipe.execute()
+
+    return [
+        (name.decode('utf-8'), int(score)) for name, score in
+        await connection.zrevrange(result_key, 0, limit - 1, withscores=True)
+    ]
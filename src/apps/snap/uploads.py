@@ -0,0 +1,155 @@
+"""
+Resumable attachment uploads
+
+Chunk body read from the request stream and appended to a partial
+file at the upload offset, memory stay constant whatever the file
+size. A chunk failed midway (or with wrong checksum) is truncated
+back so the client simply resend it from the same offset.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+
+from .conf import settings
+from .dedup import find_duplicate
+
+READ_SIZE = 64 * 1024
+
+
+def get_temp_dir():
+    path = settings.SNAP_UPLOAD_TEMP_DIR \
+        or settings.FILE_UPLOAD_TEMP_DIR \
+        or tempfile.gettempdir()
+    path = os.path.join(path, 'snap-uploads')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_partial_path(upload):
+    return os.path.join(get_temp_dir(), '{}.part'.format(upload.guid))
+
+
+def delete_partial(upload):
+    try:
+        os.remove(get_partial_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def append_chunk(upload, stream, length, checksum=None):
+    """
+    Write `length` bytes of `stream` at the upload offset,
+    `checksum` is the sha256 hex digest of the chunk.
+    Caller lock the upload row.
+    """
+    if upload.attachment_id:
+        raise ValidationError(_("Upload already completed"))
+
+    if upload.is_direct:
+        raise ValidationError(_("Direct upload, PUT the file to the presigned url"))
+
+    if length <= 0 or length > settings.SNAP_UPLOAD_CHUNK_MAX_SIZE:
+        raise ValidationError(
+            _("Chunk size must be between 1 and {} bytes").format(
+                settings.SNAP_UPLOAD_CHUNK_MAX_SIZE)
+        )
+
+    if upload.offset + length > upload.filesize:
+        raise ValidationError(_("Chunk exceed the upload filesize"))
+
+    path = get_partial_path(upload)
+    digest = hashlib.sha256()
+    written = 0
+
+    with open(path, 'r+b' if os.path.exists(path) else 'w+b') as file:
+        # drop leftover of a previous failed chunk
+        file.seek(upload.offset)
+        file.truncate()
+
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+
+            file.write(data)
+            digest.update(data)
+            written += len(data)
+
+        error = None
+        if written != length:
+            error = _("Chunk incomplete, received {} of {} bytes").format(
+                written, length)
+        elif checksum and checksum.lower() != digest.hexdigest():
+            error = _("Chunk checksum mismatch")
+
+        if error:
+            file.truncate(upload.offset)
+            raise ValidationError(error)
+
+    upload.offset += written
+    upload.save(update_fields=['offset', 'update_at'])
+    return upload
+
+
+def get_file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(READ_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def store_file(attachment, path, filename, digest):
+    """
+    Set file at `path` to the attachment, copied to storage in
+    chunks unless same bytes (`digest`) already stored.
+    """
+    attachment.digest = digest
+    duplicate = find_duplicate(digest, exclude_id=attachment.id)
+    if duplicate:
+        attachment.file = filename
+        attachment.share_file(duplicate)
+    else:
+        with open(path, 'rb') as file:
+            attachment.file.save(filename, File(file), save=False)
+
+
+def complete_upload(upload, checksum=None, **fields):
+    """
+    Turn a fully received upload to attachment, file copied
+    to storage in chunks. `fields` are attachment fields.
+    """
+    if upload.attachment_id:
+        raise ValidationError(_("Upload already completed"))
+
+    if upload.is_direct:
+        from .direct_uploads import complete_direct_upload
+        return complete_direct_upload(upload, checksum=checksum, **fields)
+
+    if not upload.is_complete:
+        raise ValidationError(
+            _("Upload incomplete, received {} of {} bytes").format(
+                upload.offset, upload.filesize)
+        )
+
+    path = get_partial_path(upload)
+    upload.checksum = get_file_checksum(path)
+    if checksum and checksum.lower() != upload.checksum:
+        raise ValidationError(_("File checksum mismatch"))
+
+    Attachment = apps.get_registered_model('snap', 'Attachment')
+    attachment = Attachment(user=upload.user, **fields)
+    store_file(attachment, path, upload.filename, upload.checksum)
+    attachment.save()
+
+    upload.attachment = attachment
+    upload.save(update_fields=['checksum', 'attachment', 'update_at'])
+
+    transaction.on_commit(lambda: delete_partial(upload))
+    return attachment
@@ -6,16 +6,20 @@ from rest_framework import status as response_status
 from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny
-from rest_framework.throttling import AnonRateThrottle
 from rest_framework.response import Response
 
+from apps.core.api.throttling import (
+    AnonRateThrottle,
+    RedisThrottleMixin,
+    ScopedRateThrottle
+)
 from .serializers import (
     PasswordResetSerializer,
     SerializerPasswordResetConfirm
 )
 
 
-class PasswordResetView(APIView):
+class PasswordResetView(RedisThrottleMixin, APIView):
     """
     POST
     ------
@@ -26,7 +30,8 @@ class PasswordResetView(APIView):
         }
     """
     permission_classes = (AllowAny,)
-    throttle_classes = (AnonRateThrottle,)
+    throttle_classes = (AnonRateThrottle, ScopedRateThrottle,)
+    throttle_scope = 'password_reset'
 
     @transaction.atomic
     def post(self, request):
@@ -50,7 +55,7 @@ class PasswordResetView(APIView):
         )
 
 
-class PasswordResetConfirmView(APIView):
+class PasswordResetConfirmView(RedisThrottleMixin, APIView):
     """
     POST
     ------
@@ -66,7 +71,8 @@ class PasswordResetConfirmView(APIView):
         }
     """
     permission_classes = (AllowAny,)
-    throttle_classes = (AnonRateThrottle,)
+    throttle_classes = (AnonRateThrottle, ScopedRateThrottle,)
+    throttle_scope = 'password_reset'
 
     @transaction.atomic
     def post(self, request):
@@ -7,9 +7,7 @@ from django.utils.encoding import smart_str
 
 from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework import viewsets, status as response_status
-from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.parsers import JSONParser, MultiPartParser
@@ -18,6 +16,10 @@ from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from apps.core.api.pagination import KeysetPagination, get_paginator
+from apps.core.api.throttling import AnonRateThrottle, UserRateThrottle
+from apps.core.geo import bounding_box_q, geohash_q
+from apps.user.conf import settings
 from .serializers import (
     CreateUserSerializer,
     ListUserSerializer,
@@ -60,6 +62,15 @@ class UserViewSet(BaseViewSet):
             "msisdn": "08295222622",
             "username": "admino"
         }
+
+
+    GET
+    -----
+        {
+            "latitude": "<float>",
+            "longitude": "<float>",
+            "radius": "in km <integer>"
+        }
     """
     lookup_field = 'hexid'
     throttle_classes = (AnonRateThrottle, UserRateThrottle,)
@@ -127,9 +138,32 @@ class UserViewSet(BaseViewSet):
             return Response(serializer.data, status=response_status.HTTP_200_OK)
         return Response(serializer.errors, status=response_status.HTTP_406_NOT_ACCEPTABLE)
 
+    def _querying_nearby(self, queryset):
+        latitude = self.request.query_params.get('latitude')
+        longitude = self.request.query_params.get('longitude')
+        radius = self.request.query_params.get('radius')
+
+        if latitude and longitude:
+            try:
+                latitude = float(latitude)
+                longitude = float(longitude)
+                radius = float(radius or settings.USER_NEARBY_RADIUS)
+            except ValueError as e:
+                raise ValidationError(detail=smart_str(e))
+
+            # prefix scans over profile geohash cells
+            queryset = queryset.filter(
+                geohash_q(latitude, longitude, radius,
+                          field='profile__geohash'),
+                bounding_box_q(latitude, longitude, radius,
+                               latitude_field='profile__latitude',
+                               longitude_field='profile__longitude')
+            )
+        return queryset
+
     def list(self, request):
-        queryset = self.queryset()
-        paginator = LimitOffsetPagination()
+        queryset = self._querying_nearby(self.queryset())
+        paginator = get_paginator(request, ordering=('-date_joined', '-id'))
         paginate_queryset = paginator.paginate_queryset(queryset, request)
 
         serializer = ListUserSerializer(
@@ -138,6 +172,8 @@ class UserViewSet(BaseViewSet):
             many=True
         )
 
+        if isinstance(paginator, KeysetPagination):
+            return paginator.get_paginated_response(serializer.data)
         return paginator.get_paginated_response(reversed(serializer.data))
 
     def retrieve(self, request, hexid=None):
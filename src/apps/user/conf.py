@@ -11,5 +11,8 @@ class UserAppConf(AppConf):
     # such as via OTP or not
     VERIFICATION_REQUIRED = False
 
+    # radius (km) of users nearby listing
+    NEARBY_RADIUS = 10
+
     class Meta:
         perefix = 'user'
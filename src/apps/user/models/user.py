@@ -14,6 +14,7 @@ from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError, FieldError
 
+from apps.core.geo import geohash_encode
 from apps.core.models.common import AbstractCommonField
 
 from ..conf import settings
@@ -271,6 +272,13 @@ class AbstractProfile(AbstractCommonField):
     address = models.TextField(blank=True, null=True)
     latitude = models.FloatField(default=Decimal(0.0), db_index=True)
     longitude = models.FloatField(default=Decimal(0.0), db_index=True)
+    geohash = models.CharField(
+        max_length=12,
+        editable=False,
+        null=True,
+        blank=True,
+        db_index=True
+    )
 
     class Meta:
         abstract = True
@@ -288,6 +296,10 @@ class AbstractProfile(AbstractCommonField):
         )
         return full_name if self.user.first_name else self.user.username
 
+    def save(self, *args, **kwargs):
+        self.geohash = geohash_encode(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
+
 
 # Add custom field to group
 Group.add_to_class('is_default', models.BooleanField(default=False))
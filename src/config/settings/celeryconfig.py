@@ -4,3 +4,10 @@ broker_url = settings.REDIS_URL
 broker_transport_options = {'visibility_timeout': 3600}
 result_backend = settings.REDIS_URL
 task_serializer = 'json'
+
+beat_schedule = {
+    'snap-collect-orphans': {
+        'task': 'apps.snap.tasks.collect_orphans',
+        'schedule': 60 * 60,
+    },
+}
@@ -31,6 +31,21 @@ AUTH_USER_MODEL = 'user.User'
 # Redis
 REDIS_URL = 'redis://' + HOST + ':6379/0'
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# `snap` shared by every web and celery worker (response cache
+# generations, fragments, counters), `default` stay per process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'snap': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'cache',
+    },
+}
+
 # Django Debug Toolbar
 # https://django-debug-toolbar.readthedocs.io/en/stable/installation.html
 
@@ -71,12 +86,18 @@ if DEBUG:
 # https://www.django-rest-framework.org/
 REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'apps.core.api.throttling.AnonRateThrottle',
+        'apps.core.api.throttling.UserRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '10/minute',
-        'user': '100/minute'
+        'user': '100/minute',
+        # writes per endpoint, `throttle_scope` of the view
+        'moment': '30/minute',
+        'comment': '60/minute',
+        'attachment': '60/minute',
+        'verification': '5/minute',
+        'password_reset': '5/minute'
     },
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',